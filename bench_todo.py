@@ -0,0 +1,600 @@
+"""
+  File: bench_todo.py
+  Description: Benchmarks for todo.py
+               Compares loading the todo file line by line with the bulk loader,
+               the memory used by the different ways of storing tasks, and full
+               saves with saves that only format changed tasks. The suite times
+               every hot path and fails when one got slower than a stored baseline.
+               The server benchmark load tests `todo.py serve` on localhost,
+               and the undo benchmark measures the cost of the undo history
+
+  Student Name: Arun Mahadevan Sathia Narayanan
+  Student UT EID: as235872
+
+  Course Name: CS 313E
+  Unique Number: 50184
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+import todo
+
+STATUSES = ["To Do", "In Progress", "Done", "Blocked"]
+# Most tasks are middling and open, few are urgent or blocked
+STATUS_WEIGHTS = [45, 20, 30, 5]
+PRIORITY_WEIGHTS = [10, 25, 35, 20, 10]
+BASELINE_FILE = "bench_baseline.json"
+UNDO_CHANGES = 1000
+
+def random_due_date(rng, today):
+    """Picks a due date: some overdue, most in the coming month, some later, some none"""
+    roll = rng.random()
+    if roll < 0.25:
+        return ""
+    if roll < 0.40:
+        days = rng.randint(-60, -1)
+    elif roll < 0.85:
+        days = int(rng.triangular(0, 30, 0))
+    else:
+        days = rng.randint(31, 365)
+    return (today + timedelta(days=days)).strftime("%Y-%m-%d")
+
+def generate_file(path, count, seed=313):
+    """Writes a todo file with count random tasks"""
+    rng = random.Random(seed)
+    today = date.today()
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(todo.HEADER)
+        for i in range(count):
+            priority = rng.choices(range(1, 6), PRIORITY_WEIGHTS)[0]
+            status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+            file.write(f"Task {i}, Description of task {i}, {priority}, "
+                       f"{status}, {random_due_date(rng, today)}\n")
+
+def legacy_load(path):
+    """Loads the file the way load_tasks() used to: Task() and heap_push() per line"""
+    tasks = todo.LinkedList()
+    priority_queue = todo.PriorityQueue()
+    with open(path, "r", encoding="utf-8") as file:
+        next(file)
+        for line in file:
+            parts = line.rstrip("\n").split(", ")
+            if len(parts) == 5:
+                title, description, priority, status, due_date_str = parts
+                task = todo.Task(title, description, int(priority),
+                                 due_date_str if due_date_str else None,
+                                 allow_past_dates=True)
+                task.status = status
+                tasks.insert(task)
+                todo.heap_push(priority_queue, task)
+    return tasks
+
+def bulk_load(path):
+    """Loads the file with load_tasks()"""
+    todo.TODO_FILE = path
+    todo.tasks = todo.LinkedList()
+    todo.priority_queue = todo.PriorityQueue()
+    todo.load_tasks()
+    return todo.tasks
+
+class LegacyTask:
+    """Task as it used to be stored: a regular object with a __dict__"""
+    def __init__(self, title, description, priority, status, due_date):
+        self.title = title
+        self.description = description
+        self.status = status
+        self.priority = priority
+        self.due_date = due_date
+
+class LegacyNode:
+    """Node as it used to be stored: a regular object with a __dict__"""
+    def __init__(self, task):
+        self.task = task
+        self.next = None
+
+def legacy_objects(path):
+    """Builds the old node chain of dict-based tasks with a fresh status and date per row"""
+    head = None
+    with open(path, "r", encoding="utf-8") as file:
+        next(file)
+        for line in file:
+            title, description, priority, status, due_date_str = line.rstrip("\n").split(", ")
+            due_date = date.fromisoformat(due_date_str) if due_date_str else None
+            node = LegacyNode(LegacyTask(title, description, int(priority), status, due_date))
+            node.next = head
+            head = node
+    return head
+
+def slotted_objects(path):
+    """Builds the same node chain out of the slotted Task and Node of todo.py"""
+    head = None
+    with open(path, "r", encoding="utf-8") as file:
+        next(file)
+        for line in file:
+            node = todo.Node(todo._parse_task_line(line))
+            node.next = head
+            head = node
+    return head
+
+def task_table(path):
+    """Builds a column-oriented TaskTable"""
+    with open(path, "r", encoding="utf-8") as file:
+        next(file)
+        return todo.TaskTable(task for task in map(todo._parse_task_line, file) if task)
+
+def memory_used(func, path):
+    """Returns the memory held by what func builds, and the peak while building it"""
+    todo.clear_tasks()
+    tracemalloc.start()
+    result = func(path)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    todo.clear_tasks()
+    return current, peak
+
+def run_memory(sizes, temp_dir):
+    """Prints the memory used by each way of storing tasks"""
+    # load_tasks() also builds the priority queue and the indexes
+    print(f"{'Tasks':>10} {'Storage':<16} {'Held (MB)':>10} {'Peak (MB)':>10} {'Bytes/task':>11}")
+    for size in sizes:
+        path = os.path.join(temp_dir, f"todo_{size}.txt")
+        generate_file(path, size)
+        for name, func in [("dict objects", legacy_objects), ("slotted objects", slotted_objects),
+                           ("TaskTable", task_table), ("load_tasks()", bulk_load)]:
+            current, peak = memory_used(func, path)
+            print(f"{size:>10} {name:<16} {current / 2**20:>10.1f} {peak / 2**20:>10.1f} "
+                  f"{current / size:>11.0f}")
+
+def best_time(func, path, repeat):
+    """Runs func repeat times and returns the fastest run in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_load(sizes, repeat, temp_dir):
+    """Prints the time taken by the old and the bulk loader"""
+    print(f"{'Tasks':>10} {'Per line (s)':>14} {'Bulk (s)':>10} {'Speedup':>8}")
+    for size in sizes:
+        path = os.path.join(temp_dir, f"todo_{size}.txt")
+        generate_file(path, size)
+        before = best_time(legacy_load, path, repeat)
+        after = best_time(bulk_load, path, repeat)
+        print(f"{size:>10} {before:>14.3f} {after:>10.3f} {before / after:>7.1f}x")
+
+def run_save(sizes, repeat, temp_dir):
+    """Prints the time taken to save after editing one task, formatting every task or not"""
+    print(f"{'Tasks':>10} {'Format all (s)':>15} {'Changed only (s)':>17} {'Speedup':>8}")
+    for size in sizes:
+        path = os.path.join(temp_dir, f"todo_{size}.txt")
+        generate_file(path, size)
+        bulk_load(path)
+        todo.save_tasks()  # Rows are only copied from files that have the task ids
+        task = todo.tasks.get(size // 2)
+
+        def full_save(_, task=task):
+            todo.edit_task(task, status="Done")
+            # Same version as the saved file, so the next save does not see another writer
+            todo._write_file(todo.TODO_FILE, todo._encode_text(
+                todo.tasks, todo._loaded_version, todo._next_task_id))
+
+        def changed_save(_, task=task):
+            todo.edit_task(task, status="To Do")
+            todo.save_tasks()
+
+        before = best_time(full_save, path, repeat)
+        after = best_time(changed_save, path, repeat)
+        print(f"{size:>10} {before:>15.3f} {after:>17.3f} {before / after:>7.1f}x")
+        todo.clear_tasks()
+
+def make_changes(path, size):
+    """
+    Loads the file with the undo history on and makes UNDO_CHANGES random deletes
+    and priority changes
+    """
+    todo.clear_tasks()
+    bulk_load(path)
+    todo._materialize_tasks()
+    history = todo.enable_history()
+    rng = random.Random(size)
+    for change in range(UNDO_CHANGES):
+        index = rng.randrange(len(todo.tasks))
+        if change % 2:
+            todo.remove_task(index)
+        else:
+            todo.edit_task(todo.get_task(index), priority=rng.randint(1, 5))
+    return history
+
+def history_memory(path, size):
+    """Returns the memory freed by dropping the history, deleted tasks it kept included"""
+    tracemalloc.start()
+    make_changes(path, size)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0]
+    todo.history = None
+    gc.collect()
+    freed = held - tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return freed
+
+def run_undo(sizes, temp_dir):
+    """Prints the memory each change adds to the undo history and the time to undo them all"""
+    print(f"{'Tasks':>10} {'Bytes/change':>13} {'Undo all (s)':>13} {'Redo all (s)':>13} "
+          f"{'Copy list (s)':>14}")
+    for size in sizes:
+        path = os.path.join(temp_dir, f"todo_{size}.txt")
+        generate_file(path, size)
+        freed = history_memory(path, size)
+        history = make_changes(path, size)
+        start = time.perf_counter()
+        while history.undo():
+            pass
+        undo_time = time.perf_counter() - start
+        start = time.perf_counter()
+        while history.redo():
+            pass
+        redo_time = time.perf_counter() - start
+        # What every change would cost if the history copied the list
+        copy_time = best_time(lambda _: list(todo.tasks), path, 3)
+        print(f"{size:>10} {freed / UNDO_CHANGES:>13.0f} {undo_time:>13.3f} "
+              f"{redo_time:>13.3f} {copy_time:>14.3f}")
+        todo.clear_tasks()
+
+def suite_tasks(path):
+    """Parses the tasks of a generated file without storing them"""
+    with open(path, "r", encoding="utf-8") as file:
+        next(file)
+        return [task for task in map(todo._parse_task_line, file) if task]
+
+def loaded_list(path):
+    """Loads the file and saves it once, so every task has an id and a row"""
+    bulk_load(path)
+    todo.save_tasks()
+
+def print_quietly(func, *args):
+    """Returns a runner that prints into os.devnull instead of the terminal"""
+    def run():
+        with open(os.devnull, "w", encoding="utf-8") as devnull:
+            old_stdout, sys.stdout = sys.stdout, devnull
+            try:
+                func(*args)
+            finally:
+                sys.stdout = old_stdout
+    return run
+
+# Each case takes the file and its parsed tasks and prepares a fresh state, which is
+# not timed, then returns the runner to time and the number of operations it does
+def case_list_insert(_, task_list):
+    """Appends every task to an empty LinkedList"""
+    linked = todo.LinkedList()
+    return lambda: [linked.insert(task) for task in task_list], len(task_list)
+
+def case_list_get(_, task_list):
+    """Reads random positions of a full LinkedList"""
+    linked = todo.LinkedList()
+    linked.extend(task_list)
+    rng = random.Random(1)
+    positions = [rng.randrange(len(task_list)) for _ in range(min(len(task_list), 10_000))]
+    return lambda: [linked.get(i) for i in positions], len(positions)
+
+def case_list_remove(_, task_list):
+    """Removes random positions of a full LinkedList"""
+    linked = todo.LinkedList()
+    linked.extend(task_list)
+    rng = random.Random(2)
+    count = min(len(task_list), 10_000)
+    positions = [rng.randrange(len(task_list) - i) for i in range(count)]
+    return lambda: [linked.remove(i) for i in positions], count
+
+def case_heap_push(_, task_list):
+    """Pushes every task onto an empty heap"""
+    heap = todo.PriorityQueue()
+    return lambda: [todo.heap_push(heap, task) for task in task_list], len(task_list)
+
+def case_heap_pop(_, task_list):
+    """Pops the most urgent tasks off a full heap"""
+    heap = todo.PriorityQueue(task_list)
+    count = min(len(task_list), 10_000)
+    return lambda: [todo.heap_pop(heap) for _ in range(count)], count
+
+def case_load(path, task_list):
+    """Loads the file with load_tasks()"""
+    todo.clear_tasks()
+    return lambda: bulk_load(path), len(task_list)
+
+def case_full_save(path, task_list):
+    """Saves after forgetting the saved file, so every task is formatted"""
+    loaded_list(path)
+    todo._forget_saved_text()
+    return todo.save_tasks, len(task_list)
+
+def case_edit_save(path, _):
+    """Saves after editing one task, so only that row is formatted"""
+    loaded_list(path)
+    todo.edit_task(todo.tasks.get(len(todo.tasks) // 2), status="Done")
+    return todo.save_tasks, 1
+
+def case_time_frame(path, task_list):
+    """Filters every task by the coming week"""
+    bulk_load(path)
+    return lambda: todo.get_time_frame_tasks(todo.tasks, "week"), len(task_list)
+
+def view_case(func, *args):
+    """Builds a case that prints one view of the whole list"""
+    def case(path, task_list):
+        bulk_load(path)
+        return print_quietly(func, *args), len(task_list)
+    case.__doc__ = f"Prints {func.__name__}{args or ''}"
+    return case
+
+SUITE_CASES = {
+    "LinkedList.insert": case_list_insert,
+    "LinkedList.get": case_list_get,
+    "LinkedList.remove": case_list_remove,
+    "heap_push": case_heap_push,
+    "heap_pop": case_heap_pop,
+    "load_tasks": case_load,
+    "save_tasks (full)": case_full_save,
+    "save_tasks (one edit)": case_edit_save,
+    "get_time_frame_tasks": case_time_frame,
+    "print_by_index": view_case(todo.print_by_index),
+    "print_by_priority": view_case(todo.print_by_priority),
+    "print_by_status": view_case(todo.print_by_status, "To Do"),
+    "print_by_due_date": view_case(todo.print_by_due_date),
+    "print_time_frame": view_case(todo.print_time_frame, "all"),
+}
+
+def measure(case, path, task_list, warmup, repeat):
+    """Times a case after warmup runs, then traces the peak memory of one more run"""
+    times = []
+    for run_number in range(warmup + repeat):
+        run, ops = case(path, task_list)
+        # Like timeit, keep the garbage of earlier runs out of the timing
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        gc.enable()
+        if run_number >= warmup:
+            times.append(elapsed)
+    # tracemalloc slows every allocation down, so it gets a run of its own
+    run, ops = case(path, task_list)
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    todo.clear_tasks()
+    # The fastest run is the least disturbed by the rest of the machine, as timeit says
+    best = min(times)
+    return {"ops": ops, "median_s": statistics.median(times), "best_s": best,
+            "ops_per_sec": ops / best if best else float("inf"),
+            "peak_mb": peak / 2**20}
+
+def run_suite(sizes, warmup, repeat, temp_dir):
+    """Times every case at every size and returns the results keyed by case@size"""
+    results = {}
+    print(f"{'Case':<24} {'Tasks':>9} {'Ops/sec':>14} {'Best (s)':>11} {'Peak (MB)':>10}")
+    for size in sizes:
+        path = os.path.join(temp_dir, f"todo_{size}.txt")
+        generate_file(path, size)
+        task_list = suite_tasks(path)
+        for name, case in SUITE_CASES.items():
+            result = measure(case, path, task_list, warmup, repeat)
+            results[f"{name}@{size}"] = result
+            print(f"{name:<24} {size:>9} {result['ops_per_sec']:>14,.0f} "
+                  f"{result['best_s']:>11.4f} {result['peak_mb']:>10.1f}")
+    return results
+
+def compare_results(results, baseline, threshold):
+    """Lists the cases that are slower or use more memory than the baseline allows"""
+    regressions = []
+    for key, result in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if result["ops_per_sec"] < before["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{key}: {result['ops_per_sec']:,.0f} ops/sec, "
+                               f"baseline {before['ops_per_sec']:,.0f}")
+        # Small peaks are mostly noise, so memory only counts past a megabyte
+        if result["peak_mb"] > max(before["peak_mb"] * (1 + threshold), before["peak_mb"] + 1):
+            regressions.append(f"{key}: peak {result['peak_mb']:.1f} MB, "
+                               f"baseline {before['peak_mb']:.1f} MB")
+    return regressions
+
+def suite_report(results, sizes, warmup, repeat):
+    """Wraps suite results with what they were measured on"""
+    return {"python": platform.python_version(), "machine": platform.machine(),
+            "sizes": sizes, "warmup": warmup, "repeat": repeat, "results": results}
+
+async def http_request(reader, writer, method, path, body=None, headers=None):
+    """Sends one request on a kept-alive connection, returns the status, ETag and body"""
+    data = b"" if body is None else json.dumps(body).encode("utf-8")
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(data)}"]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length, etag = 0, None
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+        elif name.lower() == "etag":
+            etag = value.strip()
+    return status, etag, await reader.readexactly(length) if length else b""
+
+def server_scenarios(size, etag):
+    """Returns the requests to time: name, expected status and a function of the request number"""
+    return [
+        ("GET /tasks?limit=20", 200, lambda i: ("GET", "/tasks?limit=20", None, None)),
+        ("GET /tasks?view=priority&limit=20", 200,
+         lambda i: ("GET", "/tasks?view=priority&limit=20", None, None)),
+        ("GET /tasks?time_frame=week&limit=20", 200,
+         lambda i: ("GET", "/tasks?time_frame=week&limit=20", None, None)),
+        ("GET /tasks/ID", 200, lambda i: ("GET", f"/tasks/{i * 7919 % size + 1}", None, None)),
+        ("GET /tasks, If-None-Match (304)", 304,
+         lambda i: ("GET", "/tasks?limit=20", None, {"If-None-Match": etag})),
+        ("PATCH /tasks/ID", 200, lambda i: ("PATCH", f"/tasks/{i * 7919 % size + 1}",
+                                            {"status": STATUSES[i % 4]}, None)),
+        ("POST /tasks", 201, lambda i: ("POST", "/tasks", {"title": f"Load {i}",
+                                                           "priority": i % 5 + 1}, None)),
+    ]
+
+async def load_test(host, port, make_request, expected, requests, clients):
+    """Sends requests over clients connections at once, returns seconds, latencies and errors"""
+    latencies = []
+    errors = 0
+
+    async def client(numbers):
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        for i in numbers:
+            method, path, body, headers = make_request(i)
+            start = time.perf_counter()
+            status, _, _ = await http_request(reader, writer, method, path, body, headers)
+            latencies.append(time.perf_counter() - start)
+            errors += status != expected
+        writer.close()
+        await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(range(c, requests, clients)) for c in range(clients)))
+    return time.perf_counter() - start, sorted(latencies), errors
+
+async def run_scenarios(url, size, requests, clients):
+    """Prints requests per second and latencies of each scenario against a server"""
+    parts = urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+    _, etag, _ = await http_request(reader, writer, "GET", "/tasks?limit=20")
+    writer.close()
+    for name, expected, make_request in server_scenarios(size, etag):
+        if expected == 304:
+            # Changes move the ETag on, so the cached copy is fetched right before
+            reader, writer = await asyncio.open_connection(parts.hostname, parts.port)
+            _, etag, _ = await http_request(reader, writer, "GET", "/tasks?limit=20")
+            writer.close()
+            make_request = (lambda tag: lambda i: ("GET", "/tasks?limit=20", None,
+                                                   {"If-None-Match": tag}))(etag)
+        elapsed, latencies, errors = await load_test(parts.hostname, parts.port, make_request,
+                                                     expected, requests, clients)
+        print(f"{size:>9} {name:<38} {requests / elapsed:>10,.0f} "
+              f"{latencies[len(latencies) // 2] * 1000:>9.2f} "
+              f"{latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000:>9.2f} "
+              f"{errors:>7}")
+
+def start_server(temp_dir):
+    """Starts `todo.py serve` on a free port in temp_dir, returns the process and its URL"""
+    process = subprocess.Popen([sys.executable, os.path.abspath(todo.__file__), "serve",
+                                "--port", "0"], cwd=temp_dir, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()  # "Serving N tasks on http://127.0.0.1:PORT"
+    if not line:
+        raise RuntimeError("The server did not start")
+    return process, line.split()[-1]
+
+def run_server(sizes, requests, clients, url, temp_dir):
+    """Load tests a server: the one at url, or one started for each size"""
+    print(f"{'Tasks':>9} {'Request':<38} {'Req/sec':>10} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'Errors':>7}")
+    if url:
+        asyncio.run(run_scenarios(url, sizes[0], requests, clients))
+        return
+    for size in sizes:
+        path = os.path.join(temp_dir, todo.TODO_FILE)
+        generate_file(path, size)
+        process, server_url = start_server(temp_dir)
+        try:
+            asyncio.run(run_scenarios(server_url, size, requests, clients))
+        finally:
+            process.terminate()
+            process.wait()
+
+def main():
+    """Main method"""
+    parser = argparse.ArgumentParser(description="Benchmark loading the todo file")
+    parser.add_argument("benchmark", nargs="?", choices=["load", "memory", "save", "suite",
+                                                            "server", "undo"],
+                        default="load")
+    parser.add_argument("--sizes", type=int, nargs="+")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--output", help="write the suite results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_FILE,
+                        help="JSON results the suite is compared with")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="fraction a case may be slower than its baseline")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the suite results as the new baseline")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="requests per server scenario")
+    parser.add_argument("--clients", type=int, default=16,
+                        help="connections sending server requests at once")
+    parser.add_argument("--url", help="load test the server running at this URL, with "
+                                      "ids up to the first of --sizes, instead of starting one")
+    args = parser.parse_args()
+    if args.sizes is None:
+        # The suite runs every case at every size, so its default sizes are smaller
+        args.sizes = {"suite": [1_000, 10_000, 100_000], "server": [10_000, 100_000]}.get(
+            args.benchmark, [10_000, 100_000, 1_000_000])
+    baseline_path = os.path.abspath(args.baseline)
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    old_dir = os.getcwd()
+    results = None  # Only the suite has results to report and compare
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)  # Keep journal files of the loader away from the real list
+        if args.benchmark == "memory":
+            run_memory(args.sizes, temp_dir)
+        elif args.benchmark == "save":
+            run_save(args.sizes, args.repeat, temp_dir)
+        elif args.benchmark == "suite":
+            results = run_suite(args.sizes, args.warmup, args.repeat, temp_dir)
+        elif args.benchmark == "server":
+            run_server(args.sizes, args.requests, args.clients, args.url, temp_dir)
+        elif args.benchmark == "undo":
+            run_undo(args.sizes, temp_dir)
+        else:
+            run_load(args.sizes, args.repeat, temp_dir)
+        os.chdir(old_dir)
+    if args.benchmark != "suite":
+        return
+
+    report = suite_report(results, args.sizes, args.warmup, args.repeat)
+    for path in [output_path, baseline_path if args.save_baseline else None]:
+        if path:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(report, file, indent=2)
+                file.write("\n")
+    if args.save_baseline or not os.path.exists(baseline_path):
+        return
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = json.load(file)["results"]
+    regressions = compare_results(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"No case regressed more than {args.threshold:.0%} against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -10,11 +10,23 @@
   Unique Number: 50184
 """
 
+import asyncio
+import io
+import json
 import unittest
+from unittest import mock
 from datetime import date, timedelta
 import os
+import pstats
+import subprocess
+import sys
+import threading
+import tempfile
+import todo
 from todo import Task, LinkedList, heap_push, heap_pop
-from todo import get_time_frame_tasks, initialize_todo_file
+from todo import PriorityQueue, heap_remove, heap_update, heapify
+from todo import get_time_frame_tasks, initialize_todo_file, DueDateIndex, TIME_FRAMES
+from todo import StatusIndex, iter_by_priority, top_k, urgency, TaskTable, TextIndex
 
 class TestTodoList(unittest.TestCase):
     """TestTodoList"""
@@ -66,6 +78,23 @@ class TestTodoList(unittest.TestCase):
         with self.assertRaises(ValueError):
             Task("Invalid Date", "Description", 1, "invalid-date")
 
+    def test_compact_tasks(self):
+        """Test the slotted Task and the column-oriented TaskTable"""
+        first = Task.from_trusted("A", "Description", 2, "In " + "Progress", self.tomorrow)
+        second = Task.from_trusted("B", "Description", 3, "In Progress", None)
+        self.assertFalse(hasattr(first, "__dict__"))
+        self.assertIs(first.status, second.status)
+        self.assertIs(first.due_date, Task("C", "Description", 1, self.tomorrow).due_date)
+
+        first.id = 7
+        table = TaskTable([first, second])
+        self.assertEqual(len(table), 2)
+        self.assertEqual(table.statuses, ["In Progress"])
+        rows = [(task.title, task.priority, task.status, task.due_date, task.id)
+                for task in table]
+        self.assertEqual(rows, [("A", 2, "In Progress", self.tomorrow, 7),
+                                ("B", 3, "In Progress", None, None)])
+
     def test_linked_list_operations(self):
         """Test LinkedList operations"""
         # Test insert
@@ -86,6 +115,32 @@ class TestTodoList(unittest.TestCase):
         self.assertEqual(self.tasks.get(0).title, "Task 2")
         self.assertIsNone(self.tasks.get(5))  # Invalid index
 
+    def test_linked_list_large(self):
+        """Test LinkedList indexing across many blocks against a plain list"""
+        expected = []
+        for i in range(1000):
+            task = Task(f"Task {i}", "Description", 1)
+            self.tasks.insert(task)
+            expected.append(task)
+
+        # Remove from the front, the middle, block edges and the tail
+        for index in [0, 500, 255, 256, 300]:
+            self.assertIs(self.tasks.remove(index), expected.pop(index))
+        self.assertIs(self.tasks.remove(len(expected) - 1), expected.pop())
+
+        self.assertEqual(len(self.tasks), len(expected))
+        for index in [0, 1, 254, 255, 256, 511, len(expected) - 1]:
+            self.assertIs(self.tasks.get(index), expected[index])
+        self.assertEqual(list(self.tasks), expected)
+        self.assertIsNone(self.tasks.get(len(expected)))
+        self.assertIsNone(self.tasks.get(-1))
+
+        # Appending after removing the tail keeps the chain intact
+        task = Task("Last", "Description", 1)
+        self.tasks.insert(task)
+        self.assertIs(self.tasks.get(len(expected)), task)
+        self.assertIs(list(self.tasks)[-1], task)
+
     def test_priority_queue(self):
         """Test priority queue operations"""
         # Create tasks with different priorities
@@ -103,6 +158,93 @@ class TestTodoList(unittest.TestCase):
         self.assertEqual(heap_pop(self.priority_queue).priority, 2)
         self.assertEqual(heap_pop(self.priority_queue).priority, 3)
 
+    def test_indexed_priority_queue(self):
+        """Test removing and re-prioritizing specific tasks in the heap"""
+        queue = PriorityQueue()
+        same_a = Task("Same A", "Description", 2)
+        same_b = Task("Same B", "Description", 2)
+        others = [Task(f"Task {p}", "Description", p) for p in [5, 1, 4, 3, 6, 2]]
+        for task in [same_a, same_b] + others:
+            heap_push(queue, task)
+
+        # Removing a task removes that task, not another one with equal priority
+        heap_remove(queue, same_b)
+        self.assertNotIn(same_b, queue)
+        self.assertIn(same_a, queue)
+        with self.assertRaises(ValueError):
+            heap_remove(queue, same_b)
+
+        heap_update(queue, same_a, 7)
+        heap_update(queue, others[4], 1)
+        self.assertEqual(same_a.priority, 7)
+
+        # The heap property and the position map stay consistent
+        for index, task in enumerate(queue):
+            self.assertEqual(queue.positions[id(task)], index)
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(queue):
+                    self.assertLessEqual(task.priority, queue[child].priority)
+
+        popped = [heap_pop(queue).priority for _ in range(len(queue))]
+        self.assertEqual(popped, sorted(popped))
+        self.assertEqual(popped[-1], 7)
+        self.assertEqual(queue.positions, {})
+
+    def test_iter_by_priority(self):
+        """Test the lazy priority order against a full sort"""
+        queue = PriorityQueue()
+        task_list = []
+        for i in range(200):
+            due_date = self.today + timedelta(days=i % 7) if i % 3 else None
+            task = Task(f"Task {i}", "Description", i % 5 + 1, due_date)
+            task.id = i
+            task_list.append(task)
+            heap_push(queue, task)
+
+        expected = sorted(task_list, key=lambda task: (task.priority, task.due_date or date.max,
+                                                       task.id))
+        self.assertEqual([task.id for task in iter_by_priority(queue)],
+                         [task.id for task in expected])
+        for limit in [1, 5, 17, 40, 199]:
+            self.assertEqual([task.id for task in iter_by_priority(queue, limit)],
+                             [task.id for task in expected[:limit]])
+        self.assertEqual(len(queue), 200)  # The heap is left as it was
+        self.assertEqual(list(iter_by_priority(PriorityQueue())), [])
+
+    def test_top_k(self):
+        """Test the top k tasks by priority and by urgency"""
+        queue = PriorityQueue()
+        soon = Task("Soon", "Description", 3, self.tomorrow)
+        later = Task("Later", "Description", 2, self.today + timedelta(days=20))
+        urgent = Task("Urgent", "Description", 1)
+        overdue = Task("Overdue", "Description", 4, self.last_week, allow_past_dates=True)
+        for task in [soon, later, urgent, overdue]:
+            heap_push(queue, task)
+
+        self.assertEqual([task.title for task in top_k(2, heap=queue)], ["Urgent", "Later"])
+        self.assertEqual(urgency(soon), 4)
+        self.assertEqual([task.title for task in top_k(3, key=urgency, heap=queue)],
+                         ["Overdue", "Soon", "Later"])
+        self.assertEqual(len(top_k(10, key=urgency, heap=queue)), 4)
+        self.assertEqual(len(queue), 4)
+
+    def test_bulk_building(self):
+        """Test heapify and LinkedList.extend against one-at-a-time building"""
+        new_tasks = [Task(f"Task {i}", "Description", (i * 7) % 11 + 1) for i in range(600)]
+        self.tasks.insert(Task("First", "Description", 1))
+        self.tasks.extend(new_tasks)
+        self.assertEqual(len(self.tasks), 601)
+        self.assertIs(self.tasks.get(600), new_tasks[-1])
+        self.assertEqual(list(self.tasks)[1:], new_tasks)
+
+        queue = PriorityQueue()
+        queue.extend(new_tasks)
+        heapify(queue)
+        for index, task in enumerate(queue):
+            self.assertEqual(queue.positions[id(task)], index)
+        popped = [heap_pop(queue).priority for _ in range(len(new_tasks))]
+        self.assertEqual(popped, sorted(task.priority for task in new_tasks))
+
     def test_time_frame_filtering(self):
         """Test time frame filtering functionality"""
         # Create tasks with different due dates
@@ -133,6 +275,118 @@ class TestTodoList(unittest.TestCase):
         self.assertEqual(len(overdue_tasks), 1)
         self.assertEqual(overdue_tasks[0].title, "Overdue Task")
 
+    def test_due_date_index(self):
+        """Test that the due date index answers time frames like a full scan"""
+        task_list = []
+        for offset in range(-10, 40, 3):
+            for status in ["To Do", "done"]:
+                task = Task(f"Task {offset}", "Description", 1,
+                            self.today + timedelta(days=offset), allow_past_dates=True)
+                task.status = status
+                task_list.append(task)
+        task_list.append(Task("No due date", "Description", 1))
+
+        index = DueDateIndex()
+        index.extend(task_list[:10])
+        for task in task_list[10:]:
+            index.add(task)
+        self.assertEqual(len(index), len(task_list) - 1)
+
+        def identities(found):
+            return sorted(id(task) for task in found)
+
+        groups = index.all_time_frames()
+        for time_frame in TIME_FRAMES:
+            expected = get_time_frame_tasks(task_list, time_frame)
+            found = index.time_frame(time_frame)
+            self.assertEqual([identities(part) for part in found],
+                             [identities(part) for part in expected])
+            self.assertEqual(identities(groups[time_frame]), identities(sum(expected, [])))
+
+        # Tasks come out by due date, and removed tasks are gone
+        due_dates = [task.due_date for task in index]
+        self.assertEqual(due_dates, sorted(due_dates))
+        index.discard(task_list[0])
+        self.assertFalse(any(task is task_list[0] for task in index))
+
+    def test_status_index(self):
+        """Test case-insensitive status lookups and the overdue query using them"""
+        statuses = StatusIndex()
+        due_dates = DueDateIndex(statuses)
+        task_list = [Task(f"Task {i}", "Description", 1, self.last_week, allow_past_dates=True)
+                     for i in range(4)]
+        for task, status in zip(task_list, ["Done", "done", "In Progress", "To Do"]):
+            task.status = status
+            statuses.add(task)
+            due_dates.add(task)
+
+        self.assertEqual(statuses.statuses(), [("Done", 2), ("In Progress", 1), ("To Do", 1)])
+        self.assertEqual(statuses.count("DONE"), 2)
+        self.assertEqual([task.title for task in statuses.tasks_with("in progress")],
+                         ["Task 2"])
+        _, overdue = due_dates.time_frame("overdue")
+        self.assertEqual([task.title for task in overdue], ["Task 2", "Task 3"])
+
+        # Changing a status moves the task to its new bucket
+        statuses.discard(task_list[0])
+        task_list[0].status = "To Do"
+        statuses.add(task_list[0])
+        self.assertEqual(statuses.count("to do"), 2)
+        self.assertEqual(len(due_dates.all_time_frames()["overdue"]), 3)
+
+        statuses.discard(task_list[2])
+        self.assertEqual(statuses.tasks_with("In Progress"), [])
+        self.assertEqual(statuses.statuses(), [("Done", 1), ("To Do", 2)])
+
+    def test_remove_node(self):
+        """Test removing and finding nodes of the linked list without their position"""
+        task_list = LinkedList()
+        nodes = [task_list.insert(Task(f"Task {i}", "Description", 1))
+                 for i in range(todo.BLOCK_SIZE + 2)]
+        self.assertEqual(task_list.remove_node(nodes[5]).title, "Task 5")
+        # Emptying a block drops it, the nodes after it are still found
+        for node in nodes[todo.BLOCK_SIZE:]:
+            task_list.remove_node(node)
+        self.assertEqual(task_list.remove_node(nodes[0]).title, "Task 0")
+        self.assertEqual(len(task_list), todo.BLOCK_SIZE - 2)
+        self.assertEqual(task_list.get(3).title, "Task 4")
+        self.assertEqual(task_list.tail.task.title, f"Task {todo.BLOCK_SIZE - 1}")
+        self.assertEqual(task_list.index_of(nodes[todo.BLOCK_SIZE - 1]), todo.BLOCK_SIZE - 3)
+
+    def test_insert_at(self):
+        """Test inserting in the middle of the linked list, splitting full blocks"""
+        expected = [Task(f"Task {i}", "Description", 1) for i in range(todo.BLOCK_SIZE)]
+        for task in expected:
+            self.tasks.insert(task)
+        for index in [0, 5, todo.BLOCK_SIZE // 2, len(expected), len(expected) + 7]:
+            task = Task(f"New {index}", "Description", 1)
+            node = self.tasks.insert_at(index, task)
+            expected.insert(index, task)
+            self.assertIs(self.tasks.get(self.tasks.index_of(node)), task)
+        self.assertEqual(list(self.tasks), expected)
+        self.assertEqual([self.tasks.get(i) for i in range(len(expected))], expected)
+        self.assertIs(self.tasks.tail.task, expected[-1])
+
+    def test_text_index(self):
+        """Test prefix matching, ranking and removal in the text index"""
+        index = TextIndex()
+        task_list = [Task("Buy milk", "From the store", 2), Task("Store boxes", "In the attic", 1),
+                     Task("Call Bob", "About the milkshake", 1), Task("Milk", "", 3)]
+        index.extend(task_list)
+
+        # Whole words beat prefixes and titles beat descriptions, then priority decides
+        self.assertEqual([task.title for task in index.search("MILK")],
+                         ["Buy milk", "Milk", "Call Bob"])
+        self.assertEqual([task.title for task in index.search("sto")],
+                         ["Store boxes", "Buy milk"])
+        self.assertEqual([task.title for task in index.search("milk store")], ["Buy milk"])
+        self.assertEqual(list(index.search("milk attic")), [])
+        self.assertEqual(list(index.search("  ")), [])
+
+        index.discard(task_list[0])
+        self.assertEqual([task.title for task in index.search("milk")], ["Milk", "Call Bob"])
+        self.assertEqual(len(index), 3)
+
     def test_file_operations(self):
         """Test file operations and header line"""
         # Test file initialization
@@ -142,7 +396,7 @@ class TestTodoList(unittest.TestCase):
         # Check header line
         with open("todo_list.txt", "r", encoding="utf-8") as file:
             first_line = file.readline().strip()
-            self.assertEqual(first_line, "Task, Description, Priority, Status, Due Date")
+            self.assertEqual(first_line, "Task, Description, Priority, Status, Due Date, Id")
 
         # Clean up
         os.remove("todo_list.txt")
@@ -163,5 +417,825 @@ class TestTodoList(unittest.TestCase):
         if os.path.exists("todo_list.txt"):
             os.remove("todo_list.txt")
 
+class TestStorage(unittest.TestCase):
+    """TestStorage"""
+    def setUp(self):
+        """Work in an empty directory with no tasks loaded"""
+        self.old_dir = os.getcwd()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.temp_dir.name)
+        todo.history = None  # Only the menu keeps one
+        todo.clear_tasks()
+
+    def reload(self):
+        """Forgets the tasks in memory and loads them from disk again"""
+        todo.clear_tasks()
+        todo.load_tasks()
+        todo._materialize_tasks()
+        return [(task.title, task.status) for task in todo.tasks]
+
+    def add(self, title, priority=1, due_date=""):
+        """Adds a task through the menu action"""
+        with mock.patch("builtins.input",
+                        side_effect=[title, "Description", str(priority), due_date]):
+            todo.add_task()
+
+    @mock.patch.object(todo, "JOURNAL_MODE", True)
+    def test_journal_replay(self):
+        """Test that changes are journaled and replayed on load"""
+        todo.initialize_todo_file()
+        todo.load_tasks()
+        for title in ["A", "B", "C"]:
+            self.add(title)
+        with mock.patch("builtins.input", side_effect=["1", "1", "Done"]):
+            todo.update_task()
+        with mock.patch("builtins.input", side_effect=["2"]):
+            todo.delete_task()
+
+        # The first change saved the whole list, the rest only went to the journal
+        with open(todo.TODO_FILE, "r", encoding="utf-8") as file:
+            self.assertEqual(len(file.readlines()), 2)
+        self.assertEqual(self.reload(), [("A", "Done"), ("C", "To Do")])
+
+        # A record torn by a crash is ignored and cut off
+        with open(todo.JOURNAL_FILE, "a", encoding="utf-8") as file:
+            file.write('00000000 ["add", 9, "Torn"')
+        self.assertEqual(self.reload(), [("A", "Done"), ("C", "To Do")])
+        with open(todo.JOURNAL_FILE, "r", encoding="utf-8") as file:
+            self.assertNotIn("Torn", file.read())
+
+        # Compacting folds the journal into the todo file
+        todo.compact_journal()
+        with open(todo.JOURNAL_FILE, "r", encoding="utf-8") as file:
+            self.assertEqual(len(file.readlines()), 1)
+        self.assertEqual(self.reload(), [("A", "Done"), ("C", "To Do")])
+
+    @mock.patch.object(todo, "JOURNAL_MODE", True)
+    def test_concurrent_journal(self):
+        """Test that a journal record goes on top of what another process saved since"""
+        todo.initialize_todo_file()
+        todo.load_tasks()
+        for title in ["A", "B"]:
+            self.add(title)
+
+        # Another process journals a task with the id this one hands out next
+        journaled = dict(os.environ, TODO_JOURNAL="1")
+        subprocess.run([sys.executable, todo.__file__, "add", "Other", "Task", "2"],
+                       env=journaled, check=True, capture_output=True)
+        self.add("Own")
+        self.assertEqual([(task.title, task.id) for task in todo.tasks],
+                         [("A", 1), ("B", 2), ("Other", 3), ("Own", 4)])
+
+        # Another process saves the whole file and drops the journal
+        plain = dict(os.environ, TODO_JOURNAL="0")
+        subprocess.run([sys.executable, todo.__file__, "update", "1", "--priority", "9"],
+                       env=plain, check=True, capture_output=True)
+        with mock.patch("builtins.input", side_effect=["2"]):
+            todo.delete_task()
+        self.assertEqual(todo.get_task_by_id(1).priority, 9)
+        self.assertEqual(self.reload(), [("A", "To Do"), ("Other", "To Do"), ("Own", "To Do")])
+
+    @mock.patch.object(todo, "SNAPSHOT_FORMAT", "binary")
+    def test_binary_snapshot(self):
+        """Test saving, lazily loading and converting binary snapshots"""
+        due = date.today() + timedelta(days=3)
+        self.add("First", 2, due.isoformat())
+        self.add("Second", 1)
+        self.assertTrue(os.path.exists(todo.BINARY_FILE))
+
+        # Loading only opens the snapshot, tasks are decoded when needed
+        todo.clear_tasks()
+        todo.load_tasks()
+        self.assertEqual(len(todo.tasks), 0)
+        self.assertEqual(len(todo._pending_snapshot[0]), 2)
+        todo._materialize_tasks()
+        self.assertEqual([(task.title, task.priority, task.due_date) for task in todo.tasks],
+                         [("First", 2, due), ("Second", 1, None)])
+        self.assertEqual(todo.priority_queue[0].title, "Second")
+
+        # The menu opens and exits without decoding the snapshot or writing it again
+        with mock.patch.object(todo, "_store_snapshot", side_effect=AssertionError), \
+                mock.patch.object(todo, "_write_file", side_effect=AssertionError), \
+                mock.patch("builtins.input", side_effect=["5"]), \
+                mock.patch("sys.stdout", new_callable=io.StringIO):
+            self.assertEqual(todo.main([]), 0)
+
+        # Converting to text and back keeps every field
+        todo.binary_to_text(text_path="out.txt")
+        todo.text_to_binary("out.txt", "out.bin")
+        snapshot = todo.BinarySnapshot("out.bin")
+        self.assertEqual([(task.title, task.status, task.due_date) for task in snapshot],
+                         [("First", "To Do", due), ("Second", "To Do", None)])
+        snapshot.close()
+
+    def test_incremental_save(self):
+        """Test that saving copies unchanged rows and only formats changed tasks"""
+        with open(todo.TODO_FILE, "w", encoding="utf-8") as file:
+            file.write(todo.HEADER)
+            for i in range(10):
+                file.write(f"Task {i}, Row\\c {i}, {i + 1}, To Do, 2000-01-0{i % 9 + 1}, {i + 1}\n")
+        self.reload()
+        todo.edit_task(todo.tasks.get(3), status="Done")
+        todo.remove_task(6)
+        todo.create_task("New", "Added", 2)
+        with mock.patch.object(todo, "_task_line", wraps=todo._task_line) as task_line:
+            todo.save_tasks()
+        self.assertEqual(task_line.call_count, 2)  # The edited and the added task
+        with open(todo.TODO_FILE, "rb") as file:
+            self.assertEqual(file.read(), todo._encode_text(todo.tasks, version=1, next_id=12))
+
+        # The saved file is the starting point of the next save
+        todo.edit_task(todo.tasks.get(9), priority=7)
+        with mock.patch.object(todo, "_task_line", wraps=todo._task_line) as task_line:
+            todo.save_tasks()
+        self.assertEqual(task_line.call_count, 1)
+        self.reload()
+        self.assertEqual([(task.title, task.description, task.priority, task.status)
+                          for task in todo.tasks][2:],
+                         [("Task 2", "Row, 2", 3, "To Do"), ("Task 3", "Row, 3", 4, "Done"),
+                          ("Task 4", "Row, 4", 5, "To Do"), ("Task 5", "Row, 5", 6, "To Do"),
+                          ("Task 7", "Row, 7", 8, "To Do"), ("Task 8", "Row, 8", 9, "To Do"),
+                          ("Task 9", "Row, 9", 10, "To Do"), ("New", "Added", 7, "To Do")])
+
+        # Setting a field of a task marks it dirty too
+        todo.tasks.get(0).status = "Done"
+        todo.tasks.get(1).title = "Renamed"
+        todo.save_tasks()
+        self.reload()
+        self.assertEqual([(task.title, task.status) for task in todo.tasks][:2],
+                         [("Task 0", "Done"), ("Renamed", "To Do")])
+
+    @mock.patch.object(todo, "WRITE_BEHIND", True)
+    def test_write_behind(self):
+        """Test that changes are saved together in the background, and by flush()"""
+        saves = []
+        saved = threading.Event()
+
+        def save():
+            saves.append([task.title for task in todo.tasks])
+            todo.save_tasks()
+            saved.set()
+
+        with mock.patch.object(todo, "_write_behind", todo.WriteBehind(save, delay=0.2)):
+            for title in ["A", "B", "C"]:
+                self.add(title)
+            self.assertEqual(saves, [])  # The actions returned without saving
+            todo.flush()
+            self.assertEqual(saves, [["A", "B", "C"]])
+            todo.flush()
+            self.assertEqual(len(saves), 1)  # Nothing left to save
+
+            saved.clear()
+            self.add("D")
+            self.assertTrue(saved.wait(5))
+            self.assertEqual(saves[-1], ["A", "B", "C", "D"])
+
+            # Exiting flushes what is still pending
+            with mock.patch("builtins.input", side_effect=["1", "E", "Description", "1", "",
+                                                           KeyboardInterrupt]), \
+                    mock.patch("sys.stdout", new_callable=io.StringIO):
+                with self.assertRaises(KeyboardInterrupt):
+                    todo.main([])
+        self.reload()
+        self.assertEqual([task.title for task in todo.tasks], ["A", "B", "C", "D", "E"])
+
+    @mock.patch.object(todo, "SNAPSHOT_FORMAT", "sqlite")
+    def test_sqlite_backend(self):
+        """Test the SQLite backend and the views that query it without loading tasks"""
+        with open(todo.TODO_FILE, "w", encoding="utf-8") as file:
+            file.write(todo.HEADER + "Imported, From the text file, 3, To Do, \n")
+        tomorrow = (date.today() + timedelta(days=1)).isoformat()
+        self.assertEqual(todo.main(["add", "Soon", "Due", "1", "--due", tomorrow,
+                                    "+", "add", "Later", "Not due", "2", "--status", "Done"]), 0)
+        self.assertTrue(os.path.exists(todo.DATABASE_FILE))
+
+        todo.clear_tasks()
+        todo.load_tasks()
+        with mock.patch.object(todo, "_store_snapshot", side_effect=AssertionError), \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            self.assertEqual(todo.task_count(), 3)
+            self.assertEqual([task.title for task in todo.top_tasks(2)], ["Soon", "Later"])
+            self.assertEqual([task.title for task in todo.top_tasks(1, by_urgency=True)],
+                             ["Soon"])
+            self.assertEqual(todo.task_statuses(), [("To Do", 2), ("Done", 1)])
+            todo.print_by_priority()
+            todo.print_by_status("done")
+            todo.print_time_frame("tomorrow")
+        self.assertIn("2. Soon", output.getvalue())
+        self.assertIn("1. Later", output.getvalue())
+        self.assertIn("Tasks due tomorrow:\n1. Soon", output.getvalue())
+
+        # Changes go straight to the rows, and deleting keeps the ids of the other tasks
+        with mock.patch.object(todo, "_store_snapshot", side_effect=AssertionError):
+            self.assertEqual(todo.main(["delete", "1", "+", "update", "1", "--priority", "5",
+                                        "+", "add", "New", "Added", "4"]), 0)
+        self.reload()
+        self.assertEqual([(task.id, task.title, task.priority) for task in todo.tasks],
+                         [(2, "Soon", 5), (3, "Later", 2), (4, "New", 4)])
+
+        # Two sessions sharing the database, one with its tasks loaded, add a task each
+        todo._materialize_tasks()
+        other = todo.SqliteStorage()
+        other.write("add", Task("FromP2", "Other session", 1))
+        other.save(None)
+        other.close()
+        todo.create_task("FromP1", "This session", 1)
+        todo.save_tasks()
+        self.assertEqual([(task.id, task.title) for task in todo.tasks][-1], (6, "FromP1"))
+        self.reload()
+        self.assertEqual([(task.id, task.title) for task in todo.tasks][-2:],
+                         [(5, "FromP2"), (6, "FromP1")])
+
+        # In the menu the first change loads the tasks, so that undo can take it back
+        with mock.patch("builtins.input", side_effect=["2", "1", "2", "7", "7", "5"]), \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            self.assertEqual(todo.main([]), 0)
+        self.assertIn("Updated task: Soon - Priority: 7\n", output.getvalue())
+        self.assertIn("Updated task: Soon\n", output.getvalue())
+        self.reload()
+        self.assertEqual((todo.tasks.get(0).title, todo.tasks.get(0).priority), ("Soon", 5))
+
+    def test_next_command(self):
+        """Test the non-interactive command for the most urgent tasks"""
+        self.add("Low", 5)
+        self.add("High", 1)
+        todo.clear_tasks()
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            todo.main(["next", "-k", "1"])
+        self.assertIn("1. High", output.getvalue())
+        self.assertNotIn("Low", output.getvalue())
+
+    def test_chained_commands(self):
+        """Test that chained commands are applied together and saved once"""
+        with mock.patch("todo.save_tasks", wraps=todo.save_tasks) as save:
+            code = todo.main(["add", "A", "First", "2", "+", "add", "B", "Second", "1",
+                              "--due", "2099-01-01", "+", "update", "1", "--status", "Done",
+                              "+", "delete", "2"])
+        self.assertEqual(code, 0)
+        self.assertEqual(save.call_count, 1)
+        self.reload()
+        self.assertEqual([(t.title, t.status) for t in todo.tasks], [("A", "Done")])
+
+        with mock.patch("sys.stderr", new_callable=io.StringIO):
+            self.assertEqual(todo.main(["add", "C", "Third", "1", "+", "delete", "9"]), 1)
+        self.reload()
+        self.assertEqual([t.title for t in todo.tasks], ["A"])
+
+    def test_batch_command(self):
+        """Test applying operations and importing tasks from JSON Lines"""
+        with open("tasks.jsonl", "w", encoding="utf-8") as file:
+            file.write('{"title": "Old", "description": "Past", "priority": 3, '
+                       '"status": "Done", "due_date": "2000-01-01"}\n')
+        operations = io.StringIO(
+            '{"op": "add", "title": "New", "description": "Next", "priority": 1}\n'
+            '\n'
+            '{"op": "update", "index": 1, "priority": 2, "due_date": null}\n')
+        with mock.patch("sys.stdin", operations):
+            self.assertEqual(todo.main(["import", "tasks.jsonl", "+", "batch", "-"]), 0)
+        self.reload()
+        self.assertEqual([(t.title, t.priority, t.due_date) for t in todo.tasks],
+                         [("Old", 2, None), ("New", 1, None)])
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            todo.main(["export"])
+        self.assertEqual(output.getvalue().splitlines()[1],
+                         '{"title": "New", "description": "Next", "priority": 1, '
+                         '"status": "To Do", "due_date": null}')
+
+        with mock.patch("sys.stdin", io.StringIO('{"op": "delete", "index": 1}\n{"op": "move"}\n')), \
+                mock.patch("sys.stderr", new_callable=io.StringIO) as error:
+            self.assertEqual(todo.main(["batch"]), 1)
+        self.assertIn("Line 2", error.getvalue())
+        self.reload()
+        self.assertEqual(len(todo.tasks), 2)
+
+        # Records that are not objects or have fields of the wrong type are reported too
+        for line in ['[1]', '{"op": "add", "title": "X", "priority": 1, "status": 3}',
+                     '{"op": "update", "index": "1", "priority": 2}']:
+            with mock.patch("sys.stdin", io.StringIO(line + "\n")), \
+                    mock.patch("sys.stderr", new_callable=io.StringIO) as error:
+                self.assertEqual(todo.main(["batch"]), 1)
+            self.assertIn("Line 1: ", error.getvalue())
+            self.assertIn("Nothing was saved", error.getvalue())
+        self.assertEqual(self.reload(), [("Old", "Done"), ("New", "To Do")])
+
+    def test_streaming_import_export(self):
+        """Test CSV round trips, filtering the stream and merging into the list"""
+        yesterday = (date.today() - timedelta(days=1)).strftime("%Y-%m-%d")
+        with open("tasks.csv", "w", encoding="utf-8", newline="") as file:
+            file.write('title,description,priority,status,due_date\r\n'
+                       '"Milk, eggs","Say ""hi""",2,To Do,\r\n'
+                       f'Late,Overdue,1,To Do,{yesterday}\r\n'
+                       f'Finished,Done already,3,Done,{yesterday}\r\n')
+        self.assertEqual(todo.main(["convert", "tasks.csv", "overdue.jsonl",
+                                    "--time-frame", "overdue"]), 0)
+        with open("overdue.jsonl", encoding="utf-8") as file:
+            self.assertEqual([line.split(",")[0] for line in file], ['{"title": "Late"'])
+        self.assertFalse(os.path.exists(todo.TODO_FILE))  # convert never touches the list
+
+        self.assertEqual(todo.main(["import", "tasks.csv", "+", "export", "out.csv"]), 0)
+        with open("tasks.csv", encoding="utf-8") as expected, \
+                open("out.csv", encoding="utf-8") as actual:
+            self.assertEqual(actual.read(), expected.read())
+
+        with open("update.jsonl", "w", encoding="utf-8") as file:
+            file.write('{"title": "Late", "priority": 4, "status": "Done"}\n'
+                       '{"title": "New", "priority": 5}\n')
+        self.assertEqual(todo.main(["import", "update.jsonl", "--merge"]), 0)
+        self.reload()
+        self.assertEqual([(t.title, t.priority, t.status, t.due_date is None)
+                          for t in todo.tasks],
+                         [("Milk, eggs", 2, "To Do", True), ("Late", 4, "Done", True),
+                          ("Finished", 3, "Done", False), ("New", 5, "To Do", True)])
+
+        with open(todo.TODO_FILE, encoding="utf-8") as file:
+            self.assertEqual(file.readlines()[1], 'Milk\\c eggs, Say "hi", 2, To Do, , 1\n')
+
+        # Files from before fields were escaped keep their backslashes
+        with open(todo.TODO_FILE, "w", encoding="utf-8") as file:
+            file.write("Task, Description, Priority, Status, Due Date\n"
+                       "Copy, C:\\code and C:\\\\share, 2, To Do, \n")
+        self.assertEqual(self.reload(), [("Copy", "To Do")])
+        self.assertEqual(todo.tasks.get(0).description, "C:\\code and C:\\\\share")
+        todo.save_tasks()
+        self.reload()
+        self.assertEqual(todo.tasks.get(0).description, "C:\\code and C:\\\\share")
+
+        # Line breaks, which CSV allows within fields, keep the task on one row
+        with open("lines.csv", "w", encoding="utf-8", newline="") as file:
+            file.write('title,description,priority,status,due_date\r\n'
+                       '"Line1\nLine2","Ends with\r\n",1,To Do,\r\n')
+        self.assertEqual(todo.main(["import", "lines.csv"]), 0)
+        self.reload()
+        self.assertEqual([(task.title, task.description) for task in todo.tasks],
+                         [("Copy", "C:\\code and C:\\\\share"), ("Line1\nLine2", "Ends with\r\n")])
+
+    def test_search(self):
+        """Test searching with filters, and that changes reach the search index"""
+        todo.main(["add", "Pay rent", "Bank transfer", "1", "+", "add", "Pay bills", "Water", "2",
+                   "+", "add", "Rent a car", "Weekend trip", "3", "--status", "Done"])
+        self.reload()
+        self.assertEqual([task.title for task in todo.search_tasks("rent")],
+                         ["Pay rent", "Rent a car"])
+        self.assertEqual([task.title for task in todo.search_tasks("pay", priority=2)],
+                         ["Pay bills"])
+        self.assertEqual([task.title for task in todo.search_tasks("rent", status="done")],
+                         ["Rent a car"])
+        self.assertEqual(todo.search_tasks("pay", limit=1)[0].title, "Pay rent")
+
+        todo.create_task("Rental deposit", "Ask the bank", 1)
+        todo.remove_task(0)
+        self.assertEqual([task.title for task in todo.search_tasks("ren")],
+                         ["Rental deposit", "Rent a car"])
+        self.assertEqual([task.title for task in todo.search_tasks("bank")], ["Rental deposit"])
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            self.assertEqual(todo.main(["search", "pay bi"]), 0)
+        self.assertIn("1. Pay bills", output.getvalue())
+
+        # A description changed by import --merge is found by its new words, and undone
+        todo.enable_history()
+        with open("m.jsonl", "w", encoding="utf-8") as file:
+            file.write('{"title": "Pay bills", "description": "Soy milk", "priority": 2}\n')
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            self.assertEqual(todo.main(["search", "water", "+", "import", "m.jsonl", "--merge",
+                                        "+", "search", "water", "+", "search", "soy"]), 0)
+        self.assertEqual(output.getvalue().count("1. Pay bills"), 2)
+        self.assertEqual(todo.search_tasks("water"), [])
+        self.assertEqual(todo.history.undo(), [("update", todo.get_task_by_id(2))])
+        self.assertEqual([task.title for task in todo.search_tasks("water")], ["Pay bills"])
+        self.assertEqual(todo.search_tasks("soy"), [])
+
+    def test_query(self):
+        """Test combined conditions, the plans chosen for them and the query command"""
+        today = date.today()
+        for i in range(30):
+            todo.create_task(f"Task {i}", "Row", i % 3 + 1, today + timedelta(days=i),
+                             "Done" if i % 2 else "To Do")
+        todo.create_task("Someday", "No due date", 1)
+
+        found = todo.query().where("priority", "<=", 2).where("status", "!=", "done") \
+            .where("due_date", "in", "week").order_by("due_date", descending=True)
+        self.assertEqual([task.title for task in found], ["Task 6", "Task 4", "Task 0"])
+        self.assertTrue(found.explain().startswith("Index scan on due_index"))
+        self.assertIn("Sort: due_date descending", found.explain())
+
+        # The list comes in index order, so a limit stops the scan early
+        found = todo.query().where("due_date", "==", None).limit(1)
+        self.assertTrue(found.explain().startswith("Scan on task list"))
+        self.assertEqual([task.title for task in found], ["Someday"])
+        found = todo.query().where("status", "==", "DONE").where("priority", "in", [2, 3]) \
+            .order_by("priority")
+        self.assertTrue(found.explain().startswith("Index scan on status_index (DONE)"))
+        self.assertEqual([task.title for task in found.limit(3)], ["Task 1", "Task 7", "Task 13"])
+        self.assertEqual(len(todo.query().where("text", "matches", "task 2").all()), 11)
+        with self.assertRaises(ValueError):
+            todo.query().where("status", "matches", "done")
+        # A range without an end, also when it is checked task by task
+        found = todo.query().where("due_date", "in", (today + timedelta(days=27), None))
+        self.assertEqual([task.title for task in found], ["Task 27", "Task 28", "Task 29"])
+        found = todo.query().where("due_date", "in", (today + timedelta(days=27), None)) \
+            .where("title", "==", "Task 28")
+        self.assertEqual([task.title for task in found], ["Task 28"])
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            todo.save_tasks()
+            self.assertEqual(todo.main(["query", "--where", "due_date", "in",
+                                        f"{today},{today + timedelta(days=2)}",
+                                        "--where", "status", "in", "to do,blocked"]), 0)
+            todo.main(["query", "--order-by", "priority", "-k", "1", "--explain"])
+        self.assertEqual(output.getvalue().splitlines()[2:4],
+                         ["1. Task 0 - Status: To Do - Priority: 1 - "
+                          f"Due: {today.strftime('%Y-%m-%d')} - Id: 1",
+                          "2. Task 2 - Status: To Do - Priority: 3 - "
+                          f"Due: {(today + timedelta(days=2)).strftime('%Y-%m-%d')} - Id: 3"])
+        self.assertIn("Limit: 1", output.getvalue())
+
+    def test_stable_ids(self):
+        """Test that ids are saved, survive deletes and address tasks in O(1)"""
+        # A file from before ids were saved numbers its rows
+        with open(todo.TODO_FILE, "w", encoding="utf-8") as file:
+            file.write("Task, Description, Priority, Status, Due Date\n")
+            for title in "ABCD":
+                file.write(f"{title}, Task {title}, 3, To Do, \n")
+        self.assertEqual(todo.main(["delete", "1", "+", "update", "3", "--id", "--status", "Done",
+                                    "+", "delete", "4", "--id"]), 0)
+        self.reload()
+        self.assertEqual([(task.id, task.title, task.status) for task in todo.tasks],
+                         [(2, "B", "To Do"), (3, "C", "Done")])
+
+        # Deleted ids are not handed out again
+        todo.main(["add", "E", "Task E", "1"])
+        self.reload()
+        self.assertEqual([task.id for task in todo.tasks], [2, 3, 5])
+        self.assertEqual(todo.get_task_by_id(5).title, "E")
+        self.assertEqual(todo.remove_task_by_id(3).title, "C")
+        self.assertIsNone(todo.remove_task_by_id(3))
+        self.assertEqual([task.title for task in todo.tasks], ["B", "E"])
+        self.assertEqual([task.title for task in todo.priority_queue], ["E", "B"])
+        todo.save_tasks()
+        with open(todo.TODO_FILE, encoding="utf-8") as file:
+            self.assertEqual(file.read().splitlines()[1:], ["B, Task B, 3, To Do, , 2",
+                                                            "E, Task E, 1, To Do, , 5"])
+
+        # Binary snapshots keep the ids too
+        todo.text_to_binary(binary_path="ids.bin")
+        snapshot = todo.BinarySnapshot("ids.bin")
+        self.assertEqual([task.id for task in snapshot], [2, 5])
+        snapshot.close()
+
+        with mock.patch("sys.stderr", new_callable=io.StringIO):
+            self.assertEqual(todo.main(["update", "3", "--id", "--priority", "1"]), 1)
+
+    def test_concurrent_save(self):
+        """Test that a save keeps the changes another process saved since loading"""
+        with open(todo.TODO_FILE, "w", encoding="utf-8") as file:
+            file.write(todo.HEADER)
+            for task_id, title in enumerate("ABC", 1):
+                file.write(f"{title}, Task {title}, 3, To Do, , {task_id}\n")
+        self.reload()
+        history = todo.enable_history()
+        task_a = todo.tasks.get(0)
+        todo.edit_task(todo.tasks.get(1), status="Done")
+        todo.remove_task(2)
+        todo.create_task("D", "Task D", 1)
+
+        # Another process edits A and adds E before this one saves
+        subprocess.run([sys.executable, todo.__file__, "update", "1", "--priority", "9",
+                        "+", "add", "E", "Task E", "2"], check=True, capture_output=True)
+        todo.save_tasks()
+        # The undo history still finds the tasks in the merged list
+        self.assertIs(todo.get_task_by_id(1), task_a)
+        self.assertEqual([operation for _ in range(3) for operation, _ in history.undo()],
+                         ["delete", "add", "update"])
+        self.assertEqual([(task.title, task.status) for task in todo.tasks],
+                         [("A", "To Do"), ("B", "To Do"), ("C", "To Do"), ("E", "To Do")])
+        for _ in range(3):
+            history.redo()
+        self.reload()
+        self.assertEqual([(task.title, task.priority, task.status) for task in todo.tasks],
+                         [("A", 9, "To Do"), ("B", 3, "Done"), ("E", 2, "To Do"),
+                          ("D", 1, "To Do")])
+        self.assertEqual(todo._loaded_version, 2)
+
+    def test_concurrent_save_without_ids(self):
+        """Test that a save merges by id when the file it loaded had no Id column"""
+        with open(todo.TODO_FILE, "w", encoding="utf-8") as file:
+            file.write("Task, Description, Priority, Status, Due Date\n")
+            for title in "ABC":
+                file.write(f"{title}, Task {title}, 3, To Do, \n")
+        self.reload()
+        todo.edit_task(todo.tasks.get(1), status="Done")
+        todo.remove_task(2)
+        todo.create_task("D", "Task D", 1)
+
+        # Another process edits A and adds E before this one saves
+        subprocess.run([sys.executable, todo.__file__, "update", "1", "--priority", "9",
+                        "+", "add", "E", "Task E", "2"], check=True, capture_output=True)
+        todo.save_tasks()
+        self.reload()
+        self.assertEqual([(task.title, task.priority, task.status, task.id) for task in todo.tasks],
+                         [("A", 9, "To Do", 1), ("B", 3, "Done", 2), ("E", 2, "To Do", 4),
+                          ("D", 1, "To Do", 5)])
+
+    def test_paged_listing(self):
+        """Test listing a window of the rows, and a page at a time"""
+        for i in range(5):
+            todo.create_task(f"Task {i}", "Row", 5 - i, date(2030, 1, 5 - i))
+        todo.save_tasks()
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            self.assertEqual(todo.main(["list", "--offset", "1", "--limit", "2"]), 0)
+        self.assertEqual(output.getvalue().splitlines(),
+                         ["Todo List:",
+                          "2. Task 1 - Status: To Do - Priority: 4 - Due: 2030-01-04 - Id: 2",
+                          "3. Task 2 - Status: To Do - Priority: 3 - Due: 2030-01-03 - Id: 3"])
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            todo.main(["list", "--view", "priority", "--limit", "1"])
+            todo.main(["list", "--view", "due", "--offset", "5"])
+        self.assertIn("5. Task 4", output.getvalue())
+        self.assertNotIn("4. Task 3", output.getvalue())
+        self.assertIn("No tasks found for tasks by due date", output.getvalue())
+
+        # Stopping at the second page leaves out the last one
+        with todo.rendering(page_size=2), \
+                mock.patch("builtins.input", side_effect=["", "q"]) as more, \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            todo.print_by_due_date()
+        self.assertEqual(more.call_count, 2)
+        self.assertEqual([line.split(" - ")[0] for line in output.getvalue().splitlines()[3:]],
+                         ["1. Task 4", "2. Task 3", "3. Task 2", "4. Task 1"])
+
+    def test_server(self):
+        """Test the HTTP API, its ETags, and that changes arriving together are saved together"""
+        todo.create_task("Milk", "Buy milk", 2)
+        todo.save_tasks()
+
+        async def session():
+            task_server = todo.TaskServer()
+            server = await asyncio.start_server(task_server.handle, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            connections = [await asyncio.open_connection("127.0.0.1", port) for _ in range(4)]
+
+            async def send(method, path, body=None, headers=None, connection=0):
+                data = b"" if body is None else json.dumps(body).encode()
+                lines = [f"{method} {path} HTTP/1.1", f"Content-Length: {len(data)}"]
+                lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+                connections[connection][1].write("\r\n".join(lines).encode() + b"\r\n\r\n" + data)
+
+            async def receive(connection=0):
+                reader = connections[connection][0]
+                status = int((await reader.readline()).split()[1])
+                found = {}
+                while (line := await reader.readline()) != b"\r\n":
+                    name, _, value = line.decode().partition(":")
+                    found[name.lower()] = value.strip()
+                length = int(found["content-length"])
+                payload = json.loads(await reader.readexactly(length)) if length else None
+                return status, found, payload
+
+            async def request(*args, **kwargs):
+                await send(*args, **kwargs)
+                return await receive()
+
+            status, headers, found = await request("GET", "/tasks")
+            self.assertEqual((status, [(task["id"], task["index"], task["title"])
+                                       for task in found["tasks"]]), (200, [(1, 1, "Milk")]))
+            etag = headers["etag"]
+            self.assertEqual((await request("GET", "/tasks", headers={"If-None-Match": etag}))[0],
+                             304)
+
+            status, headers, found = await request("POST", "/tasks",
+                                                   {"title": "Rent", "priority": 1})
+            self.assertEqual((status, headers["location"]), (201, "/tasks/2"))
+            status, _, found = await request("GET", "/tasks?view=priority",
+                                             headers={"If-None-Match": etag})
+            self.assertEqual([(task["index"], task["title"]) for task in found["tasks"]],
+                             [(2, "Rent"), (1, "Milk")])
+
+            # Changes that wait for a save in progress are saved together by the next one
+            with mock.patch("todo.save_tasks", wraps=todo.save_tasks) as save:
+                for connection in range(4):
+                    await send("POST", "/tasks", {"title": f"Task {connection}", "priority": 3},
+                               connection=connection)
+                statuses = [(await receive(connection))[0] for connection in range(4)]
+            self.assertEqual(statuses, [201] * 4)
+            self.assertLess(save.call_count, 4)
+
+            self.assertEqual((await request("PATCH", "/tasks/1", {"status": "Done"}))[2]["status"],
+                             "Done")
+            self.assertEqual((await request("DELETE", "/tasks/2"))[0], 204)
+            self.assertEqual((await request("GET", "/tasks/2"))[0], 404)
+            self.assertEqual((await request("PATCH", "/tasks/2", {"status": "Done"}))[0], 404)
+
+            # A PATCH waiting for the write lock behind a DELETE of its task finds it gone
+            async with task_server.write_lock:  # As if a save was in progress
+                await send("DELETE", "/tasks/3", connection=1)
+                await asyncio.sleep(0.05)
+                await send("PATCH", "/tasks/3", {"status": "Blocked"}, connection=2)
+                await asyncio.sleep(0.05)
+            self.assertEqual([(await receive(connection))[0] for connection in (1, 2)],
+                             [204, 404])
+            self.assertIsNone(todo.get_task_by_id(3))
+            self.assertEqual(sum(count for _, count in todo.task_statuses()), len(todo.tasks))
+            self.assertEqual((await request("PATCH", "/tasks/1", {"priority": 0}))[0], 400)
+            # Fields of the wrong type change nothing, and later changes are still saved
+            self.assertEqual((await request("POST", "/tasks", {"title": 5, "priority": 1}))[0],
+                             400)
+            self.assertEqual((await request("PATCH", "/tasks/1",
+                                            {"priority": 3, "status": 7}))[0], 400)
+            self.assertEqual((await request("GET", "/tasks/1"))[2]["priority"], 2)
+            self.assertEqual((await request("POST", "/tasks", {"title": "Bread",
+                                                               "priority": 4}))[0], 201)
+            self.assertEqual((await request("PUT", "/tasks"))[0], 405)
+            found = (await request("GET", "/time-frames/all"))[2]
+            self.assertEqual(sorted(found), sorted(TIME_FRAMES))
+
+            # A save by another process is merged on the loop, where no GET sees it half done
+            subprocess.run([sys.executable, todo.__file__, "add", "Other", "Elsewhere", "5"],
+                           check=True, capture_output=True)
+            threads = []
+            merge = todo._merge_saved_changes
+
+            def merge_here():
+                threads.append(threading.current_thread())
+                merge()
+
+            with mock.patch("todo._merge_saved_changes", merge_here):
+                self.assertEqual((await request("POST", "/tasks", {"title": "Eggs",
+                                                                   "priority": 4}))[0], 201)
+            self.assertEqual(threads, [threading.main_thread()])
+            self.assertEqual((await request("GET", "/tasks/8"))[2]["title"], "Other")
+            for _, writer in connections:
+                writer.close()
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(session())
+        self.reload()
+        self.assertEqual([(task.title, task.status) for task in todo.tasks][:2],
+                         [("Milk", "Done"), ("Task 1", "To Do")])
+        self.assertEqual([task.title for task in todo.tasks][3:],
+                         ["Task 3", "Bread", "Other", "Eggs"])
+        with self.assertRaises(ValueError):
+            todo.edit_task(Task("Gone", "Never stored", 1), status="Done")
+
+    def test_stats(self):
+        """Test recording the hot paths, writing the stats and profiling a session"""
+        original = todo.heap_push
+        recorded = todo.enable_stats()
+        self.addCleanup(todo.disable_stats)
+        for title, priority in [("A", 3), ("B", 2), ("C", 1)]:
+            self.add(title, priority)
+        summary = recorded.summary()
+        self.assertEqual(summary["heap_push"]["calls"], 3)
+        self.assertEqual(summary["_heap_up"]["nodes"], 2)  # B and C each moved up to the top
+        self.assertEqual(summary["save_tasks"]["calls"], 3)
+        self.assertGreater(summary["_write_file"]["bytes_written"],
+                           os.path.getsize(todo.TODO_FILE))
+        self.assertLessEqual(summary["save_tasks"]["p50_s"], summary["save_tasks"]["p99_s"])
+
+        todo.write_stats("stats.prom")
+        with open("stats.prom", encoding="utf-8") as file:
+            self.assertIn('todo_operation_seconds_count{operation="save_tasks"} 3\n', file.read())
+        todo.disable_stats()
+        self.assertIs(todo.heap_push, original)
+
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            self.assertEqual(todo.main(["--profile", "session.pstats", "list"]), 0)
+        self.assertIn("1. A", output.getvalue())
+        profiled = pstats.Stats("session.pstats").stats
+        self.assertTrue(any(function == "run_command" for _, _, function in profiled))
+
+    def test_undo_history(self):
+        """Test undo, redo and snapshots, including one on a branch that was undone"""
+        for title, priority in [("A", 3), ("B", 2), ("C", 1)]:
+            self.add(title, priority)
+        history = todo.enable_history()
+        history.snapshot("start")
+        todo.remove_task(1)
+        todo.edit_task(todo.get_task(1), priority=5)
+        todo.create_task("D", "Description", 4)
+        self.assertEqual([task.title for task in todo.top_tasks(4)], ["A", "D", "C"])
+
+        self.assertEqual([operation for _ in range(3) for operation, _ in history.undo()],
+                         ["delete", "update", "add"])
+        self.assertEqual([task.title for task in todo.tasks], ["A", "B", "C"])
+        self.assertEqual([task.title for task in todo.top_tasks(3)], ["C", "B", "A"])
+        self.assertEqual(todo.get_task_by_id(2).title, "B")
+        self.assertEqual(history.undo(), [])  # The list as it was before undo was enabled
+
+        history.redo()
+        self.assertEqual([task.title for task in todo.tasks], ["A", "C"])
+        history.snapshot("deleted")
+        history.undo()
+        todo.edit_task(todo.get_task(0), status="Done")  # A new branch
+        self.assertEqual(history.redo(), [])
+        self.assertEqual(len(history.restore("deleted")), 2)
+        self.assertEqual([(task.title, task.status) for task in todo.tasks],
+                         [("A", "To Do"), ("C", "To Do")])
+        history.restore("start")
+        todo.save_tasks()
+        self.assertEqual(self.reload(), [("A", "To Do"), ("B", "To Do"), ("C", "To Do")])
+        with self.assertRaises(ValueError):
+            todo.history.restore("start")  # Loading again starts a new history
+
+        # The menu saves what undo changed
+        todo.enable_history()
+        with mock.patch("builtins.input", side_effect=["3", "1", "7", "5"]), \
+                mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            todo._menu()
+        self.assertIn("Added task: A", output.getvalue())
+        self.assertEqual(self.reload(), [("A", "To Do"), ("B", "To Do"), ("C", "To Do")])
+
+    @mock.patch.multiple(todo, TODO_FILE=todo.TODO_FILE, JOURNAL_FILE=todo.JOURNAL_FILE,
+                         BINARY_FILE=todo.BINARY_FILE, DATABASE_FILE=todo.DATABASE_FILE,
+                         WORKSPACE_DIR=todo.WORKSPACE_DIR)
+    def test_workspace(self):
+        """Test lists loaded in parallel, saving only changed lists, and merged views"""
+        past = date.today() - timedelta(days=3)
+        workspace = todo.Workspace("lists")
+        os.mkdir("lists")
+        home = workspace.shard("home")
+        home.add("Milk", "Buy milk", 2)
+        home.add("Rent", "Pay rent", 1, past, allow_past_dates=True)
+        work = workspace.shard("work")
+        work.add("Report", "Write report", 1, past - timedelta(days=1), allow_past_dates=True)
+        work.add("Email", "Answer email", 3, past, allow_past_dates=True)
+        self.assertEqual(workspace.save(), ["home", "work"])
+        self.assertEqual(todo.main(["--workspace", "lists", "--list", "work",
+                                    "add", "Plan", "Plan the week", "1"]), 0)
+
+        workspace = todo.Workspace("lists").load(processes=2)
+        self.assertEqual(workspace.names(), ["home", "work"])
+        self.assertEqual([(name, task.title) for name, task in workspace.top(3)],
+                         [("work", "Report"), ("home", "Rent"), ("work", "Plan")])
+        workspace.shard("work").edit(2, status="Done")
+        self.assertEqual([(name, task.title) for name, task in workspace.time_frame("overdue")],
+                         [("work", "Report"), ("home", "Rent")])
+
+        with mock.patch.object(todo.Shard, "save", autospec=True,
+                               side_effect=todo.Shard.save) as save:
+            self.assertEqual(workspace.save(), ["work"])
+        self.assertEqual(save.call_count, 1)
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            self.assertEqual(todo.main(["--workspace", "lists", "workspace", "due"]), 0)
+        self.assertIn("2. Rent - Status: To Do - Priority: 1", output.getvalue())
+        self.assertNotIn("Email", output.getvalue())
+        self.assertEqual(todo.main(["--list", "../home", "list"]), 1)
+
+        # Saving a list changed on disk since it was loaded would lose those changes
+        workspace.shard("home").add("Bread", "Buy bread", 2)
+        todo.main(["--workspace", "lists", "--list", "home", "delete", "1"])
+        with self.assertRaises(ValueError):
+            workspace.save()
+
+        # A file that is not a list is skipped, and a move saves the two lists it changes
+        with open(os.path.join("lists", "notes.txt"), "w", encoding="utf-8") as file:
+            file.write("Use any methods, packages, classes, and interactions\n")
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output, \
+                mock.patch("sys.stderr", new_callable=io.StringIO) as errors:
+            self.assertEqual(todo.main(["--workspace", "lists", "workspace", "move", "--id", "2",
+                                        "--from", "home", "--to", "work"]), 0)
+            self.assertEqual(todo.main(["--workspace", "lists", "workspace"]), 0)
+        self.assertIn("Skipped", errors.getvalue())
+        self.assertIn("Moved task: Rent to work (id 4)\nhome: 0 tasks\nwork: 4 tasks\n",
+                      output.getvalue())
+
+        # Tasks journaled with --list are in the list, and a move folds the journal in
+        journal = os.path.join("lists", "work.journal")
+        todo.use_list("work", "lists")
+        self.reload()
+        with mock.patch.object(todo, "JOURNAL_MODE", True), \
+                mock.patch("sys.stdout", new_callable=io.StringIO):
+            for title in ["Call", "Book"]:
+                self.add(title, 2)
+        with open(journal, "r", encoding="utf-8") as file:
+            self.assertIn("Book", file.read())
+        with mock.patch("sys.stdout", new_callable=io.StringIO) as output:
+            todo.main(["--workspace", "lists", "workspace"])
+            todo.main(["--workspace", "lists", "workspace", "move", "--id", "1",
+                       "--from", "work", "--to", "home"])
+            todo.main(["--workspace", "lists", "workspace"])
+        self.assertIn("work: 6 tasks\n", output.getvalue())
+        self.assertIn("home: 1 tasks\nwork: 5 tasks\n", output.getvalue())
+        self.assertFalse(os.path.exists(journal))
+        saved, _ = todo._read_text_file(os.path.join("lists", "work.txt"))
+        self.assertEqual([task.title for task in saved], ["Email", "Plan", "Rent", "Call", "Book"])
+
+        # A list journaled by another process since it was loaded is not saved over
+        workspace = todo.Workspace("lists").load(processes=1)
+        workspace.shard("work").add("Lost", "Not saved", 3)
+        with open(journal, "w", encoding="utf-8") as file:
+            file.write("# base 00000000\n")
+        with self.assertRaises(ValueError):
+            workspace.save()
+
+    def tearDown(self):
+        """Restore the module state and remove the temporary directory"""
+        todo.clear_tasks()
+        os.chdir(self.old_dir)
+        self.temp_dir.cleanup()
+
 if __name__ == "__main__":
     unittest.main()
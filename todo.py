@@ -12,80 +12,334 @@
 """
 
 import os
+import sys
+import gc
+import argparse
+import asyncio
+import atexit
+import cProfile
+import functools
+import json
+import csv
+from contextlib import contextmanager, nullcontext
+import mmap
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import re
+import sqlite3
+import signal
+import subprocess
+import threading
+import time
+from array import array
+try:
+    import fcntl
+except ImportError:  # Not on Windows, where the todo file is not locked
+    fcntl = None
+from itertools import accumulate, chain, islice, repeat
+from operator import attrgetter, itemgetter
+from bisect import bisect_left
 from typing import List
 from datetime import datetime, date, timedelta
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+TODO_FILE = "todo_list.txt"
+HEADER = "Task, Description, Priority, Status, Due Date, Id\n"
+# Saves stamp the header with a version and the next id to hand out,
+# e.g. "..., Due Date, Id, Version 12, Next Id 40"
+_VERSION = re.compile(r", Version (\d+)(?:, Next Id (\d+))?\s*$")
+
+# Journal mode appends one record per change instead of rewriting TODO_FILE
+JOURNAL_FILE = "todo_list.journal"
+JOURNAL_MODE = os.environ.get("TODO_JOURNAL", "") == "1"
+JOURNAL_COMPACT_THRESHOLD = 1000
+
+# With TODO_WRITE_BEHIND=1 a background thread saves changes after a short quiet period
+WRITE_BEHIND = os.environ.get("TODO_WRITE_BEHIND", "") == "1"
+WRITE_BEHIND_DELAY = 0.5  # Seconds without a change before changes are saved
+
+# With TODO_FORMAT=binary the list is kept in BINARY_FILE instead of TODO_FILE
+BINARY_FILE = "todo_list.bin"
+# With TODO_FORMAT=sqlite the list is kept in DATABASE_FILE
+DATABASE_FILE = "todo_list.db"
+# A workspace is a directory with one list per NAME.txt file, see use_list()
+WORKSPACE_DIR = os.environ.get("TODO_WORKSPACE", "todo_lists")
+SNAPSHOT_FORMAT = os.environ.get("TODO_FORMAT", "text")
+
+# With TODO_STATS=path the hot paths are timed and the numbers are written to path on exit,
+# as Prometheus text if path ends in .prom and as JSON otherwise
+STATS_FILE = os.environ.get("TODO_STATS")
 
 def initialize_todo_file():
-    """Creates the todo list file with headers if it doesn't exist"""
-    if not os.path.exists("todo_list.txt"):
-        with open("todo_list.txt", "w", encoding="utf-8") as file:
-            file.write("Task, Description, Priority, Status, Due Date\n")
+    """Creates the storage of the todo list if it doesn't exist"""
+    get_storage().initialize()
+
+# Number of nodes grouped into one block of the LinkedList's positional index
+BLOCK_SIZE = 256
 
 class Node:
     """Defines a node"""
+    __slots__ = ("task", "next", "block")
+
     def __init__(self, task):
         self.task = task
         self.next = None
+        self.block = None  # The block of the LinkedList holding the node
 
 class LinkedList:
-    """Defines a LinkedList"""
+    """
+    Defines a LinkedList
+
+    The nodes are chained through next like a regular singly linked list, and are
+    also grouped into blocks of at most BLOCK_SIZE nodes. A Fenwick tree over the
+    block sizes finds the block holding a position, so insert at the end is O(1)
+    and get/remove by index are O(log n) instead of walking from the head. Each node
+    knows its block, so a node can also be removed without knowing its position.
+    """
     def __init__(self):
         self.head = None
+        self.tail = None
         self.length = 0
+        self._blocks = []
+        self._tree = [0]  # 1-based Fenwick tree over the block sizes
+        self._block_index = {}  # Identity of a block to its position in _blocks
 
     def insert(self, task):
-        """Inserts a new node at the end of the list"""
+        """Inserts a new node at the end of the list and returns it"""
         new_node = Node(task)
         if self.head is None:
             self.head = new_node
         else:
-            current = self.head
-            while current.next is not None:
-                current = current.next
-            current.next = new_node
+            self.tail.next = new_node
+        self.tail = new_node
+
+        if self._blocks and len(self._blocks[-1]) < BLOCK_SIZE:
+            self._blocks[-1].append(new_node)
+            self._tree_add(len(self._blocks) - 1, 1)
+        else:
+            self._blocks.append([new_node])
+            self._block_index[id(self._blocks[-1])] = len(self._blocks) - 1
+            self._tree_append(1)
+        new_node.block = self._blocks[-1]
+        self.length += 1
+        return new_node
+
+    def extend(self, task_iter):
+        """Inserts many tasks at the end of the list, building the blocks in one go"""
+        new_nodes = [Node(task) for task in task_iter]
+        if not new_nodes:
+            return
+        for previous, node in zip(new_nodes, new_nodes[1:]):
+            previous.next = node
+        if self.head is None:
+            self.head = new_nodes[0]
+        else:
+            self.tail.next = new_nodes[0]
+        self.tail = new_nodes[-1]
+
+        # Top up the last block, then cut the remaining nodes into full blocks
+        start = 0
+        if self._blocks:
+            start = BLOCK_SIZE - len(self._blocks[-1])
+            block = self._blocks[-1]
+            block.extend(new_nodes[:start])
+            for node in new_nodes[:start]:
+                node.block = block
+        for block_start in range(start, len(new_nodes), BLOCK_SIZE):
+            block = new_nodes[block_start:block_start + BLOCK_SIZE]
+            for node in block:
+                node.block = block
+            self._block_index[id(block)] = len(self._blocks)
+            self._blocks.append(block)
+        self._rebuild_tree()
+        self.length += len(new_nodes)
+
+    def insert_at(self, index, task):
+        """Inserts a new node at a position (at the end if past it) and returns it"""
+        if index >= self.length:
+            return self.insert(task)
+        block_index, offset = self._locate(max(index, 0))
+        block = self._blocks[block_index]
+        new_node = Node(task)
+        new_node.next = block[offset]
+        if offset > 0:
+            block[offset - 1].next = new_node
+        elif block_index > 0:
+            self._blocks[block_index - 1][-1].next = new_node
+        else:
+            self.head = new_node
+        block.insert(offset, new_node)
+        new_node.block = block
         self.length += 1
+        if len(block) <= BLOCK_SIZE:
+            self._tree_add(block_index, 1)
+            return new_node
+
+        # Split a full block in two, so finding a node in its block stays O(1)
+        half = block[BLOCK_SIZE // 2:]
+        del block[BLOCK_SIZE // 2:]
+        for node in half:
+            node.block = half
+        self._blocks.insert(block_index + 1, half)
+        self._block_index = {id(block): i for i, block in enumerate(self._blocks)}
+        self._rebuild_tree()
+        return new_node
 
     def remove(self, index):
         """Removes a specified node at the index"""
-        if self.head is None:
+        if not 0 <= index < self.length:
             return None
-        if index == 0:
-            removed = self.head
-            self.head = self.head.next
-            self.length -= 1
-            return removed.task
-        current = self.head
-        for _ in range(index - 1):
-            if current.next is None:
-                return None
-            current = current.next
-        if current.next is None:
-            return None
-        removed = current.next
-        current.next = current.next.next
+        return self._remove_at(*self._locate(index))
+
+    def remove_node(self, node):
+        """Removes a node of this list, found through its block instead of its position"""
+        return self._remove_at(*self._find(node))
+
+    def index_of(self, node):
+        """Returns the position of a node of this list in O(log n)"""
+        block_index, offset = self._find(node)
+        # Sum the sizes of the blocks before it in the Fenwick tree
+        tree = self._tree
+        i = block_index
+        while i > 0:
+            offset += tree[i]
+            i -= i & -i
+        return offset
+
+    def _find(self, node):
+        """Finds the block holding a node and the offset of the node inside that block"""
+        block_index = self._block_index[id(node.block)]
+        # A block holds at most BLOCK_SIZE nodes, so finding the node in it is O(1)
+        offset = next(i for i, other in enumerate(node.block) if other is node)
+        return block_index, offset
+
+    def _remove_at(self, block_index, offset):
+        """Unlinks the node at an offset of a block and returns its task"""
+        block = self._blocks[block_index]
+        removed = block[offset]
+
+        # Find the previous node to unlink the removed one from the chain
+        if offset > 0:
+            previous = block[offset - 1]
+        elif block_index > 0:
+            previous = self._blocks[block_index - 1][-1]
+        else:
+            previous = None
+
+        if previous is None:
+            self.head = removed.next
+        else:
+            previous.next = removed.next
+        if removed is self.tail:
+            self.tail = previous
+
+        del block[offset]
+        if block:
+            self._tree_add(block_index, -1)
+        else:
+            del self._blocks[block_index]
+            self._block_index = {id(block): i for i, block in enumerate(self._blocks)}
+            self._rebuild_tree()
         self.length -= 1
         return removed.task
 
     def get(self, index):
         """Gets the specific node at the index"""
-        if self.head is None:
+        if not 0 <= index < self.length:
             return None
+        block_index, offset = self._locate(index)
+        return self._blocks[block_index][offset].task
+
+    def _locate(self, index):
+        """Finds the block holding the index and the offset inside that block"""
+        tree = self._tree
+        position = 0
+        step = 1 << (len(tree) - 1).bit_length()
+        while step:
+            following = position + step
+            if following < len(tree) and tree[following] <= index:
+                position = following
+                index -= tree[following]
+            step >>= 1
+        return position, index
+
+    def _tree_add(self, block_index, delta):
+        """Adds delta to the size of a block in the Fenwick tree"""
+        tree = self._tree
+        i = block_index + 1
+        while i < len(tree):
+            tree[i] += delta
+            i += i & -i
+
+    def _tree_append(self, size):
+        """Adds the size of a new last block to the Fenwick tree"""
+        tree = self._tree
+        i = len(tree)
+        total = size
+        j = i - 1
+        stop = i - (i & -i)
+        while j > stop:
+            total += tree[j]
+            j -= j & -j
+        tree.append(total)
+
+    def _rebuild_tree(self):
+        """Rebuilds the Fenwick tree after a block was dropped"""
+        tree = [0] + [len(block) for block in self._blocks]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def block_count(self):
+        """Returns the number of blocks the tasks are kept in"""
+        return len(self._blocks)
+
+    def nodes(self):
+        """Yields the nodes from the head"""
+        current = self.head
+        while current is not None:
+            yield current
+            current = current.next
+
+    def __iter__(self):
         current = self.head
-        for _ in range(index):
-            if current.next is None:
-                return None
+        while current is not None:
+            yield current.task
             current = current.next
-        return current.task
 
     def __len__(self):
         return self.length
 
+# Tasks share one date object per distinct due date
+_dates = {}
+
+def _intern_date(due_date):
+    """Returns the shared date object equal to due_date"""
+    if not due_date:
+        return due_date
+    return _dates.setdefault(due_date, due_date)
+
 class Task:
-    """Defines a Task with priority and due date validation"""
+    """
+    Defines a Task with priority and due date validation
+
+    Tasks use __slots__ instead of a __dict__, and share status strings (interned)
+    and due date objects with other tasks, to keep large lists small in memory.
+    Setting title, description, status or due_date marks the task's saved row dirty,
+    while priority changes go through heap_update() and edit_task().
+    """
+    __slots__ = ("_title", "_description", "_status", "id", "priority", "_due_date", "row")
+
     def __init__(self, title, description, priority, due_date=None, allow_past_dates=False):
-        self.title = title
-        self.description = description
-        self.status = "To Do"
+        self._title = title
+        self._description = description
+        self._status = "To Do"
+        self.id = None  # Assigned once the task is stored in the list, and kept when saved
+        self.row = None  # Line of the task in the saved todo file, None until saved
 
         # Ensure priority is a positive integer
         if not isinstance(priority, int) or priority < 1:
@@ -109,7 +363,20 @@ class Task:
             if not allow_past_dates and due_date < date.today():
                 raise ValueError("Due date cannot be in the past")
 
-        self.due_date = due_date
+        self._due_date = _intern_date(due_date)
+
+    @classmethod
+    def from_trusted(cls, title, description, priority, status, due_date):
+        """Creates a Task from data that was already validated, like a saved file"""
+        task = cls.__new__(cls)
+        task._title = title
+        task._description = description
+        task._status = sys.intern(status)
+        task.id = None
+        task.row = None
+        task.priority = priority
+        task._due_date = _intern_date(due_date)
+        return task
 
     # Add comparison methods for priority-based comparison
     def __lt__(self, other):
@@ -124,9 +391,92 @@ class Task:
     def __str__(self):
         return f"Task(title={self.title}, priority={self.priority}, status={self.status})"
 
+def _tracked_field(slot):
+    """Returns a property reading a Task slot, whose setter marks the task dirty"""
+    def set_field(task, value):
+        slot.__set__(task, value)
+        if task.row is not None:
+            _dirty_rows.add(task.row)
+    return property(slot.__get__, set_field)
+
+for _field in ("title", "description", "status", "due_date"):
+    setattr(Task, _field, _tracked_field(Task.__dict__["_" + _field]))
+
+class TaskTable:
+    """
+    Defines a column-oriented (struct of arrays) store for many tasks
+
+    Priorities, due date ordinals (0 for none) and ids live in typed arrays and
+    statuses are codes into a shared list, so a row costs a few bytes plus its two
+    strings instead of a whole object. Rows are turned into Tasks when accessed.
+    """
+    def __init__(self, task_iter=()):
+        self.titles = []
+        self.descriptions = []
+        self.priorities = array("I")
+        self.due_dates = array("i")
+        self.ids = array("q")
+        self.status_codes = array("H")
+        self.statuses = []
+        self._status_code = {}
+        for task in task_iter:
+            self.append(task)
+
+    def append(self, task):
+        """Adds a task as a new row"""
+        code = self._status_code.get(task.status)
+        if code is None:
+            code = self._status_code[task.status] = len(self.statuses)
+            self.statuses.append(task.status)
+        self.titles.append(task.title)
+        self.descriptions.append(task.description)
+        self.priorities.append(task.priority)
+        self.due_dates.append(task.due_date.toordinal() if task.due_date else 0)
+        self.ids.append(task.id or 0)
+        self.status_codes.append(code)
+
+    def __getitem__(self, index):
+        ordinal = self.due_dates[index]
+        task = Task.from_trusted(self.titles[index], self.descriptions[index],
+                                 self.priorities[index], self.statuses[self.status_codes[index]],
+                                 date.fromordinal(ordinal) if ordinal else None)
+        task.id = self.ids[index] or None
+        return task
+
+    def __iter__(self):
+        for index in range(len(self.titles)):
+            yield self[index]
+
+    def __len__(self):
+        return len(self.titles)
+
+class PriorityQueue(list):
+    """
+    Defines a list-based min heap that remembers where each task is stored
+
+    The heap functions keep positions (keyed by the identity of the task) up to
+    date, so a specific task can be found, removed or re-prioritized in O(log n)
+    without scanning the list. A plain list still works with the heap functions.
+    """
+    def __init__(self, items=()):
+        super().__init__()
+        self.positions = {}
+        for item in items:
+            heap_push(self, item)
+
+    def remove(self, value):
+        """Removes a specific task while keeping the heap property"""
+        heap_remove(self, value)
+
+    def __contains__(self, item):
+        return id(item) in self.positions
+
 def heap_push(heap, item):
     """Adds an item to the heap and then maintains the heap property"""
     heap.append(item)
+    positions = getattr(heap, "positions", None)
+    if positions is not None:
+        positions[id(item)] = len(heap) - 1
     _heap_up(heap, len(heap) - 1)
 
 def heap_pop(heap):
@@ -134,45 +484,519 @@ def heap_pop(heap):
     if not heap:
         return None
 
+    positions = getattr(heap, "positions", None)
     if len(heap) == 1:
-        return heap.pop()
+        result = heap.pop()
+        if positions is not None:
+            del positions[id(result)]
+        return result
 
     result = heap[0]
     heap[0] = heap.pop()  # Move last element to root
+    if positions is not None:
+        del positions[id(result)]
+        positions[id(heap[0])] = 0
     if heap:  # Only heapify if there are elements remaining
         _heap_down(heap, 0)
     return result
 
+def heap_remove(heap, item):
+    """Removes a specific item (not just an equal one) from the heap in O(log n)"""
+    positions = getattr(heap, "positions", None)
+    if positions is not None:
+        if id(item) not in positions:
+            raise ValueError("Task is not in the priority queue")
+        index = positions.pop(id(item))
+    else:
+        index = next((i for i, other in enumerate(heap) if other is item), None)
+        if index is None:
+            raise ValueError("Task is not in the priority queue")
+
+    last = heap.pop()
+    if index < len(heap):
+        # Fill the hole with the last item and move it to where it belongs
+        heap[index] = last
+        if positions is not None:
+            positions[id(last)] = index
+        _heap_up(heap, index)
+        if heap[index] is last:  # It did not move up, so it may need to move down
+            _heap_down(heap, index)
+    return item
+
+def heap_decrease_key(heap, item, priority):
+    """Lowers the priority number of an item in the heap (moves it towards the top)"""
+    if priority > item.priority:
+        raise ValueError("New priority must not be larger than the current one")
+    item.priority = priority
+    _heap_up(heap, _heap_position(heap, item))
+
+def heap_increase_key(heap, item, priority):
+    """Raises the priority number of an item in the heap (moves it towards the bottom)"""
+    if priority < item.priority:
+        raise ValueError("New priority must not be smaller than the current one")
+    item.priority = priority
+    _heap_down(heap, _heap_position(heap, item))
+
+def heap_update(heap, item, priority):
+    """Changes the priority of an item in the heap in either direction"""
+    if priority < item.priority:
+        heap_decrease_key(heap, item, priority)
+    else:
+        heap_increase_key(heap, item, priority)
+
+def _heap_position(heap, item):
+    """Finds the index of a specific item in the heap"""
+    positions = getattr(heap, "positions", None)
+    if positions is not None:
+        if id(item) not in positions:
+            raise ValueError("Task is not in the priority queue")
+        return positions[id(item)]
+    for i, other in enumerate(heap):
+        if other is item:
+            return i
+    raise ValueError("Task is not in the priority queue")
+
+def heapify(heap):
+    """Turns a list into a heap in O(n) by bubbling down every parent"""
+    # Record the positions once at the end instead of on every move
+    positions = getattr(heap, "positions", None)
+    if positions is not None:
+        heap.positions = None
+    for index in reversed(range(len(heap) // 2)):
+        _heap_down(heap, index)
+    if positions is not None:
+        positions.clear()
+        positions.update(zip(map(id, heap), range(len(heap))))
+        heap.positions = positions
+
 def _heap_up(heap, index):
-    """Maintains the heap property of the heap, bubbles up items"""
+    """Maintains the heap property of the heap, bubbles up items, returns where it stopped"""
+    positions = getattr(heap, "positions", None)
     while index > 0:
         parent = (index - 1) // 2
         if heap[parent] > heap[index]:
             heap[parent], heap[index] = heap[index], heap[parent]
+            if positions is not None:
+                positions[id(heap[parent])] = parent
+                positions[id(heap[index])] = index
             index = parent
         else:
             break
+    return index
 
 def _heap_down(heap, index):
-    """Maintains the heap property of the heap, bubbles down items"""
+    """Maintains the heap property of the heap, bubbles down items, returns where it stopped"""
     if not heap:  # Safety check
-        return
+        return index
 
+    # Move smaller children up into the hole and drop the item in at the end,
+    # instead of swapping the item one level at a time
+    positions = getattr(heap, "positions", None)
+    size = len(heap)
+    item = heap[index]
     while True:
-        smallest = index
-        left = 2 * index + 1
-        right = 2 * index + 2
+        child = 2 * index + 1
+        if child >= size:
+            break
+        right = child + 1
+        if right < size and heap[right] < heap[child]:
+            child = right
+        if not heap[child] < item:
+            break
 
-        if left < len(heap) and heap[left] < heap[smallest]:
-            smallest = left
-        if right < len(heap) and heap[right] < heap[smallest]:
-            smallest = right
+        heap[index] = heap[child]
+        if positions is not None:
+            positions[id(heap[index])] = index
+        index = child
 
-        if smallest == index:
-            break
+    heap[index] = item
+    if positions is not None:
+        positions[id(item)] = index
+    return index
+
+def _tie_key(task):
+    """Orders tasks of equal priority by due date (none last), then insertion order"""
+    return (task.due_date or date.max, task.id if task.id is not None else 0)
+
+def _priority_key(task):
+    """Orders tasks by priority, due date (none last), then insertion order"""
+    return (task.priority, task.due_date or date.max, task.id if task.id is not None else 0)
+
+def iter_by_priority(heap, limit=None):
+    """
+    Yields the tasks of a heap by (priority, due date, insertion order)
+
+    The heap is read, not changed. For a limit that is small next to the heap, a
+    frontier heap holds the positions whose parents were already yielded, so the
+    first k tasks cost O(k log k) instead of a full sort; tasks of one priority come
+    out together and only that group is sorted. Listing (nearly) everything is
+    cheaper as one sort. The heap must not change while iterating.
+    """
+    if limit is None or limit * 8 >= len(heap):
+        yield from sorted(heap, key=_priority_key)[:limit]
+        return
+    yield from islice(walk_by_priority(heap), max(limit, 0))
+
+def walk_by_priority(heap):
+    """
+    Yields the tasks of a heap by (priority, due date, insertion order), reading
+    only as far as the caller does: one priority group is sorted at a time
+    """
+    if not heap:
+        return
+    frontier = [(heap[0].priority, 0)]  # (priority, position in heap)
+    group = []
+    while frontier:
+        index = heap_pop(frontier)[1]
+        task = heap[index]
+        if group and task.priority != group[0].priority:
+            yield from sorted(group, key=_tie_key)
+            group = []
+        group.append(task)
+        for child in (2 * index + 1, 2 * index + 2):
+            if child < len(heap):
+                heap_push(frontier, (heap[child].priority, child))
+    yield from sorted(group, key=_tie_key)
+
+# Days added to the urgency of a task without a due date
+URGENCY_NO_DUE_DATE = 30
+
+def urgency(task, today=None):
+    """Returns the priority plus the days until the due date (lower is more urgent)"""
+    if task.due_date is None:
+        return task.priority + URGENCY_NO_DUE_DATE
+    today = today or date.today()
+    return task.priority + (task.due_date - today).days
+
+def top_k(k, key=None, heap=None):
+    """
+    Returns the k best tasks of the priority queue without changing it
+
+    Without a key this is the priority order of iter_by_priority(). With a key,
+    like urgency, the tasks are copied into a heap of (key, position, task) built
+    with heapify() and k of them are popped, which is O(n + k log n).
+    """
+    heap = priority_queue if heap is None else heap
+    if key is None:
+        return list(iter_by_priority(heap, k))
+
+    ranked = [(key(task), position, task) for position, task in enumerate(heap)]
+    heapify(ranked)
+    best = []
+    while ranked and len(best) < k:
+        best.append(heap_pop(ranked)[2])
+    return best
+
+TIME_FRAMES = ["overdue", "today", "tomorrow", "week", "month"]
+
+def _time_frame_bounds(time_frame, today):
+    """Returns the first and last due date of a time frame, None if it is open-ended"""
+    tomorrow = today + timedelta(days=1)
+    bounds = {
+        "overdue": (None, today - timedelta(days=1)),
+        "today": (today, today),
+        "tomorrow": (tomorrow, tomorrow),
+        "week": (today, today + timedelta(weeks=1)),
+        "month": (today, today + timedelta(days=30))
+    }
+    return bounds.get(time_frame)
+
+class StatusIndex:
+    """
+    Defines an index from status to the tasks that have it
+
+    Statuses are matched case-insensitively. Each status maps to a dict keyed by task
+    identity, so listing statuses, counting them and filtering by one is O(1)/O(k).
+    """
+    def __init__(self):
+        self._buckets = {}  # Lower case status to {task identity: task}
+        self._names = {}  # Lower case status to the spelling shown to the user
+
+    def add(self, task):
+        """Adds a task under its current status"""
+        key = task.status.lower()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = {}
+            self._names[key] = task.status
+        bucket[id(task)] = task
+
+    def extend(self, task_iter):
+        """Adds many tasks"""
+        for task in task_iter:
+            self.add(task)
+
+    def discard(self, task):
+        """Removes a task, which must still have the status it was added with"""
+        key = task.status.lower()
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.pop(id(task), None) is None:
+            return
+        if not bucket:
+            del self._buckets[key]
+            del self._names[key]
+
+    def statuses(self):
+        """Returns (status, number of tasks) for every status in use"""
+        return sorted((self._names[key], len(bucket)) for key, bucket in self._buckets.items())
+
+    def tasks_with(self, status):
+        """Returns the tasks with the given status, ignoring case"""
+        return list(self._buckets.get(status.lower(), {}).values())
+
+    def count(self, status):
+        """Returns the number of tasks with the given status, ignoring case"""
+        return len(self._buckets.get(status.lower(), ()))
+
+    def identities(self, status):
+        """Returns the identities of the tasks with the given status, for membership tests"""
+        return self._buckets.get(status.lower(), {}).keys()
+
+class DueDateIndex:
+    """
+    Defines a sorted index of the tasks that have a due date
+
+    Keys are (due date ordinal, insertion number) pairs kept in order with bisect,
+    so the tasks due within a range of dates are found in O(log n + k). When given
+    a StatusIndex, done tasks are left out of the overdue tasks by identity instead
+    of comparing status strings.
+    """
+    def __init__(self, statuses=None):
+        self.status_index = statuses
+        self._keys = []
+        self._tasks = []
+        self._key_of = {}  # Task identity to its key, to find it again for removal
+        self._counter = 0
+        self._pending = []  # (key, task) added since the arrays were last sorted
+
+    def _make_key(self, task):
+        """Creates the key of a task and remembers it"""
+        key = (task.due_date.toordinal(), self._counter)
+        self._counter += 1
+        self._key_of[id(task)] = key
+        return key
+
+    def add(self, task):
+        """Adds a task to the index if it has a due date"""
+        if task.due_date is None:
+            return
+        # Added tasks wait in a buffer that is merged in by the next lookup, so
+        # adding many tasks in a row does not shift the arrays every time
+        self._pending.append((self._make_key(task), task))
 
-        heap[index], heap[smallest] = heap[smallest], heap[index]
-        index = smallest
+    def extend(self, task_iter):
+        """Adds many tasks"""
+        self._pending.extend((self._make_key(task), task) for task in task_iter if task.due_date)
+
+    def _merge_pending(self):
+        """Sorts the buffered tasks into the arrays"""
+        if not self._pending:
+            return
+        if len(self._pending) <= 64:
+            # A few tasks are cheaper to put in place one at a time than to merge in
+            for key, task in self._pending:
+                index = bisect_left(self._keys, key)
+                self._keys.insert(index, key)
+                self._tasks.insert(index, task)
+            self._pending = []
+            return
+        entries = list(zip(self._keys, self._tasks))
+        entries.extend(self._pending)
+        # Both parts are already mostly sorted runs, which sort() merges in about O(n)
+        entries.sort(key=lambda entry: entry[0])
+        self._keys = [key for key, _ in entries]
+        self._tasks = [task for _, task in entries]
+        self._pending = []
+
+    def discard(self, task):
+        """Removes a task from the index if it is in it"""
+        key = self._key_of.pop(id(task), None)
+        if key is None:
+            return
+        self._merge_pending()
+        index = bisect_left(self._keys, key)
+        del self._keys[index]
+        del self._tasks[index]
+
+    def positions(self, start, end):
+        """Returns the (low, high) slice of the sorted tasks due from start to end, both included"""
+        self._merge_pending()
+        low = 0 if start is None else bisect_left(self._keys, (start.toordinal(),))
+        high = len(self._keys) if end is None else \
+            bisect_left(self._keys, (end.toordinal() + 1,))
+        return low, high
+
+    def between(self, start=None, end=None):
+        """Returns the tasks due from start to end (both included) by due date"""
+        low, high = self.positions(start, end)
+        return self._tasks[low:high]
+
+    def time_frame(self, time_frame, today=None):
+        """Returns the same (filtered tasks, overdue tasks) as get_time_frame_tasks()"""
+        today = today or date.today()
+        bounds = _time_frame_bounds(time_frame, today)
+        if bounds is None:
+            return [], []
+        found = self.between(*bounds)
+        if time_frame == "overdue":
+            return [], self._not_done(found)
+        return found, []
+
+    def _not_done(self, found):
+        """Leaves out the tasks with the status done"""
+        if self.status_index is not None:
+            done = self.status_index.identities("done")
+            if not done:
+                return found
+            return [task for task in found if id(task) not in done]
+        return [task for task in found if task.status.lower() != "done"]
+
+    def all_time_frames(self, today=None):
+        """Groups the tasks of every time frame with a single pass over the index"""
+        today = (today or date.today()).toordinal()
+        groups = {time_frame: [] for time_frame in TIME_FRAMES}
+        low, high = self.positions(None, date.fromordinal(today + 30))
+        overdue = bisect_left(self._keys, (today,), low, high)
+        groups["overdue"] = self._not_done(self._tasks[low:overdue])
+        for (ordinal, _), task in zip(self._keys[overdue:high], self._tasks[overdue:high]):
+            if ordinal == today:
+                groups["today"].append(task)
+            elif ordinal == today + 1:
+                groups["tomorrow"].append(task)
+            if ordinal <= today + 7:
+                groups["week"].append(task)
+            groups["month"].append(task)
+        return groups
+
+    def __iter__(self):
+        self._merge_pending()
+        return iter(self._tasks)
+
+    def __len__(self):
+        return len(self._tasks) + len(self._pending)
+
+_WORD = re.compile(r"\w+")
+
+def _tokenize(text):
+    """Splits text into case-folded words"""
+    return _WORD.findall(text.casefold())
+
+class TextIndex:
+    """
+    Defines an inverted index from the words of titles and descriptions to tasks
+
+    Each word maps to {task identity: weight}, where a word in the title weighs 2
+    and in the description 1. Words are also kept sorted, so the words starting
+    with a prefix are a bisect away and a query term matches every word it starts.
+    """
+    def __init__(self):
+        self._postings = {}  # Word to {task identity: weight}
+        self._tasks = {}  # Task identity to task
+        self._words = []  # Sorted words, may still hold words no task has anymore
+        self._pending = []  # Words added since _words was last sorted
+
+    def add(self, task):
+        """Adds the words of a task's title and description"""
+        weights = dict.fromkeys(_tokenize(task.description), 1)
+        for word in _tokenize(task.title):
+            weights[word] = weights.get(word, 0) | 2
+        self._tasks[id(task)] = task
+        for word, weight in weights.items():
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = {}
+                self._pending.append(word)
+            posting[id(task)] = weight
+
+    def extend(self, task_iter):
+        """Adds many tasks"""
+        for task in task_iter:
+            self.add(task)
+
+    def discard(self, task):
+        """Removes a task if it is in the index"""
+        if self._tasks.pop(id(task), None) is None:
+            return
+        for word in set(_tokenize(task.title + " " + task.description)):
+            posting = self._postings.get(word)
+            if posting is not None:
+                posting.pop(id(task), None)
+                if not posting:
+                    del self._postings[word]
+
+    def _merge_pending(self):
+        """Sorts the words added since the last lookup into the word list"""
+        if not self._pending:
+            return
+        if len(self._pending) <= 64:
+            for word in self._pending:
+                self._words.insert(bisect_left(self._words, word), word)
+        else:
+            self._words = sorted(self._postings)
+        self._pending = []
+
+    def _matching(self, term):
+        """Returns (postings, factor) of the words starting with term; whole words count double"""
+        matching = []
+        index = bisect_left(self._words, term)
+        while index < len(self._words) and self._words[index].startswith(term):
+            word = self._words[index]
+            index += 1
+            if word in self._postings:
+                matching.append((self._postings[word], 2 if word == term else 1))
+        return matching
+
+    @staticmethod
+    def _scores(matching):
+        """Scores every task in the postings by its best matching word"""
+        scores = {}
+        for posting, factor in matching:
+            for identity, weight in posting.items():
+                score = weight * factor
+                if score > scores.get(identity, 0):
+                    scores[identity] = score
+        return scores
+
+    def search(self, text):
+        """
+        Yields the tasks matching every word of text, best match first, ties by
+        priority, due date and insertion order
+
+        Only the rarest word is scored in full, the others are looked up for the
+        tasks that are still in, so a rare word keeps the query fast even next to a
+        common one. Tasks are sorted one (score, priority) group at a time as the
+        results are read.
+        """
+        terms = set(_tokenize(text))
+        if not terms:
+            return
+        self._merge_pending()
+        matches = [(sum(len(posting) for posting, _ in matching), matching)
+                   for matching in map(self._matching, terms)]
+        matches.sort(key=lambda match: match[0])
+        totals = self._scores(matches[0][1])
+        for size, matching in matches[1:]:
+            if len(totals) * len(matching) < size:
+                found = {}
+                for identity, total in totals.items():
+                    best = max(posting.get(identity, 0) * factor for posting, factor in matching)
+                    if best:
+                        found[identity] = total + best
+            else:
+                scores = self._scores(matching)
+                found = {identity: total + scores[identity]
+                         for identity, total in totals.items() if identity in scores}
+            totals = found
+
+        groups = {}
+        for identity, total in totals.items():
+            task = self._tasks[identity]
+            groups.setdefault((-total, task.priority), []).append(task)
+        for key in sorted(groups):
+            yield from sorted(groups[key], key=_tie_key)
+
+    def __len__(self):
+        return len(self._tasks)
 
 def get_user_input() -> List[str]:
     """Gets the user input with priority and due date validation"""
@@ -204,248 +1028,2119 @@ def get_user_input() -> List[str]:
     return [title, description, priority, due_date]
 
 tasks = LinkedList()
-priority_queue = []
+priority_queue = PriorityQueue()
+_next_task_id = 1
+_journal_records = 0
+_journal_valid = False  # True once the journal on disk belongs to the current snapshot
+_journal_size = 0  # Bytes of the journal as this process last read or wrote it
+# The todo file as last loaded or saved, while row k of it holds the task with id k.
+# Rows of tasks that were not marked dirty are copied from it when saving.
+_saved_text = None
+_saved_line_ends = None  # Running total of line lengths, computed on the first save
+_dirty_rows = set()  # Rows of the saved todo file whose tasks were edited since
+_deleted_rows = {}  # Rows of the saved todo file whose tasks were deleted since, to their ids
+_loaded_next_id = 0  # Next id to hand out as saved in the file, 0 if it was not saved
+_task_nodes = None  # Task id to the node holding it, built when first needed
+_loaded_version = 0  # Version of the todo file when this process last loaded or saved it
+_rows_moved = False  # True once a task was deleted, so rows no longer match list positions
+_pending_snapshot = None  # (snapshot, checksum) opened by load_tasks but not decoded yet
+_database = None  # The open SqliteStorage in SQLite mode
+status_index = StatusIndex()
+due_index = DueDateIndex(status_index)
+text_index = None  # Built by the first search
+history = None  # The undo History, once enable_history() was called
 
-def load_tasks():
-    """Loads tasks from the file with due date support"""
-    if os.path.exists("todo_list.txt"):
-        with open("todo_list.txt", "r", encoding="utf-8") as file:
-            # Skip the header line
-            next(file)  # This skips the "Task,Description,Priority,Status,Due Date" line
-
-            for line in file:
-                parts = line.strip().split(", ")
-                if len(parts) == 5:
-                    title, description, priority, status, due_date_str = parts
-                    task = Task(title, description, int(priority),
-                                due_date_str if due_date_str else None,
-                                allow_past_dates=True)  # Allow past dates when loading from file
-                    task.status = status
-                    tasks.insert(task)
-                    heap_push(priority_queue, task)
-                elif len(parts) == 4:  # Backwards compatibility
-                    title, description, priority, status = parts
-                    task = Task(title, description, int(priority), allow_past_dates=True)
-                    task.status = status
-                    tasks.insert(task)
-                    heap_push(priority_queue, task)
-
-def save_tasks():
-    """Saves tasks to the file with due date, preserving the header"""
-    with open("todo_list.txt", "w", encoding="utf-8") as file:
-        # Write the header line first
-        file.write("Task, Description, Priority, Status, Due Date\n")
-        # Write all tasks
-        for i in range(len(tasks)):
-            task = tasks.get(i)
-            # Include due date in save format
-            due_date_str = task.due_date.strftime("%Y-%m-%d") if task.due_date else ""
-            file.write(\
-            f"{task.title}, {task.description}, {task.priority}, {task.status}, {due_date_str}\n")
+def clear_tasks():
+    """Forgets every task in memory, along with the indexes over them"""
+    global tasks, priority_queue, status_index, due_index, text_index, _pending_snapshot
+    global _database, _rows_moved, _task_nodes, _next_task_id, history
+    tasks = LinkedList()
+    priority_queue = PriorityQueue()
+    status_index = StatusIndex()
+    due_index = DueDateIndex(status_index)
+    text_index = None
+    _task_nodes = None
+    _next_task_id = 1
+    _pending_snapshot = None
+    if _database is not None:
+        _database.close()
+        _database = None
+    _forget_saved_text()
+    _rows_moved = False
+    if history is not None:
+        history = History()  # The versions hold tasks that are gone now
 
-def add_task():
-    """Adds a Task with a Title, Description, and Priority"""
-    title, description, priority, due_date = get_user_input()
-    task = Task(title, description, priority, due_date)
-    tasks.insert(task)
-    heap_push(priority_queue, task)
-    save_tasks()
-    print(f"Added task: {title}")
+def _index_task(task, indexes=None):
+    """Adds a task to the indexes (of the list by default), or puts it back after changing it"""
+    for index in indexes or (status_index, due_index):
+        index.add(task)
 
-def update_task():
-    """Updates a Task's Status, Priority, or Due Date"""
-    # Get the task index
-    try:
-        index = int(input("Enter the index of the task to update: "))
-    except ValueError:
-        print("Please enter a valid number")
-        return
+def _unindex_task(task, indexes=None):
+    """Takes a task out of the indexes (of the list by default) before it is changed or deleted"""
+    for index in indexes or (status_index, due_index):
+        index.discard(task)
 
-    # Verify task exists
-    task = tasks.get(index-1)
-    if not task:
-        print("Invalid task index.")
-        return
+def _link_task(task, task_list, queue, nodes, indexes=None):
+    """Adds a new task to the end of a task list, its id map if built, priority queue and indexes"""
+    node = task_list.insert(task)
+    if nodes is not None:
+        nodes[task.id] = node
+    heap_push(queue, task)
+    _index_task(task, indexes)
 
-    # Show update options
-    print("\nWhat would you like to update?")
-    print("1. Status")
-    print("2. Priority")
-    print("3. Due Date")
-    update_choice = input("Enter your choice (1-3): ")
+def _change_task(task, queue, status, priority, due_date, indexes=None):
+    """Changes the fields of a task, moving it within its priority queue and indexes"""
+    if priority is not None:
+        # Move the task within the priority queue to maintain heap property
+        heap_update(queue, task, priority)
+    if status is not None or due_date is not _UNCHANGED:
+        _unindex_task(task, indexes)
+        if status is not None:
+            task.status = sys.intern(status)
+        if due_date is not _UNCHANGED:
+            task.due_date = _intern_date(due_date)
+        _index_task(task, indexes)
 
-    if update_choice == "1":
-        # Update status
-        status = input("Enter the new status: ")
-        task.status = status
-        print(f"Updated task: {task.title} - Status: {status}")
+def _unlink_task(task, queue, indexes=None):
+    """Takes a task that was just removed from its list out of its priority queue and indexes"""
+    heap_remove(queue, task)
+    _unindex_task(task, indexes)
+    return task
 
-    elif update_choice == "2":
-        # Update priority
+def _mark_dirty(task):
+    """Marks a stored task as changed since the todo file was loaded or saved"""
+    if task.row is not None:
+        _dirty_rows.add(task.row)
+
+def _forget_saved_text(data=None):
+    """Replaces the saved todo file that unchanged rows are copied from"""
+    global _saved_text, _saved_line_ends
+    _saved_text = data
+    _saved_line_ends = None
+    _dirty_rows.clear()
+    _deleted_rows.clear()
+
+def _new_task_id():
+    """Hands out the next task id of this session"""
+    global _next_task_id
+    task_id = _next_task_id
+    _next_task_id += 1
+    return task_id
+
+_date_cache = {}
+
+def _parse_date(date_str):
+    """Parses a YYYY-MM-DD date, remembering dates that were seen before"""
+    due_date = _date_cache.get(date_str)
+    if due_date is None:
         try:
-            new_priority = int(input("Enter the new priority (1 is highest): "))
-            # Remove and re-add to priority queue to maintain heap property
-            priority_queue.remove(task)
-            task.priority = new_priority
-            heap_push(priority_queue, task)
-            print(f"Updated task: {task.title} - Priority: {new_priority}")
+            due_date = date.fromisoformat(date_str)
         except ValueError:
-            print("Invalid priority value. Please enter a number.")
-            return
+            try:
+                due_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+            except ValueError as e:
+                raise ValueError("Invalid date format. Use YYYY-MM-DD") from e
+        due_date = _date_cache[date_str] = _intern_date(due_date)
+    return due_date
 
-    elif update_choice == "3":
-        # Update due date
-        due_date_inpt = input("Enter new due date (YYYY-MM-DD) or press Enter to remove due date: ")
+# A ", " inside a field is saved as "\c " and a backslash as "\\", so fields split cleanly
+_ESCAPED = re.compile(r"\\([\\cnr])")
+_UNESCAPED = {"\\": "\\", "c": ",", "n": "\n", "r": "\r"}
 
-        if due_date_inpt:
-            try:
-                new_due_date = datetime.strptime(due_date_inpt, "%Y-%m-%d").date()
-                if new_due_date < date.today():
-                    print("Due date cannot be in the past")
-                    return
-                task.due_date = new_due_date
-                print(f"Updated task: {task.title} - Due Date: {new_due_date}")
-            except ValueError:
-                print("Invalid date format. Please use YYYY-MM-DD.")
-                return
-        else:
-            # Remove due date
-            task.due_date = None
-            print(f"Removed due date for task: {task.title}")
+def _escape_field(text):
+    """Escapes a field for the todo file, where it must stay within one line"""
+    if "\\" in text or ", " in text or "\n" in text or "\r" in text:
+        return text.replace("\\", "\\\\").replace(", ", "\\c ").replace("\n", "\\n") \
+            .replace("\r", "\\r")
+    return text
 
-    else:
-        print("Invalid choice.")
-        return
+def _unescape_field(text):
+    """Undoes _escape_field()"""
+    return _ESCAPED.sub(lambda match: _UNESCAPED[match.group(1)], text)
 
-    save_tasks()
+def _escaped(header):
+    """
+    Checks if a header line is one of a file with escaped fields, which came with the
+    Id column. Older files are read verbatim, backslashes included.
+    """
+    return header.startswith(HEADER[:-1])
 
-def delete_task():
-    """Removes a Task at a specific index"""
-    index = int(input("Enter the index of the task to delete: "))
-    if tasks.get(index-1):
-        task = tasks.remove(index-1)
+def _parse_task_line(line, escaped=True):
+    """Turns one line of the todo file into a Task, or None for malformed lines"""
+    # Only drop the line ending: a missing due date leaves the line ending in ", "
+    parts = line.rstrip("\r\n").split(", ")
+    if escaped and "\\" in line:
+        parts = [_unescape_field(part) for part in parts]
+    task_id = None
+    if len(parts) == 6:
+        title, description, priority, status, due_date_str, task_id = parts
+        task_id = int(task_id) if task_id else None
+        due_date = _parse_date(due_date_str) if due_date_str else None
+    elif len(parts) == 5:  # Saved before tasks had ids
+        title, description, priority, status, due_date_str = parts
+        due_date = _parse_date(due_date_str) if due_date_str else None
+    elif len(parts) == 4:  # Backwards compatibility
+        title, description, priority, status = parts
+        due_date = None
     else:
-        print("Invalid action.")
-        return
-    priority_queue.remove(task)
-    save_tasks()
-    print(f"Deleted task: {task.title}")
+        return None
 
-def get_time_frame_tasks(task_list, time_frame):
+    # Saved tasks were validated when they were created, and may be past due by now
+    priority = int(priority)
+    if priority < 1:
+        raise ValueError("Priority must be a positive integer (1 is highest)")
+    task = Task.from_trusted(title, description, priority, status, due_date)
+    task.id = task_id
+    return task
+
+# Binary snapshot layout: a header, one fixed-width record per task, then the text
+# of every title, description and status. Records point into the text by offset.
+BINARY_MAGIC = b"TODOBIN2"
+# magic, task count, checksum of the rest, next id to hand out
+_BINARY_HEADER = struct.Struct("<8sIII")
+# id, priority, due date ordinal (0 if none), then offset/length of title, description, status
+_BINARY_RECORD = struct.Struct("<IIiIIIIII")
+# Snapshots saved before tasks had ids, read with their row numbers as ids
+_BINARY_V1 = (b"TODOBIN1", struct.Struct("<8sII"), struct.Struct("<IiIIIIII"))
+
+class BinarySnapshot:
     """
-    Filters tasks based on specified time frame
-    Returns tasks that fall within the time frame and overdue tasks
+    Defines a read-only view of a binary snapshot file
+
+    The file is memory-mapped and a task is only decoded when it is accessed,
+    so opening a snapshot costs the same no matter how many tasks it holds.
     """
-    today = date.today()
+    def __init__(self, path):
+        self._file = open(path, "rb")  # pylint: disable=consider-using-with
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic = self._map[:len(BINARY_MAGIC)]
+        if magic == BINARY_MAGIC:
+            self._header, self._record = _BINARY_HEADER, _BINARY_RECORD
+            _, self.count, self.checksum, self.next_id = _BINARY_HEADER.unpack_from(self._map, 0)
+        elif magic == _BINARY_V1[0]:
+            self._header, self._record = _BINARY_V1[1:]
+            _, self.count, self.checksum = self._header.unpack_from(self._map, 0)
+            self.next_id = 0
+        else:
+            self.close()
+            raise ValueError(f"{path} is not a binary todo snapshot")
+        self._strings = self._header.size + self.count * self._record.size
+        self._cache = {}
 
-    # Calculate end dates for different time frames
-    time_frames = {
-        "today": today,
-        "tomorrow": today + timedelta(days=1),
-        "week": today + timedelta(weeks=1),
-        "month": today + timedelta(days=30),
-        "overdue": today
-    }
+    def _text(self, offset, length):
+        """Decodes one string from the text area"""
+        start = self._strings + offset
+        return self._map[start:start + length].decode("utf-8")
 
-    if time_frame not in time_frames:
-        return [], []
+    def __getitem__(self, index):
+        if not 0 <= index < self.count:
+            raise IndexError("snapshot index out of range")
+        task = self._cache.get(index)
+        if task is None:
+            fields = self._record.unpack_from(self._map, self._header.size
+                                              + index * self._record.size)
+            task_id = fields[0] if self._record is _BINARY_RECORD else 0
+            (priority, due_ordinal, title_offset, title_length, description_offset,
+             description_length, status_offset, status_length) = fields[-8:]
+            task = Task.from_trusted(self._text(title_offset, title_length),
+                                     self._text(description_offset, description_length),
+                                     priority, self._text(status_offset, status_length),
+                                     date.fromordinal(due_ordinal) if due_ordinal else None)
+            task.id = task_id or None
+            self._cache[index] = task
+        return task
 
-    end_date = time_frames[time_frame]
+    def __iter__(self):
+        for index in range(self.count):
+            yield self[index]
 
-    # Filter tasks based on time frame
-    filtered_tasks = []
-    overdue_tasks = []
+    def __len__(self):
+        return self.count
 
-    for task in task_list:
-        if task.due_date:
-            if time_frame == "overdue":
-                if task.due_date < today and task.status.lower() != "done":
-                    overdue_tasks.append(task)
-            elif time_frame == "today":
-                if task.due_date == today:
-                    filtered_tasks.append(task)
-            elif time_frame == "tomorrow":
-                if task.due_date == end_date:
-                    filtered_tasks.append(task)
-            else:  # week or month
-                if today <= task.due_date <= end_date:
-                    filtered_tasks.append(task)
+    def close(self):
+        """Unmaps and closes the snapshot file"""
+        self._map.close()
+        self._file.close()
 
-    return filtered_tasks, overdue_tasks
+def _encode_text(task_iter, version=0, next_id=0):
+    """Formats tasks as the comma separated todo file, header line included"""
+    lines = [_header(version, next_id)]
+    lines.extend(map(_task_line, task_iter))
+    return "".join(lines).encode("utf-8")
 
-def print_task_list(tasks_to_print, header):
-    """Helper function to print tasks in a consistent format"""
-    if tasks_to_print:
-        print(f"\n{header}:")
-        for i, task in enumerate(tasks_to_print, 1):
-            if task.due_date:
-                due_date_str = task.due_date.strftime("%Y-%m-%d")
-            else:
-                due_date_str = "No due date"
-            print(f"{i}. {task.title} - Status: {task.status} - "
-                  f"Priority: {task.priority} - Due: {due_date_str}")
-    else:
-        print(f"\nNo tasks found for {header.lower()}")
+def _header(version, next_id=0):
+    """Returns the header line of the todo file, stamped with a version unless it is 0"""
+    if not version:
+        return HEADER
+    next_id = f", Next Id {next_id}" if next_id else ""
+    return f"{HEADER[:-1]}, Version {version}{next_id}\n"
 
-def list_tasks():
-    """Prints out the Tasks with enhanced viewing options"""
-    if len(tasks) == 0:
-        print("ToDo list is empty.")
-    else:
-        print("\nTodo List Menu:")
+def _header_stamp(line):
+    """Returns the version and the next id in a header line, 0 for files saved without them"""
+    match = _VERSION.search(line)
+    if match is None:
+        return 0, 0
+    return int(match.group(1)), int(match.group(2) or 0)
+
+def _first_line(data):
+    """Decodes the header line of the bytes of a todo file"""
+    return data[:data.find(b"\n") + 1].decode("utf-8")
+
+@contextmanager
+def _file_lock(path, shared=False):
+    """
+    Holds an advisory lock for a file, so processes sharing it take turns to save
+
+    The lock is taken on path + ".lock", because saving replaces the file itself.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(path + ".lock", "a", encoding="utf-8") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _task_line(task):
+    """Formats one task as a line of the todo file"""
+    due_date_str = task.due_date.strftime("%Y-%m-%d") if task.due_date else ""
+    task_id = task.id if task.id is not None else ""
+    return (f"{_escape_field(task.title)}, {_escape_field(task.description)}, {task.priority}, "
+            f"{_escape_field(task.status)}, {due_date_str}, {task_id}\n")
+
+def _encode_binary(task_iter, next_id=0):
+    """Formats tasks as a binary snapshot"""
+    records = bytearray()
+    strings = bytearray()
+    statuses = {}  # Status text is shared by many tasks, so it is only stored once
+
+    def add_string(text):
+        raw = text.encode("utf-8")
+        strings.extend(raw)
+        return len(strings) - len(raw), len(raw)
+
+    count = 0
+    for task in task_iter:
+        if task.status not in statuses:
+            statuses[task.status] = add_string(task.status)
+        records.extend(_BINARY_RECORD.pack(
+            task.id or 0, task.priority, task.due_date.toordinal() if task.due_date else 0,
+            *add_string(task.title), *add_string(task.description), *statuses[task.status]))
+        count += 1
+
+    body = bytes(records + strings)
+    return _BINARY_HEADER.pack(BINARY_MAGIC, count, zlib.crc32(body), next_id) + body
+
+def _write_file(path, data):
+    """Writes a temporary file and swaps it in, so a crash never leaves half a file"""
+    temp_file = path + ".tmp"
+    with open(temp_file, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_file, path)
+
+def text_to_binary(text_path=TODO_FILE, binary_path=BINARY_FILE):
+    """Converts a comma separated todo file into a binary snapshot"""
+    with open(text_path, "r", encoding="utf-8") as file:
+        escaped = _escaped(next(file, ""))
+        task_iter = (task for task in map(_parse_task_line, file, repeat(escaped))
+                     if task is not None)
+        _write_file(binary_path, _encode_binary(task_iter))
+
+def binary_to_text(binary_path=BINARY_FILE, text_path=TODO_FILE):
+    """Converts a binary snapshot into a comma separated todo file"""
+    snapshot = BinarySnapshot(binary_path)
+    try:
+        _write_file(text_path, _encode_text(snapshot))
+    finally:
+        snapshot.close()
+
+class TextStorage:
+    """Defines the comma separated todo file as a storage backend"""
+    journaled = True  # Changes can go to the journal between full saves
+
+    def initialize(self):
+        """Creates the todo list file with headers if it doesn't exist"""
+        if not os.path.exists(TODO_FILE):
+            with open(TODO_FILE, "w", encoding="utf-8") as file:
+                file.write(HEADER)
+
+    def lock(self):
+        """Returns a context that keeps other processes from saving"""
+        return _file_lock(TODO_FILE)
+
+    def load(self):
+        """Returns the saved tasks and the checksum of the file"""
+        with _file_lock(TODO_FILE, shared=True):
+            return self.read()
+
+    def read(self):
+        """Reads the saved tasks like load(), for a caller already holding the lock"""
+        global _loaded_version, _loaded_next_id
+        loaded, data = _read_text_file()
+        _loaded_version, _loaded_next_id = _header_stamp(_first_line(data))
+        # Rows can be copied by the next save if each of them became the task of its row
+        # and already has its id, which files saved before tasks had ids lack
+        rows = data.count(b"\n") - 1
+        copyable = data.endswith(b"\n") and len(loaded) == rows and \
+            all(task.id is not None for task in loaded)
+        _forget_saved_text(data if copyable else None)
+        return loaded, zlib.crc32(data)
+
+    def saved_elsewhere(self):
+        """Checks if another process saved the file since this one loaded or saved it"""
+        if not os.path.exists(TODO_FILE):
+            return False
+        with open(TODO_FILE, "r", encoding="utf-8") as file:
+            return _header_stamp(file.readline())[0] != _loaded_version
+
+    def merge(self):
+        """Puts the changes of this process on top of the file saved by another one"""
+        if _journal_valid:
+            # Every change of this process is in the journal the other process folded in
+            _reload_journaled()
+        else:
+            _merge_saved_changes()
+
+    def save(self, task_iter):
+        """Writes every task with the next version, returns the checksum of the file"""
+        global _loaded_version
+        version = _loaded_version + 1
+        if _saved_text is None:
+            data = _encode_text(task_iter, version, _next_task_id)
+        elif not _rows_moved and isinstance(task_iter, LinkedList):
+            data = _encode_text_edits(task_iter, version, _next_task_id)
+        else:
+            data = _encode_text_changes(task_iter, version, _next_task_id)
+        _write_file(TODO_FILE, data)
+        _loaded_version = version
+        _forget_saved_text(data)
+        return zlib.crc32(data)
+
+def _read_text_file(path=None):
+    """Returns the tasks of the todo file (or of the file at path) and its bytes"""
+    path = path or TODO_FILE
+    if not os.path.exists(path):
+        return [], b""
+    # Read the whole file at once and split it, instead of reading line by line
+    with open(path, "rb") as file:
+        data = file.read()
+    lines = data.decode("utf-8").split("\n")
+    # Skip the "Task, Description, Priority, Status, Due Date, Id" header line
+    escaped = _escaped(lines[0])
+    return [task for task in map(_parse_task_line, lines[1:], repeat(escaped))
+            if task is not None], data
+
+def _saved_rows():
+    """Returns the running total of the saved line lengths and the number of task rows"""
+    global _saved_line_ends
+    if _saved_line_ends is None:
+        _saved_line_ends = array("Q", accumulate(map(len, _saved_text.split(b"\n"))))
+    # Lines minus the header and the empty string after the last newline
+    return _saved_line_ends, len(_saved_line_ends) - 2
+
+def _saved_row(row):
+    """Returns the text of a row of the saved todo file, without the line ending"""
+    ends, _ = _saved_rows()
+    return _saved_text[ends[row - 1] + row:ends[row] + row].decode("utf-8").rstrip("\r")
+
+def _merge_saved_changes():
+    """
+    Rebuilds the list from the todo file as another process saved it, then puts the
+    changes of this process back on top
+
+    Edited and deleted tasks are found in the file by id. A task that the other
+    process changed or deleted meanwhile keeps the other process's version. Added
+    tasks go at the end, with new ids if the other process handed out theirs.
+    Without the rows as loaded (files without ids or with rows that do not parse),
+    changes can't be compared, and the edits of this process win.
+    """
+    global _next_task_id, _loaded_version, _loaded_next_id, _rows_moved, history
+    with open(TODO_FILE, "rb") as file:
+        data = file.read()
+    _loaded_version, _loaded_next_id = _header_stamp(_first_line(data))
+    own_rows = _dirty_rows | _deleted_rows.keys()
+    edited = {task.row: task for task in tasks if task.row in own_rows}
+    added = [task for task in tasks if task.row is None]
+    if _saved_text is None:
+        saved_rows = dict.fromkeys(own_rows)
+    else:
+        _, rows = _saved_rows()
+        escaped = _escaped(_first_line(_saved_text))
+        saved_rows = {row: _parse_task_line(_saved_row(row), escaped) for row in own_rows
+                      if row <= rows}
+
+    lines = data.decode("utf-8").split("\n")
+    current = _assign_ids(filter(None, map(_parse_task_line, lines[1:],
+                                           repeat(_escaped(lines[0])))))
+    found = {task.id: position for position, task in enumerate(current)}
+    for row, saved in sorted(saved_rows.items()):
+        if saved is None:
+            task_id = edited[row].id if row in edited else _deleted_rows.get(row)
+        else:
+            task_id = saved.id if saved.id is not None else row
+        position = found.get(task_id)
+        if position is None or saved is not None and \
+                _task_fields(current[position]) != _task_fields(saved):
+            if saved is not None or row in edited:
+                title = (saved or edited[row]).title
+                print(f"Kept the change another process made to '{title}'", file=sys.stderr)
+            continue
+        # Deleted tasks are not in edited, so they leave a hole
+        current[position] = edited.get(row)
+
+    merged = [task for task in current if task is not None]
+    # Tasks keep their Task objects, so the undo history still finds them in the list
+    loaded = {task.id: task for task in tasks if task.row is not None}
+    for position, task in enumerate(merged):
+        own = loaded.get(task.id)
+        if own is not None and own is not task:
+            own.title, own.description, own.priority, own.status, own.due_date, own.row = \
+                task.title, task.description, task.priority, task.status, task.due_date, task.row
+            merged[position] = own
+    next_id = max(_loaded_next_id, max(found, default=0) + 1)
+    for task in added:
+        task.id = max(task.id, next_id)
+        next_id = task.id + 1
+    merged.extend(added)
+    kept_history = history
+    clear_tasks()
+    history = kept_history
+    _store_loaded({task.id: task for task in merged})
+    _next_task_id = next_id
+    _rows_moved = True
+
+def _task_fields(task):
+    """Returns what a saved task holds apart from its id"""
+    return task.title, task.description, task.priority, task.status, task.due_date
+
+def _encode_text_edits(task_list, version=0, next_id=0):
+    """
+    Formats a list of tasks that were edited or added, but not deleted, since the
+    file was saved. Saved rows are still in place, so only the dirty rows and the
+    new tasks at the end are formatted, found by position in O(log n) each.
+    """
+    ends, rows = _saved_rows()
+    saved = memoryview(_saved_text)
+    pieces = [_header(version, next_id).encode("utf-8")]
+    start = ends[0] + 1
+    for row in sorted(row for row in _dirty_rows if row <= rows):
+        # Row k spans from ends[k - 1] + k to ends[k] + k + 1, counting the newlines before it
+        pieces.append(saved[start:ends[row - 1] + row])
+        pieces.append(_task_line(task_list.get(row - 1)).encode("utf-8"))
+        start = ends[row] + row + 1
+    pieces.append(saved[start:])
+    pieces.extend(_task_line(task_list.get(index)).encode("utf-8")
+                  for index in range(rows, len(task_list)))
+    return b"".join(pieces)
+
+def _encode_text_changes(task_iter, version=0, next_id=0):
+    """
+    Formats tasks as the todo file like _encode_text(), but copies each run of
+    unchanged rows from the saved file in one piece instead of formatting its tasks
+    """
+    ends, rows = _saved_rows()
+    saved = memoryview(_saved_text)
+
+    # Row k spans from ends[k - 1] + k to ends[k] + k + 1, counting the newlines before it
+    pieces = [_header(version, next_id).encode("utf-8")]
+    first = last = None  # Run of unchanged rows waiting to be copied
+    for task in task_iter:
+        row = task.row
+        if row is not None and row <= rows and row not in _dirty_rows:
+            if first is not None and row == last + 1:
+                last = row
+                continue
+            if first is not None:
+                pieces.append(saved[ends[first - 1] + first:ends[last] + last + 1])
+            first = last = row
+        else:
+            if first is not None:
+                pieces.append(saved[ends[first - 1] + first:ends[last] + last + 1])
+                first = None
+            pieces.append(_task_line(task).encode("utf-8"))
+    if first is not None:
+        pieces.append(saved[ends[first - 1] + first:ends[last] + last + 1])
+    return b"".join(pieces)
+
+class BinaryStorage:
+    """Defines the binary snapshot as a storage backend, starting from the todo file"""
+    journaled = True
+
+    def initialize(self):
+        """Creates the todo list file until there is a snapshot to start from"""
+        if not os.path.exists(BINARY_FILE):
+            TextStorage().initialize()
+
+    def lock(self):
+        """Returns a context that keeps other processes from saving"""
+        return _file_lock(BINARY_FILE)
+
+    def saved_elsewhere(self):
+        """Binary snapshots carry no version, so changes of other processes are not merged"""
+        return False
+
+    def load(self):
+        """Returns the snapshot, decoded lazily, and its checksum"""
+        if not os.path.exists(BINARY_FILE):
+            return TextStorage().load()
+        global _loaded_next_id
+        snapshot = BinarySnapshot(BINARY_FILE)
+        _loaded_next_id = snapshot.next_id
+        return snapshot, snapshot.checksum
+
+    def save(self, task_iter):
+        """Writes every task, returns the checksum of the snapshot"""
+        data = _encode_binary(task_iter, _next_task_id)
+        _write_file(BINARY_FILE, data)
+        return _BINARY_HEADER.unpack_from(data, 0)[2]
+
+# Tasks without a due date sort after every other task, like date.max
+_NO_DUE_DATE = "9999-12-31"
+_PRIORITY_ORDER = f"priority, COALESCE(due_date, '{_NO_DUE_DATE}'), id"
+
+class SqliteStorage:
+    """
+    Defines a todo list kept in a SQLite database as a storage backend
+
+    Rows are written as tasks change and committed together by save(), so saving
+    costs O(changes) instead of O(n). Until something needs the whole list, the
+    views query the database through its indexes on priority, due date and status
+    instead of loading every task. Ids are kept by the rows, so they never change.
+    """
+    journaled = False  # SQLite has its own write-ahead log
+    _COLUMNS = "id, title, description, priority, status, due_date"
+
+    def __init__(self, path=None):
+        self.path = path or DATABASE_FILE
+        self._connection = None
+
+    @property
+    def connection(self):
+        """Opens the database on first use, creating it from the todo file if it is new"""
+        if self._connection is None:
+            is_new = not os.path.exists(self.path)
+            # The write-behind thread commits, always while holding _store_lock
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA synchronous=NORMAL")
+            self._connection.executescript("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY,
+                    title TEXT NOT NULL,
+                    description TEXT NOT NULL,
+                    priority INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    status_key TEXT NOT NULL,
+                    due_date TEXT)
+            """)
+            if is_new:
+                # Start from the todo file in one transaction, before there are indexes to update
+                loaded = _assign_ids(_read_text_file()[0])
+                self._connection.executemany(
+                    "INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?)", map(self._row, loaded))
+            self._connection.executescript(f"""
+                CREATE INDEX IF NOT EXISTS tasks_priority ON tasks ({_PRIORITY_ORDER});
+                CREATE INDEX IF NOT EXISTS tasks_due_date ON tasks (due_date, id);
+                CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status_key, id);
+            """)
+        return self._connection
+
+    @staticmethod
+    def _row(task):
+        """Returns the column values of a task"""
+        return (task.id, task.title, task.description, task.priority, task.status,
+                task.status.lower(), task.due_date.isoformat() if task.due_date else None)
+
+    @staticmethod
+    def _task(row):
+        """Creates a Task from the columns of a row"""
+        task_id, title, description, priority, status, due_date_str = row
+        task = Task.from_trusted(title, description, priority, status,
+                                 _parse_date(due_date_str) if due_date_str else None)
+        task.id = task_id
+        return task
+
+    def _select(self, clause, parameters=()):
+        """Selects the task columns with a clause like "WHERE id = ?" and returns Tasks"""
+        cursor = self.connection.execute(f"SELECT {self._COLUMNS} FROM tasks {clause}", parameters)
+        return [self._task(row) for row in cursor]
+
+    def initialize(self):
+        """Creates the database and its indexes if they don't exist"""
+        _ = self.connection
+
+    def lock(self):
+        """SQLite locks the database itself, so there is nothing to hold"""
+        return nullcontext()
+
+    def saved_elsewhere(self):
+        """
+        Each change is written to its own row, so there is nothing to merge: changes
+        other processes made to other rows are kept, and the last write to a row wins
+        """
+        return False
+
+    def load(self):
+        """Returns the tasks, read from the database only when iterated, and no checksum"""
+        def rows():
+            for row in self.connection.execute(f"SELECT {self._COLUMNS} FROM tasks ORDER BY id"):
+                yield self._task(row)
+        return rows(), None
+
+    def write(self, operation, task):
+        """
+        Writes one added, updated or deleted task; it is committed by save(). An added
+        task without an id gets the next id of the database.
+        """
+        if operation == "delete":
+            self.connection.execute("DELETE FROM tasks WHERE id = ?", (task.id,))
+        elif operation == "add":
+            # A plain INSERT fails instead of replacing a row another process added
+            cursor = self.connection.execute("INSERT INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                             self._row(task))
+            task.id = cursor.lastrowid
+        else:
+            self.connection.execute("INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    self._row(task))
+
+    def save(self, task_iter):  # pylint: disable=unused-argument
+        """Commits the changes written so far, the rows are already up to date"""
+        self.connection.commit()
+
+    def task_at(self, index):
+        """Returns the task at a position in list order (0 is the first), None if invalid"""
+        if index < 0:
+            return None
+        found = self._select("ORDER BY id LIMIT 1 OFFSET ?", (index,))
+        return found[0] if found else None
+
+    def task_by_id(self, task_id):
+        """Returns the task with an id, None if there is none"""
+        found = self._select("WHERE id = ?", (task_id,))
+        return found[0] if found else None
+
+    def count(self):
+        """Returns the number of tasks"""
+        return self.connection.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+    def by_index(self):
+        """Returns every task in list order"""
+        return self._select("ORDER BY id")
+
+    def by_priority(self, limit=-1):
+        """Returns the first tasks by (priority, due date, insertion order), all by default"""
+        return self._select(f"ORDER BY {_PRIORITY_ORDER} LIMIT ?", (limit,))
+
+    def by_priority_with_index(self):
+        """Returns (index in the list, task) for every task by priority"""
+        cursor = self.connection.execute(
+            f"SELECT position, {self._COLUMNS} FROM "
+            f"(SELECT ROW_NUMBER() OVER (ORDER BY id) AS position, * FROM tasks) "
+            f"ORDER BY {_PRIORITY_ORDER}")
+        return [(row[0], self._task(row[1:])) for row in cursor]
+
+    def by_urgency(self, limit, today=None):
+        """Returns the first tasks by urgency(), then insertion order"""
+        today = (today or date.today()).isoformat()
+        return self._select(
+            "ORDER BY priority + COALESCE(julianday(due_date) - julianday(?), ?), id LIMIT ?",
+            (today, URGENCY_NO_DUE_DATE, limit))
+
+    def by_due_date(self):
+        """Returns every task by due date, tasks without a due date last"""
+        return self._select("ORDER BY due_date IS NULL, due_date, id")
+
+    def with_status(self, status):
+        """Returns the tasks with a status, ignoring case"""
+        return self._select("WHERE status_key = ? ORDER BY id", (status.lower(),))
+
+    def statuses(self):
+        """Returns (status, count) pairs, spelled like the first task with them"""
+        cursor = self.connection.execute(
+            "SELECT status, MIN(id), COUNT(*) FROM tasks GROUP BY status_key ORDER BY MIN(id)")
+        return [(status, count) for status, _, count in cursor]
+
+    def time_frame(self, time_frame, today=None):
+        """Returns the same (filtered tasks, overdue tasks) as get_time_frame_tasks()"""
+        bounds = _time_frame_bounds(time_frame, today or date.today())
+        if bounds is None:
+            return [], []
+        start_date, end_date = bounds
+        if time_frame == "overdue":
+            return [], self._select(
+                "WHERE due_date <= ? AND status_key != 'done' ORDER BY due_date, id",
+                (end_date.isoformat(),))
+        return self._select("WHERE due_date BETWEEN ? AND ? ORDER BY due_date, id",
+                            (start_date.isoformat(), end_date.isoformat())), []
+
+    def all_time_frames(self, today=None):
+        """Groups the tasks of every time frame"""
+        groups = {}
+        for time_frame in TIME_FRAMES:
+            filtered_tasks, overdue_tasks = self.time_frame(time_frame, today)
+            groups[time_frame] = filtered_tasks or overdue_tasks
+        return groups
+
+    def close(self):
+        """Closes the database without committing"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+STORAGE_BACKENDS = {"text": TextStorage, "binary": BinaryStorage, "sqlite": SqliteStorage}
+
+def get_storage():
+    """Returns the storage backend picked by TODO_FORMAT, the open database in SQLite mode"""
+    global _database
+    if SNAPSHOT_FORMAT not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown TODO_FORMAT {SNAPSHOT_FORMAT!r}, "
+                         f"use one of {', '.join(STORAGE_BACKENDS)}")
+    if SNAPSHOT_FORMAT != "sqlite":
+        return STORAGE_BACKENDS[SNAPSHOT_FORMAT]()
+    if _database is None:
+        _database = SqliteStorage()
+    return _database
+
+@contextmanager
+def _gc_paused():
+    """Pauses the garbage collector while a large number of tasks is created"""
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+def load_tasks():
+    """Loads tasks from the storage backend, then replays the journal"""
+    global _pending_snapshot
+    with _gc_paused():
+        snapshot, checksum = get_storage().load()
+    if isinstance(snapshot, list):
+        _store_snapshot(snapshot, checksum)
+    else:
+        # Tasks are decoded by _materialize_tasks() once something needs them
+        _pending_snapshot = (snapshot, checksum)
+
+def _materialize_tasks():
+    """Decodes the snapshot opened by load_tasks() into the task list"""
+    global _pending_snapshot
+    if _pending_snapshot is None:
+        return
+    (snapshot, checksum), _pending_snapshot = _pending_snapshot, None
+    _store_snapshot(snapshot, checksum)
+
+def _store_snapshot(snapshot, checksum):
+    """Stores the tasks of a snapshot along with the changes in its journal"""
+    with _gc_paused():
+        _store_loaded(_load_snapshot(snapshot, checksum))
+
+def _load_snapshot(snapshot, checksum):
+    """Returns the tasks of a snapshot by id, with the changes in its journal applied"""
+    global _next_task_id, _rows_moved
+    _rows_moved = False
+    loaded = {task.id: task for task in _assign_ids(snapshot)}
+    _next_task_id = max(_loaded_next_id, max(loaded, default=0) + 1)
+    if get_storage().journaled:
+        _replay_journal(loaded, checksum)
+    if hasattr(snapshot, "close"):
+        snapshot.close()
+    return loaded
+
+def _assign_ids(snapshot):
+    """
+    Numbers the rows of a snapshot and returns its tasks, giving an id to those
+    saved without one (all of them in files from before ids were saved) or with an
+    id taken by an earlier row
+    """
+    ordered = list(snapshot)
+    used = set()
+    top = 0
+    missing = False
+    for row, task in enumerate(ordered, 1):
+        task.row = row
+        if task.id is None or task.id in used:
+            missing = True
+        else:
+            used.add(task.id)
+            top = max(top, task.id)
+    if missing:
+        seen = set()
+        for task in ordered:
+            if task.id is None and not used:
+                task.id = task.row  # A file without any ids numbers its rows
+            elif task.id is None or task.id in seen:
+                top += 1
+                task.id = top
+            seen.add(task.id)
+    return ordered
+
+def _store_loaded(loaded):
+    """Adds the loaded tasks to the task list and the priority queue"""
+    tasks.extend(loaded.values())
+    # Building the heap in one go is O(n), pushing one task at a time is O(n log n)
+    priority_queue.extend(loaded.values())
+    heapify(priority_queue)
+    status_index.extend(loaded.values())
+    due_index.extend(loaded.values())
+    if text_index is not None:
+        text_index.extend(loaded.values())
+
+def save_tasks(merge=True):
+    """
+    Saves tasks to the file with due date, preserving the header. Without merge, a
+    file saved by another process is left alone and False is returned.
+    """
+    if _pending_snapshot is not None and _database is None:
+        return True  # Nothing was read, so nothing has changed since loading
+
+    storage = get_storage()
+    with storage.lock():
+        if storage.saved_elsewhere():
+            if not merge:
+                return False
+            storage.merge()
+        snapshot_crc = storage.save(tasks)
+        if storage.journaled:
+            # The snapshot now holds every change, so the journal starts over
+            _number_rows()
+            _reset_journal(snapshot_crc)
+    return True
+
+def _number_rows():
+    """Gives the tasks the rows they were just saved in"""
+    global _rows_moved
+    if _rows_moved:
+        for row, task in enumerate(tasks, 1):
+            task.row = row
+        _rows_moved = False
+        return
+    # Tasks are only ever appended, so only the new tasks at the end need a row
+    index = len(tasks) - 1
+    while index >= 0:
+        task = tasks.get(index)
+        if task.row is not None:
+            break
+        task.row = index + 1
+        index -= 1
+
+def _journal_entry(operation, task):
+    """Builds the journal payload for one change to a task"""
+    if operation == "delete":
+        return [operation, task.id]
+    due_date_str = task.due_date.strftime("%Y-%m-%d") if task.due_date else ""
+    return [operation, task.id, task.title, task.description,
+            task.priority, task.status, due_date_str]
+
+def append_journal(operation, task):
+    """
+    Appends one add/update/delete record to the journal and syncs it to disk
+
+    If another process saved or journaled since this one last read or wrote the
+    journal, the list is reloaded first and the change put back on top of it.
+    """
+    global _journal_records, _journal_size
+    if not _journal_valid:
+        # No journal for the current snapshot yet, so start one with a full save
+        save_tasks()
+        return
+
+    # A save of another process replaces the journal, so the record must not go in between
+    with _file_lock(TODO_FILE):
+        moved_on = get_storage().saved_elsewhere() or not os.path.exists(JOURNAL_FILE) or \
+            os.path.getsize(JOURNAL_FILE) != _journal_size
+        if moved_on and not _reload_journaled(operation, task):
+            return
+        if _journal_valid:
+            payload = json.dumps(_journal_entry(operation, task)).encode("utf-8")
+            record = f"{zlib.crc32(payload):08x} ".encode() + payload + b"\n"
+            with open(JOURNAL_FILE, "ab") as file:
+                file.write(record)
+                file.flush()
+                os.fsync(file.fileno())
+            _journal_size += len(record)
+            _journal_records += 1
+
+    if not _journal_valid:
+        # The other process saved without a journal, so the change needs a full save
+        save_tasks()
+    elif _journal_records >= JOURNAL_COMPACT_THRESHOLD:
+        compact_journal()
+
+def _reload_journaled(operation=None, task=None):
+    """
+    Reloads the todo file and the journal that another process moved on, for a
+    caller holding the lock, then puts the change this process made to task back on
+    top. Tasks keep their Task objects, and an added task gets a new id if the other
+    process handed out its id. Returns False if the task was deleted meanwhile.
+    """
+    global _next_task_id, _rows_moved, history
+    own = {kept.id: kept for kept in tasks if kept is not task}
+    kept_history = history
+    clear_tasks()
+    history = kept_history
+    with _gc_paused():
+        loaded = _load_snapshot(*get_storage().read())
+        for task_id, current in loaded.items():
+            kept = own.get(task_id)
+            if kept is not None:
+                kept.row = None  # Copying the fields must not mark its old row dirty
+                kept.title, kept.description, kept.priority, kept.status, kept.due_date = \
+                    _task_fields(current)
+                kept.row = current.row
+                loaded[task_id] = kept
+        applies = operation in (None, "add") or task.id in loaded
+        if operation == "add":
+            task.id = max(task.id, _next_task_id)
+            task.row = None
+            loaded[task.id] = task
+            _next_task_id = task.id + 1
+        elif operation == "update" and applies:
+            task.row = loaded[task.id].row
+            _mark_dirty(task)
+            loaded[task.id] = task
+        elif operation == "delete" and applies:
+            deleted = loaded.pop(task.id)
+            if deleted.row is not None:
+                _deleted_rows[deleted.row] = task.id
+            _rows_moved = True
+        _store_loaded(loaded)
+    if not applies:
+        print(f"Kept the change another process made to '{task.title}'", file=sys.stderr)
+    return applies
+
+def compact_journal():
+    """Folds the journal into the todo file"""
+    save_tasks()
+
+def _reset_journal(snapshot_crc):
+    """Starts an empty journal for the snapshot with the given checksum"""
+    global _journal_records, _journal_valid, _journal_size
+    _journal_records = 0
+    _journal_valid = JOURNAL_MODE
+    _journal_size = 0
+    if JOURNAL_MODE:
+        temp_file = JOURNAL_FILE + ".tmp"
+        header = f"# base {snapshot_crc:08x}\n".encode()
+        _journal_size = len(header)
+        with open(temp_file, "wb") as file:
+            file.write(header)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_file, JOURNAL_FILE)
+    elif os.path.exists(JOURNAL_FILE):
+        os.remove(JOURNAL_FILE)
+
+def _replay_journal(loaded, snapshot_crc):
+    """
+    Applies the journal records to the tasks loaded from the snapshot
+
+    The journal starts with the checksum of the snapshot it belongs to. A journal
+    left over from before the last full save doesn't match and is ignored, and a
+    record torn by a crash ends the replay and is cut off the file.
+    """
+    global _next_task_id, _journal_records, _journal_valid, _journal_size
+    _journal_records = 0
+    _journal_valid = False
+    _journal_size = 0
+    journal = _read_journal(JOURNAL_FILE, snapshot_crc)
+    if journal is None:
+        return
+    entries, valid_size = journal
+    _journal_valid = True
+    for entry in entries:
+        _apply_journal_entry(loaded, entry)
+    _journal_records = len(entries)
+
+    if valid_size < os.path.getsize(JOURNAL_FILE):
+        with open(JOURNAL_FILE, "r+b") as file:
+            file.truncate(valid_size)
+    _journal_size = valid_size
+    if loaded:
+        _next_task_id = max(_next_task_id, max(loaded) + 1)
+
+def _read_journal(path, snapshot_crc):
+    """
+    Returns the records of the journal at path up to the first torn one, and the
+    bytes they span, or None if there is no journal for the snapshot
+    """
+    if not os.path.exists(path):
+        return None
+    entries = []
+    with open(path, "rb") as file:
+        header = file.readline()
+        if header != f"# base {snapshot_crc:08x}\n".encode("utf-8"):
+            return None
+        valid_size = len(header)
+        for raw in file:
+            checksum, _, payload = raw.rstrip(b"\n").partition(b" ")
+            if not raw.endswith(b"\n") or checksum != f"{zlib.crc32(payload):08x}".encode():
+                break
+            entries.append(json.loads(payload))
+            valid_size += len(raw)
+    return entries, valid_size
+
+def _apply_journal_entry(loaded, entry, track_rows=True):
+    """
+    Applies a single journal record to the tasks keyed by id. With track_rows, the
+    rows it changes are noted for the next save of the todo file.
+    """
+    operation, task_id = entry[0], entry[1]
+    global _rows_moved
+    if operation == "delete":
+        task = loaded.pop(task_id, None)
+        if track_rows:
+            if task is not None and task.row is not None:
+                _deleted_rows[task.row] = task_id
+            _rows_moved = True
+        return
+    title, description, priority, status, due_date_str = entry[2:]
+    task = Task.from_trusted(title, description, priority, status,
+                             _parse_date(due_date_str) if due_date_str else None)
+    task.id = task_id
+    if operation == "add" or task_id not in loaded:
+        loaded[task_id] = task
+    else:
+        # Keep the position of the task in the list when it is updated
+        current = loaded[task_id]
+        if track_rows:
+            _mark_dirty(current)
+        current.priority, current.status, current.due_date = priority, status, task.due_date
+        current.title, current.description = title, description
+
+class WriteBehind:
+    """
+    Defines a background thread that saves the list shortly after it changes
+
+    Each change pushes the save back by delay seconds, so a burst of changes is
+    saved once. The thread saves while holding _store_lock, which the functions
+    that change tasks also hold, so it never sees a change half made.
+    """
+    def __init__(self, save, delay=WRITE_BEHIND_DELAY):
+        self._save = save
+        self.delay = delay
+        self._condition = threading.Condition()
+        self._due = None  # When the pending changes get saved, None if there are none
+        self._saving = False
+        self._error = None  # Raised by the next flush() if a background save failed
+        self._thread = None
+
+    def schedule(self):
+        """Saves the changes after delay seconds without another change"""
+        with self._condition:
+            self._due = time.monotonic() + self.delay
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="write-behind",
+                                                daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def _run(self):
+        """Waits for changes to settle, then saves them"""
+        while True:
+            with self._condition:
+                while self._due is None:
+                    self._condition.wait()
+                remaining = self._due - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+                self._due = None
+                self._saving = True
+            try:
+                with _store_lock:
+                    self._save()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                print(f"Saving failed: {e}", file=sys.stderr)
+                self._error = e
+            finally:
+                with self._condition:
+                    self._saving = False
+                    self._condition.notify_all()
+
+    def flush(self):
+        """Saves the pending changes now and returns once they are on disk"""
+        with self._condition:
+            while self._saving:
+                self._condition.wait()
+            pending, self._due = self._due is not None, None
+        if pending:
+            with _store_lock:
+                self._save()
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+_store_lock = threading.RLock()  # Held while tasks change and while they are saved
+_write_behind = WriteBehind(lambda: save_tasks())  # pylint: disable=unnecessary-lambda
+
+def flush():
+    """Waits until every change is saved, in write-behind mode"""
+    if WRITE_BEHIND:
+        _write_behind.flush()
+
+def _record_change(operation, task):
+    """Persists one change: a journal record, a save later in write-behind mode, or a save"""
+    if JOURNAL_MODE and get_storage().journaled:
+        append_journal(operation, task)
+    elif WRITE_BEHIND:
+        _write_behind.schedule()
+    else:
+        save_tasks()
+
+_UNCHANGED = object()  # Default of edit_task() for a due date that stays as it is
+
+def create_task(title, description, priority, due_date=None, status="To Do",
+                allow_past_dates=False):
+    """Creates a Task and stores it in the list, the priority queue and the indexes"""
+    task = Task(title, description, priority, due_date, allow_past_dates)
+    task.status = sys.intern(status)
+    return store_task(task)
+
+def store_task(task):
+    """Stores a new Task in the list, the priority queue and the indexes"""
+    with _store_lock:
+        database = _database_view(changing=True)
+        if database:
+            # Nothing is loaded yet in SQLite mode, so only the database gets the task
+            task.id = None
+            database.write("add", task)
+            return task
+        if _database is None:
+            task.id = _new_task_id()
+        else:
+            # The database hands out the id, so processes sharing it never use the same one
+            task.id = None
+            _database.write("add", task)
+        _link_task(task, tasks, priority_queue, _task_nodes)
+        if text_index is not None:
+            text_index.add(task)
+        _record_history("add", task, len(tasks) - 1)
+        return task
+
+def _write_through(operation, task):
+    """Writes a change to the database in SQLite mode, the next save commits it"""
+    if _database is not None:
+        _database.write(operation, task)
+
+def edit_task(task, status=None, priority=None, due_date=_UNCHANGED, allow_past_dates=False,
+              description=None):
+    """Changes the status, priority, due date (None removes it) and/or description of a Task"""
+    due_date = _check_edit(priority, due_date, allow_past_dates)
+    with _store_lock:
+        if _database_view(changing=True):
+            # Nothing is loaded yet in SQLite mode, so the row is the only copy to change
+            if description is not None:
+                task.description = description
+            if priority is not None:
+                task.priority = priority
+            if status is not None:
+                task.status = sys.intern(status)
+            if due_date is not _UNCHANGED:
+                task.due_date = _intern_date(due_date)
+            _database.write("update", task)
+            return task
+
+        if task not in priority_queue and _database is not None:
+            # A task read from the database before the change loaded the tasks
+            node = _id_map().get(task.id)
+            task = node.task if node is not None else task
+        if task not in priority_queue:
+            # The indexes would keep a deleted task that was edited after all
+            raise ValueError("The task is not in the list, it may have been deleted")
+        before = (task.priority, task.status, task.due_date, task.description)
+        _mark_dirty(task)
+        _change_task(task, priority_queue, status, priority, due_date)
+        if description is not None and description != task.description:
+            if text_index is not None:
+                text_index.discard(task)  # Indexed by the words of its old description
+            task.description = description
+            if text_index is not None:
+                text_index.add(task)
+        _write_through("update", task)
+        after = (task.priority, task.status, task.due_date, task.description)
+        if after != before:
+            _record_history("update", task, None, before, after)
+        return task
+
+def _check_edit(priority, due_date, allow_past_dates):
+    """Validates the changes of an edit before anything is changed, returns the due date"""
+    if priority is not None and (not isinstance(priority, int) or priority < 1):
+        raise ValueError("Priority must be a positive integer (1 is highest)")
+    if isinstance(due_date, str):
+        due_date = _parse_date(due_date) if due_date else None
+    if due_date not in (_UNCHANGED, None) and not allow_past_dates and due_date < date.today():
+        raise ValueError("Due date cannot be in the past")
+    return due_date
+
+def get_task(index):
+    """Returns the Task at a position (0 is the first), None if invalid"""
+    database = _database_view()
+    return database.task_at(index) if database else tasks.get(index)
+
+def get_task_by_id(task_id):
+    """Returns the Task with an id, None if there is none"""
+    database = _database_view()
+    if database:
+        return database.task_by_id(task_id)
+    node = _id_map().get(task_id)
+    return node.task if node is not None else None
+
+def _id_map():
+    """Returns the map from task id to node, building it on first use"""
+    global _task_nodes
+    if _task_nodes is None:
+        # Menus address tasks by position, so only lookups by id pay for the map
+        _task_nodes = {node.task.id: node for node in tasks.nodes()}
+    return _task_nodes
+
+def remove_task(index):
+    """Removes the Task at a position (0 is the first) from every structure, None if invalid"""
+    with _store_lock:
+        database = _database_view(changing=True)
+        if database:
+            task = database.task_at(index)
+            if task is not None:
+                database.write("delete", task)
+            return task
+        task = _forget_task(tasks.remove(index))
+        if task is not None:
+            _record_history("delete", task, index)
+        return task
+
+def remove_task_by_id(task_id):
+    """Removes the Task with an id from every structure, None if there is none"""
+    with _store_lock:
+        database = _database_view(changing=True)
+        if database:
+            task = database.task_by_id(task_id)
+            if task is not None:
+                database.write("delete", task)
+            return task
+        node = _id_map().get(task_id)
+        if node is None:
+            return None
+        position = tasks.index_of(node) if history is not None else None
+        task = _forget_task(tasks.remove_node(node))
+        _record_history("delete", task, position)
+        return task
+
+def _forget_task(task):
+    """Takes a task that was just unlinked from the list out of the other structures"""
+    global _rows_moved
+    if task is not None:
+        _rows_moved = True
+        if task.row is not None:
+            _deleted_rows[task.row] = task.id
+        if _task_nodes is not None:
+            del _task_nodes[task.id]
+        _unlink_task(task, priority_queue)
+        if text_index is not None:
+            text_index.discard(task)
+        _write_through("delete", task)
+    return task
+
+def _record_changes(changes):
+    """Persists (operation, task) changes made together, saving once for all of them"""
+    if JOURNAL_MODE and get_storage().journaled:
+        for operation, task in changes:
+            append_journal(operation, task)
+    elif changes:
+        _record_change(*changes[-1])
+
+def _restore_task(task, position):
+    """Puts a removed Task back at its position in every structure, with the same id"""
+    global _rows_moved
+    with _store_lock:
+        node = tasks.insert_at(position, task)
+        if _task_nodes is not None:
+            _task_nodes[task.id] = node
+        if task.row is not None and _deleted_rows.get(task.row) == task.id:
+            # Deleted since the last save, so its row of the saved file is still its own
+            del _deleted_rows[task.row]
+            _mark_dirty(task)
+        else:
+            task.row = None
+        _rows_moved = True
+        heap_push(priority_queue, task)
+        _index_task(task)
+        if text_index is not None:
+            text_index.add(task)
+        _write_through("add", task)
+        return task
+
+class Version:
+    """
+    Defines a version of the list in the undo history
+
+    A version holds the one change leading to it from its parent and shares the rest
+    of the list with it, so a change costs O(1) memory however long the list is.
+    Versions form a tree: a change made after undoing starts a new branch, and the
+    versions of the old branch stay reachable through the snapshots taken on them.
+    """
+    __slots__ = ("parent", "change", "depth", "child")
+
+    def __init__(self, parent=None, change=None):
+        self.parent = parent
+        self.change = change  # (operation, task, position, fields before, fields after)
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.child = None  # The version redo() goes to
+
+class History:
+    """
+    Defines the undo/redo history of the list and its named snapshots
+
+    Moving to another version undoes the changes up to the closest version both have
+    in common and redoes the changes down from it. Each change is undone or redone
+    with the same O(log n) operations that made it, so moving k versions costs
+    O(k log n) instead of copying or reloading the list.
+    """
+    def __init__(self):
+        self.current = Version()
+        self.snapshots = {}
+        self.replaying = False  # True while changes are undone or redone
+
+    def record(self, change):
+        """Adds a change that was just made to the list as a new version"""
+        self.current.child = Version(self.current, change)
+        self.current = self.current.child
+
+    def undo(self):
+        """Undoes the last change, returns the (operation, task) changes it made"""
+        if self.current.parent is None:
+            return []
+        return self.goto(self.current.parent)
+
+    def redo(self):
+        """Redoes the last undone change, returns the (operation, task) changes it made"""
+        if self.current.child is None:
+            return []
+        return self.goto(self.current.child)
+
+    def snapshot(self, name):
+        """Names the current version, to come back to it with restore()"""
+        self.snapshots[name] = self.current
+
+    def restore(self, name):
+        """Moves the list to a named version, returns the (operation, task) changes it made"""
+        if name not in self.snapshots:
+            raise ValueError(f"No snapshot named '{name}'")
+        return self.goto(self.snapshots[name])
+
+    def goto(self, version):
+        """Moves the list to another version, returns the (operation, task) changes it made"""
+        with _store_lock:  # A save in the background sees all of the move or none of it
+            return self._move(version)
+
+    def _move(self, version):
+        """Undoes and redoes the changes between the current version and another one"""
+        backward, forward = [], []
+        here, there = self.current, version
+        while here is not there:
+            if here.depth >= there.depth:
+                backward.append(here)
+                here = here.parent
+            else:
+                forward.append(there)
+                there = there.parent
+        applied = []
+        self.replaying = True
+        try:
+            for step in backward:
+                applied.append(_apply_change(step.change, undo=True))
+                step.parent.child = step  # So that redo() comes back down this branch
+                self.current = step.parent
+            for step in reversed(forward):
+                applied.append(_apply_change(step.change, undo=False))
+                step.parent.child = step
+                self.current = step
+        finally:
+            self.replaying = False
+        return [change for change in applied if change is not None]
+
+def _apply_change(change, undo):
+    """Undoes or redoes a change of the history, returns the (operation, task) it made or None"""
+    operation, task, position, before, after = change
+    if operation == "update":
+        if task not in priority_queue:
+            return None  # Another process deleted the task since
+        priority, status, due_date, description = before if undo else after
+        edit_task(task, status, priority, due_date, allow_past_dates=True,
+                  description=description)
+        return "update", task
+    if (operation == "add") == undo:
+        if remove_task_by_id(task.id) is None:
+            return None
+        return "delete", task
+    _restore_task(task, position)
+    return "add", task
+
+def _record_history(operation, task, position=None, before=None, after=None):
+    """Adds a change to the undo history, if there is one and the change is not a replay"""
+    if history is not None and not history.replaying:
+        history.record((operation, task, position, before, after))
+
+def enable_history():
+    """Starts keeping the undo history, in SQLite mode the first change loads the tasks"""
+    global history
+    history = History()
+    return history
+
+def add_task():
+    """Adds a Task with a Title, Description, and Priority"""
+    title, description, priority, due_date = get_user_input()
+    task = create_task(title, description, priority, due_date)
+    _record_change("add", task)
+    print(f"Added task: {title} (id {task.id})")
+
+def update_task():
+    """Updates a Task's Status, Priority, or Due Date"""
+    # Get the task index
+    try:
+        index = int(input("Enter the index of the task to update: "))
+    except ValueError:
+        print("Please enter a valid number")
+        return
+
+    # Verify task exists
+    task = get_task(index-1)
+    if not task:
+        print("Invalid task index.")
+        return
+
+    # Show update options
+    print("\nWhat would you like to update?")
+    print("1. Status")
+    print("2. Priority")
+    print("3. Due Date")
+    update_choice = input("Enter your choice (1-3): ")
+
+    if update_choice == "1":
+        # Update status
+        status = input("Enter the new status: ")
+        edit_task(task, status=status)
+        print(f"Updated task: {task.title} - Status: {status}")
+
+    elif update_choice == "2":
+        # Update priority
+        try:
+            new_priority = int(input("Enter the new priority (1 is highest): "))
+            if new_priority < 1:
+                print("Priority must be a positive integer (1 is highest)")
+                return
+            edit_task(task, priority=new_priority)
+            print(f"Updated task: {task.title} - Priority: {new_priority}")
+        except ValueError:
+            print("Invalid priority value. Please enter a number.")
+            return
+
+    elif update_choice == "3":
+        # Update due date
+        due_date_inpt = input("Enter new due date (YYYY-MM-DD) or press Enter to remove due date: ")
+
+        if due_date_inpt:
+            try:
+                new_due_date = datetime.strptime(due_date_inpt, "%Y-%m-%d").date()
+                if new_due_date < date.today():
+                    print("Due date cannot be in the past")
+                    return
+                edit_task(task, due_date=new_due_date)
+                print(f"Updated task: {task.title} - Due Date: {new_due_date}")
+            except ValueError:
+                print("Invalid date format. Please use YYYY-MM-DD.")
+                return
+        else:
+            # Remove due date
+            edit_task(task, due_date=None)
+            print(f"Removed due date for task: {task.title}")
+
+    else:
+        print("Invalid choice.")
+        return
+
+    _record_change("update", task)
+
+def delete_task():
+    """Removes a Task at a specific index"""
+    index = int(input("Enter the index of the task to delete: "))
+    task = remove_task(index-1)
+    if task is None:
+        print("Invalid action.")
+        return
+    _record_change("delete", task)
+    print(f"Deleted task: {task.title}")
+
+def get_time_frame_tasks(task_list, time_frame):
+    """
+    Filters tasks based on specified time frame
+    Returns tasks that fall within the time frame and overdue tasks
+    """
+    bounds = _time_frame_bounds(time_frame, date.today())
+    if bounds is None:
+        return [], []
+
+    # Filter tasks based on time frame
+    filtered_tasks = []
+    overdue_tasks = []
+
+    for task in task_list:
+        if _in_time_frame(task, time_frame, bounds):
+            if time_frame == "overdue":
+                overdue_tasks.append(task)
+            else:
+                filtered_tasks.append(task)
+
+    return filtered_tasks, overdue_tasks
+
+def _in_time_frame(task, time_frame, bounds):
+    """Checks if a task is due within bounds, None for no bound; done tasks are never overdue"""
+    start_date, end_date = bounds
+    if not task.due_date or end_date is not None and task.due_date > end_date:
+        return False
+    if start_date is not None and task.due_date < start_date:
+        return False
+    return time_frame != "overdue" or task.status.lower() != "done"
+
+# Rows are joined into one write per RENDER_BATCH tasks instead of one print() each
+RENDER_BATCH = 1000
+MENU_PAGE_SIZE = 40  # Rows per page when the menu runs in a terminal
+MORE_PROMPT = "-- More (Enter for the next page, q to stop) --"
+_due_texts = {None: "No due date"}  # Due dates formatted once per distinct date
+
+class Renderer:
+    """
+    Defines how the views write rows of tasks: in batches, skipping offset rows,
+    up to limit rows, and pausing after every page_size rows when given one
+    """
+    def __init__(self, limit=None, offset=0, page_size=None):
+        self.limit = limit
+        self.offset = offset
+        self.page_size = page_size
+
+    def write(self, numbered, header=None, named=False):
+        """
+        Writes (number, task) rows, with header above them if there are any. With
+        named, rows are (number, (list name, task)) and show the list of each task.
+        Only the rows shown are formatted. Returns how many were written.
+        """
+        rows = islice(numbered, self.offset, self.rows_needed())
+        size = self.page_size or RENDER_BATCH
+        batch = list(islice(rows, size))
+        if batch and header is not None:
+            print(header)
+        written = 0
+        while batch:
+            numbers = [(i, task) for i, (_, task) in batch] if named else batch
+            lines = [f"{i}. {task.title} - Status: {task.status} - Priority: {task.priority} - "
+                     f"Due: {_due_text(task.due_date)} - Id: {task.id}" for i, task in numbers]
+            if named:
+                lines = [f"{line} - List: {name}" for line, (_, (name, _)) in zip(lines, batch)]
+            sys.stdout.write("\n".join(lines) + "\n")
+            written += len(batch)
+            batch = list(islice(rows, size))
+            if batch and self.page_size and input(MORE_PROMPT).strip().lower() == "q":
+                break
+        return written
+
+    def rows_needed(self):
+        """Returns how many rows of a view are read at most, None when all of them"""
+        return None if self.limit is None else self.offset + self.limit
+
+renderer = Renderer()
+
+def _due_text(due_date):
+    """Formats a due date for the views"""
+    text = _due_texts.get(due_date)
+    if text is None:
+        text = _due_texts[due_date] = due_date.strftime("%Y-%m-%d")
+    return text
+
+@contextmanager
+def rendering(limit=None, offset=0, page_size=None, pager=False):
+    """Makes the views show a window of their rows, a page at a time, or through $PAGER"""
+    global renderer
+    old_renderer, renderer = renderer, Renderer(limit, offset, page_size)
+    try:
+        with _pager() if pager else nullcontext():
+            yield renderer
+    finally:
+        renderer = old_renderer
+
+@contextmanager
+def _pager():
+    """Sends what is printed to $PAGER (less by default), which shows the first page at once"""
+    if not sys.stdout.isatty():
+        yield
+        return
+    process = subprocess.Popen(os.environ.get("PAGER") or "less -FRX", shell=True,
+                               stdin=subprocess.PIPE, text=True, errors="backslashreplace")
+    old_stdout, sys.stdout = sys.stdout, process.stdin
+    try:
+        yield
+    except BrokenPipeError:
+        pass  # The pager was quit before reading everything
+    finally:
+        sys.stdout = old_stdout
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
+
+def print_task_list(tasks_to_print, header, named=False):
+    """Helper function to print tasks, or (list name, task) rows if named, in a consistent format"""
+    if not renderer.write(enumerate(tasks_to_print, 1), f"\n{header}:", named):
+        print(f"\nNo tasks found for {header.lower()}")
+
+def _database_view(changing=False):
+    """
+    Returns the database when a view can query it instead of loading every task,
+    which is in SQLite mode until something loads them. Otherwise loads the tasks
+    and returns None. A change loads them while there is an undo history to record it.
+    """
+    if _database is not None and _pending_snapshot is not None and \
+            not (changing and history is not None):
+        return _database
+    _materialize_tasks()
+    return None
+
+def task_count():
+    """Returns the number of tasks"""
+    database = _database_view()
+    return database.count() if database else len(tasks)
+
+def task_statuses():
+    """Returns (status, count) pairs of the statuses in use"""
+    database = _database_view()
+    return database.statuses() if database else status_index.statuses()
+
+def top_tasks(k, by_urgency=False):
+    """Returns the k most urgent tasks, by priority or by urgency()"""
+    database = _database_view()
+    if database:
+        return database.by_urgency(k) if by_urgency else database.by_priority(k)
+    return top_k(k, key=urgency if by_urgency else None)
+
+def search_tasks(text, status=None, priority=None, time_frame=None, limit=None):
+    """
+    Returns the tasks whose title or description has a word starting with each word
+    of text, best match first, optionally only those with a status, a priority
+    and/or in a time frame
+    """
+    _materialize_tasks()
+    found = filter_tasks(_text_index().search(text), status, time_frame)
+    if priority is not None:
+        found = (task for task in found if task.priority == priority)
+    return list(islice(found, limit))
+
+# Planner costs, relative to reading one task from a list or an index: sorting a
+# task, popping one off the priority heap and adding one to the text index
+QUERY_SORT_COST = 5
+QUERY_WALK_COST = 40
+QUERY_TEXT_INDEX_COST = 40
+QUERY_SAMPLE_SIZE = 64  # Tasks sampled to estimate the share passing a condition
+QUERY_FIELDS = ["title", "description", "priority", "status", "due_date", "text"]
+QUERY_ORDERS = {
+    "index": lambda task: task.id,
+    "priority": _priority_key,
+    "due_date": lambda task: task.due_date or date.max,
+    "urgency": lambda task: (urgency(task), task.id),
+    "title": lambda task: (task.title.casefold(), task.id),
+}
+_COMPARE = {
+    "==": lambda a, b: a == b, "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b, ">=": lambda a, b: a >= b,
+}
+
+class AccessPath:
+    """
+    Defines one way for a query to read tasks: how many it reads, what each read
+    costs, the order they come in and the condition they already meet
+    """
+    __slots__ = ("name", "detail", "rows", "source", "order", "covers", "weight", "setup",
+                 "minimum")
+
+    def __init__(self, name, detail, rows, source, order=None, covers=None, weight=1):
+        self.name = name
+        self.detail = detail
+        self.rows = rows
+        self.source = source  # Called to start reading
+        self.order = order
+        self.covers = covers
+        self.weight = weight
+        self.setup = 0  # Cost paid before the first task
+        self.minimum = 0  # Tasks read before the first one comes out
+
+def _lower_status(task):
+    """Reads the status of a task for conditions, which ignore case"""
+    return task.status.lower()
+
+class Query:
+    """
+    Defines a query over the loaded tasks, built by chaining where(), order_by() and
+    limit(), and run lazily by iterating it
+
+    Conditions are (field, operator, value): the comparisons of _COMPARE, "in" with
+    a list of values (or a time frame name or a (start, end) pair for due_date), and
+    "matches" with words to search for in "text". Statuses compare ignoring case, and
+    tasks without a due date fail every comparison except == None.
+
+    The planner estimates the cost of each access path and picks the cheapest: a
+    scan of the list, a walk of the priority heap, or the status, due date or text
+    index. Indexes count their own tasks, other conditions are estimated on a
+    sample of the tasks. Paths that already give the requested order let limit()
+    stop early; others are sorted. explain() describes the chosen plan.
+    """
+    def __init__(self):
+        self.conditions = []
+        self.order = None
+        self.descending = False
+        self.count = None
+
+    def where(self, field, operator, value):
+        """Adds a condition every task must meet, returns the query"""
+        if field not in QUERY_FIELDS:
+            raise ValueError(f"Unknown field: {field}")
+        if (operator == "matches") != (field == "text") or \
+                operator not in _COMPARE and operator not in ("in", "matches"):
+            raise ValueError(f"Unknown operator for {field}: {operator}")
+        if field == "due_date" and operator == "in" and isinstance(value, str) and \
+                value not in TIME_FRAMES:
+            raise ValueError(f"Unknown time frame: {value}")
+        if field == "due_date" and operator == "in" and isinstance(value, tuple) and \
+                len(value) != 2:
+            raise ValueError("A due date range needs a start and an end")
+        if field == "due_date" and operator in _COMPARE and isinstance(value, str):
+            value = _parse_date(value)
+        self.conditions.append((field, operator, value))
+        return self
+
+    def order_by(self, field, descending=False):
+        """Sorts the results by index, priority, due_date, urgency or title, returns the query"""
+        if field not in QUERY_ORDERS:
+            raise ValueError(f"Cannot order by {field}")
+        self.order, self.descending = field, descending
+        return self
+
+    def limit(self, count):
+        """Stops after count results, returns the query"""
+        self.count = count
+        return self
+
+    def _test(self, condition):
+        """Returns a function checking one condition for a task"""
+        field, operator, value = condition
+        if field == "text":
+            words = _tokenize(value)
+            return lambda task: all(any(found.startswith(word) for found in
+                                        _tokenize(task.title + " " + task.description))
+                                    for word in words)
+        if field == "due_date" and operator == "in" and not isinstance(value, list):
+            bounds, time_frame = _due_bounds(value), value if isinstance(value, str) else None
+            return lambda task: task.due_date is not None and \
+                _in_time_frame(task, time_frame, bounds)
+        if field == "status":
+            value = [v.lower() for v in value] if operator == "in" else value.lower()
+            read = _lower_status
+        else:
+            read = attrgetter(field)
+        if operator == "in":
+            return lambda task: read(task) in value
+        compare = _COMPARE[operator]
+        if field == "due_date" and value is not None:
+            return lambda task: task.due_date is not None and compare(task.due_date, value)
+        return lambda task: compare(read(task), value)
+
+    def _paths(self):
+        """Lists the access paths that can answer the query"""
+        total = len(tasks)
+        limited = self.count is not None
+        paths = [AccessPath("Scan", "task list", total, lambda: iter(tasks), order="index")]
+        for condition in self.conditions:
+            field, operator, value = condition
+            if field == "status" and operator == "==":
+                paths.append(AccessPath("Index scan", f"status_index ({value})",
+                                        status_index.count(value),
+                                        lambda v=value: iter(status_index.tasks_with(v)),
+                                        covers=condition))
+            elif field == "due_date" and _due_range(operator, value) is not None:
+                start, end = _due_range(operator, value)
+                low, high = due_index.positions(start, end)
+                # Overdue also leaves out done tasks, which the index does not know
+                paths.append(AccessPath(
+                    "Index scan", f"due_index ({_describe_range(start, end)})", high - low,
+                    lambda bounds=(start, end): iter(due_index.between(*bounds)),
+                    order="due_date", covers=None if value == "overdue" else condition))
+            elif field == "priority" and operator in ("<", "<="):
+                bound = value - 1 if operator == "<" else value
+                paths.append(self._heap_path(f"priority <= {bound}", bound, condition))
+            elif field == "text":
+                path = AccessPath("Index scan", f"text_index ({value!r})",
+                                  round(total * self._share(condition)),
+                                  lambda v=value: _text_index().search(v), covers=condition)
+                if text_index is None:
+                    path.setup = total * QUERY_TEXT_INDEX_COST
+                paths.append(path)
+        if self.order == "priority" and limited:
+            paths.append(self._heap_path(None, None, None))
+        return paths
+
+    def _heap_path(self, label, bound, condition):
+        """Builds the path walking the priority heap, up to a priority bound if given"""
+        total = len(tasks)
+        rows = total if bound is None else \
+            round(total * self._share(("priority", "<=", bound)))
+        path = AccessPath("Heap walk", f"priority_queue ({label})" if label else "priority_queue",
+                          rows, lambda: self._walk_heap(bound), order="priority",
+                          covers=condition, weight=QUERY_WALK_COST)
+        # Tasks come out once their whole priority group has been popped and sorted
+        if priority_queue:
+            smallest = priority_queue[0].priority
+            path.minimum = round(total * self._share(("priority", "==", smallest)))
+        return path
+
+    def _walk_heap(self, bound):
+        """Yields tasks by priority, lazily when few are wanted, up to the bound if given"""
+        found = walk_by_priority(priority_queue) if self.count is not None else \
+            iter_by_priority(priority_queue)
+        return found if bound is None else _take_while_priority(found, bound)
+
+    def _share(self, condition):
+        """Estimates the share of tasks meeting a condition from a sample of them"""
+        step = max(1, len(priority_queue) // QUERY_SAMPLE_SIZE)
+        sample = priority_queue[::step]
+        if not sample:
+            return 1.0
+        test = self._test(condition)
+        # Never estimate zero, a condition missing every sampled task can still match some
+        return max(1, sum(map(test, sample))) / len(sample)
+
+    def _plan(self):
+        """Returns the cheapest (cost, path, needs sort, remaining conditions)"""
+        plans = []
+        for path in self._paths():
+            remaining = [condition for condition in self.conditions if condition is not path.covers]
+            passing = 1.0
+            for condition in remaining:
+                passing *= self._share(condition)
+            needs_sort = self.order is not None and (path.order != self.order or self.descending)
+            # Matching words without the index splits the text of every task read
+            weight = path.weight + QUERY_TEXT_INDEX_COST * sum(
+                field == "text" for field, _, _ in remaining)
+            read = path.rows
+            if needs_sort:
+                cost = read * weight + read * passing * QUERY_SORT_COST
+            else:
+                if self.count is not None:
+                    # Reading stops once enough tasks pass the remaining conditions
+                    read = min(read, max(path.minimum, self.count / passing))
+                cost = read * weight
+            plans.append((cost + path.setup, path, needs_sort, remaining))
+        # The first of the cheapest plans wins, as min() keeps the first of equal ones
+        return min(plans, key=itemgetter(0))
+
+    def __iter__(self):
+        _materialize_tasks()
+        _, path, needs_sort, remaining = self._plan()
+        found = path.source()
+        for test in map(self._test, remaining):
+            found = filter(test, found)
+        if needs_sort:
+            found = sorted(found, key=QUERY_ORDERS[self.order], reverse=self.descending)
+        return islice(found, self.count)
+
+    def all(self):
+        """Runs the query and returns the results as a list"""
+        return list(self)
+
+    def explain(self):
+        """Describes the plan the query would run with"""
+        _materialize_tasks()
+        cost, path, needs_sort, remaining = self._plan()
+        lines = [f"{path.name} on {path.detail}: ~{path.rows} tasks, cost {cost:.0f}"]
+        if path.setup:
+            lines.append("  Builds the text index first")
+        if remaining:
+            lines.append("  Filter: " + " and ".join(
+                f"{field} {operator} {value!r}" for field, operator, value in remaining))
+        if needs_sort:
+            lines.append(f"  Sort: {self.order}{' descending' if self.descending else ''}")
+        if self.count is not None:
+            lines.append(f"  Limit: {self.count}")
+        return "\n".join(lines)
+
+def query():
+    """Starts a query over the tasks, e.g. query().where("priority", "<=", 2).limit(5)"""
+    return Query()
+
+def _due_bounds(value):
+    """Returns the (start, end) due dates of a time frame name or of a pair of dates"""
+    if isinstance(value, str):
+        return _time_frame_bounds(value, date.today())
+    start, end = value
+    return (_parse_date(start) if isinstance(start, str) else start,
+            _parse_date(end) if isinstance(end, str) else end)
+
+def _due_range(operator, value):
+    """Returns the range of due dates a due date condition selects, None if it is not one"""
+    if operator == "in" and not isinstance(value, list):
+        return _due_bounds(value)
+    if value is None or operator in ("!=", "in"):
+        return None
+    one_day = timedelta(days=1)
+    return {"==": (value, value), "<": (None, value - one_day), "<=": (None, value),
+            ">": (value + one_day, None), ">=": (value, None)}[operator]
+
+def _query_value(field, operator, text):
+    """Converts a value given on the command line to the type of the field"""
+    if operator == "in" and not (field == "due_date" and text in TIME_FRAMES):
+        values = [_query_value(field, "==", part.strip()) for part in text.split(",")]
+        return tuple(values) if field == "due_date" else values
+    if field == "priority":
+        try:
+            return int(text)
+        except ValueError as e:
+            raise ValueError(f"Priority must be a number: {text}") from e
+    if field == "due_date" and operator != "in":
+        return _parse_date(text) if text.lower() not in ("", "none") else None
+    return text
+
+def _describe_range(start, end):
+    """Formats a range of due dates for explain()"""
+    return f"{start or 'any'} to {end or 'any'}"
+
+def _take_while_priority(task_iter, bound):
+    """Yields tasks from a priority ordered iterator until one is past the bound"""
+    for task in task_iter:
+        if task.priority > bound:
+            return
+        yield task
+
+def _text_index():
+    """Returns the text index, building it on first use"""
+    global text_index
+    if text_index is None:
+        # Searching is rarer than loading, so the index is built when first needed
+        text_index = TextIndex()
+        text_index.extend(tasks)
+    return text_index
+
+def tasks_by_index():
+    """Returns (index, task) pairs of every task in list order"""
+    database = _database_view()
+    return enumerate(database.by_index() if database else tasks, 1)
+
+def tasks_by_priority(limit=None):
+    """Returns (index, task) pairs by priority, reading at most limit tasks when given"""
+    database = _database_view()
+    if database:
+        return database.by_priority_with_index()
+    # Number each task by its place in the list, which update and delete use
+    if limit is not None:
+        # Only the tasks shown are numbered, each through its node in O(log n)
+        nodes = _id_map()
+        return ((tasks.index_of(nodes[task.id]) + 1, task)
+                for task in iter_by_priority(priority_queue, limit))
+    positions = {id(task): i for i, task in enumerate(tasks, 1)}
+    return ((positions[id(task)], task) for task in iter_by_priority(priority_queue))
+
+def tasks_by_due_date():
+    """Returns every task by due date, tasks without a due date last"""
+    database = _database_view()
+    if database:
+        return database.by_due_date()
+    # The index is already sorted by due date, tasks without due dates go at the end.
+    # Both are read as rows are shown, so the first page does not wait for the rest
+    return chain(due_index, (task for task in tasks if task.due_date is None))
+
+def tasks_with_status(status):
+    """Returns the tasks with a status, ignoring case"""
+    database = _database_view()
+    return database.with_status(status) if database else status_index.tasks_with(status)
+
+def tasks_in_time_frame(time_frame):
+    """
+    Returns the tasks of one time frame, or for all a dict of the tasks of
+    every time frame, grouped in one pass over the due date index
+    """
+    # The database answers with range queries over its due date index
+    index = _database_view() or due_index
+    if time_frame == "all":
+        return index.all_time_frames()
+    filtered_tasks, overdue_tasks = index.time_frame(time_frame)
+    return overdue_tasks if time_frame == "overdue" else filtered_tasks
+
+def print_by_index():
+    """Prints every task numbered by its index"""
+    print("Todo List:")
+    renderer.write(tasks_by_index())
+
+def print_by_priority():
+    """Prints every task by priority, numbered by its index"""
+    print("Todo List (by Priority):")
+    renderer.write(tasks_by_priority(renderer.rows_needed()))
+
+def print_by_status(status):
+    """Prints the tasks with a status, ignoring case"""
+    print_task_list(tasks_with_status(status), f"Tasks with status '{status}'")
+
+def print_by_due_date():
+    """Prints every task by due date, tasks without a due date last"""
+    print("Tasks sorted by Due Date:")
+    print_task_list(tasks_by_due_date(), "Tasks by due date")
+
+def print_time_frame(time_frame):
+    """Prints the tasks of one time frame, or of every time frame for all"""
+    found = tasks_in_time_frame(time_frame)
+    if time_frame == "all":
+        for label, frame in [("Overdue Tasks", "overdue"), ("Due Today", "today"),
+                             ("Due Tomorrow", "tomorrow"), ("Due This Week", "week"),
+                             ("Due This Month", "month")]:
+            print_task_list(found[frame], label)
+    elif time_frame == "overdue":
+        print_task_list(found, "Overdue Tasks")
+    else:
+        print_task_list(found, f"Tasks due {time_frame}")
+
+def list_tasks():
+    """Prints out the Tasks with enhanced viewing options"""
+    if task_count() == 0:
+        print("ToDo list is empty.")
+    else:
+        print("\nTodo List Menu:")
         print("1. View by Index")
         print("2. View by Priority")
         print("3. Filter by Status")
         print("4. View by Due Date")
         print("5. View by Time Frame")
-        choice = input("Enter your choice (1-5): ")
-
-        # Create a list of all tasks in their current order
-        task_list = []
-        current = tasks.head
-        while current is not None:
-            task_list.append(current.task)
-            current = current.next
+        print("6. View Most Urgent Tasks")
+        choice = input("Enter your choice (1-6): ")
 
         if choice == "1":
-            print("Todo List:")
-            for i, task in enumerate(task_list, 1):
-                due_date_str = task.due_date.strftime("%Y-%m-%d") \
-                    if task.due_date else "No due date"
-                print(f"{i}. {task.title} - Status: {task.status} - "
-                      f"Priority: {task.priority} - Due: {due_date_str}")
+            print_by_index()
 
         elif choice == "2":
-            print("Todo List (by Priority):")
-            priority_tasks = sorted(priority_queue)
-            for task in priority_tasks:
-                x = priority_queue.index(task)
-                due_date_str = task.due_date.strftime("%Y-%m-%d") \
-                    if task.due_date else "No due date"
-                print(f"{x+1}. {task.title} - Status: {task.status} - "
-                      f"Priority: {task.priority} - Due: {due_date_str}")
+            print_by_priority()
 
         elif choice == "3":
-            # Get unique statuses from existing tasks
-            statuses = set(task.status for task in task_list)
+            # Get the statuses in use from the status index
             print("\nAvailable statuses:")
-            for status in sorted(statuses):
-                print(f"- {status}")
+            for status, count in task_statuses():
+                print(f"- {status} ({count})")
 
             # Get status to filter by
             filter_status = input("\nEnter status to filter by: ")
 
-            # Filter and display tasks
-            filtered_tasks = [task for task in task_list
-                              if task.status.lower() == filter_status.lower()]
-            print_task_list(filtered_tasks, f"Tasks with status '{filter_status}'")
+            print_by_status(filter_status)
 
         elif choice == "4":
-            print("Tasks sorted by Due Date:")
-            # Sort tasks by due date, with tasks without due dates at the end
-            sorted_tasks = sorted(task_list, key=lambda x: (x.due_date is None,
-                                                            x.due_date or date.max))
-            print_task_list(sorted_tasks, "Tasks by due date")
+            print_by_due_date()
 
         elif choice == "5":
             print("\nTime Frame Options:")
@@ -467,46 +3162,1303 @@ def list_tasks():
             }
 
             if time_choice in time_frames:
-                time_frame = time_frames[time_choice]
-                filtered_tasks, overdue_tasks = get_time_frame_tasks(task_list, time_frame)
-
-                if time_frame == "overdue":
-                    print_task_list(overdue_tasks, "Overdue Tasks")
-                else:
-                    print_task_list(filtered_tasks, f"Tasks due {time_frame}")
+                print_time_frame(time_frames[time_choice])
 
             elif time_choice == "6":
-                # Show all time frames
-                for label in ["Overdue Tasks", "Due Today", "Due Tomorrow",
-                            "Due This Week", "Due This Month"]:
-                    time_frame = label.split()[1].lower()
-                    filtered_tasks, overdue_tasks = \
-                        get_time_frame_tasks(task_list, time_frame)
-
-                    if time_frame == "overdue":
-                        print_task_list(overdue_tasks, label)
-                    else:
-                        print_task_list(filtered_tasks, label)
+                print_time_frame("all")
 
             else:
                 print("Invalid choice. Please try again.")
 
+        elif choice == "6":
+            list_top_tasks()
+
         else:
             print("Invalid choice. Please try again.")
 
-def main():
-    """Main method"""
+def list_top_tasks():
+    """Prints the most urgent tasks, by priority or by priority and due date"""
+    count_input = input("How many tasks? (press Enter for 20): ")
+    try:
+        count = int(count_input) if count_input else 20
+    except ValueError:
+        print("Please enter a valid number")
+        return
+
+    print("\nRank by:")
+    print("1. Priority")
+    print("2. Priority and days until the due date")
+    rank_choice = input("Enter your choice (1-2): ")
+    if rank_choice == "1":
+        print_task_list(top_tasks(count), f"Top {count} tasks by priority")
+    elif rank_choice == "2":
+        print_task_list(top_tasks(count, by_urgency=True), f"Top {count} tasks by urgency")
+    else:
+        print("Invalid choice. Please try again.")
+
+# Streaming import and export: readers yield one Task at a time and writers consume
+# any iterable of tasks, so files of any size go through in constant memory
+FILE_FORMATS = ["csv", "jsonl", "txt"]
+EXPORT_FIELDS = ["title", "description", "priority", "status", "due_date"]
+
+def guess_format(path):
+    """Returns the file format for a path from its extension, JSON Lines by default"""
+    extension = os.path.splitext(path)[1].lower()
+    return {".csv": "csv", ".txt": "txt"}.get(extension, "jsonl")
+
+def task_to_dict(task):
+    """Returns the fields of a task as a dict, with the due date as YYYY-MM-DD or None"""
+    return {"title": task.title, "description": task.description, "priority": task.priority,
+            "status": task.status,
+            "due_date": task.due_date.strftime("%Y-%m-%d") if task.due_date else None}
+
+def task_from_dict(fields):
+    """Creates a Task that is not stored yet from a dict of fields, past due dates allowed"""
+    if "title" not in fields or "priority" not in fields:
+        raise ValueError("A task needs a title and a priority")
+    priority = fields["priority"]
+    if isinstance(priority, str):  # Every CSV field is a string
+        try:
+            priority = int(priority)
+        except ValueError as e:
+            raise ValueError("Priority must be a positive integer (1 is highest)") from e
+    task = Task(fields["title"], fields.get("description") or "", priority,
+                fields.get("due_date") or None, allow_past_dates=True)
+    task.status = sys.intern(fields.get("status") or "To Do")
+    return task
+
+def _json_records(file):
+    """Yields (line number, object) for each non-empty line of a JSON Lines file"""
+    for line_number, line in enumerate(file, 1):
+        if line.strip():
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"Line {line_number}: {e}") from e
+
+def read_tasks(file, file_format):
+    """Yields a Task for each record of an open CSV (with a header row), JSON Lines or todo file"""
+    if file_format == "csv":
+        reader = csv.DictReader(file)
+        records = ((reader.line_num, row) for row in reader)
+        to_task = task_from_dict
+    elif file_format == "txt":
+        to_task = functools.partial(_parse_task_line, escaped=_escaped(next(file, "")))
+        records = enumerate(file, 2)
+    else:
+        records = _json_records(file)
+        to_task = task_from_dict
+
+    for line_number, record in records:
+        try:
+            task = to_task(record)
+        except ValueError as e:
+            raise ValueError(f"Line {line_number}: {e}") from e
+        if task is not None:
+            yield task
+
+def write_tasks(file, task_iter, file_format):
+    """Writes tasks to an open file as CSV (RFC 4180), JSON Lines or a todo file, returns a count"""
+    count = 0
+    if file_format == "csv":
+        writer = csv.DictWriter(file, EXPORT_FIELDS)  # Quotes fields with commas or quotes
+        writer.writeheader()
+        for task in task_iter:
+            writer.writerow(task_to_dict(task))
+            count += 1
+    elif file_format == "txt":
+        file.write(HEADER)
+        for task in task_iter:
+            file.write(_task_line(task))
+            count += 1
+    else:
+        for task in task_iter:
+            file.write(json.dumps(task_to_dict(task)) + "\n")
+            count += 1
+    return count
+
+def filter_tasks(task_iter, status=None, time_frame=None, today=None):
+    """Yields the tasks with a status (any case) and/or in a time frame, like the list views"""
+    bounds = None
+    if time_frame is not None:
+        bounds = _time_frame_bounds(time_frame, today or date.today())
+        if bounds is None:
+            raise ValueError(f"Unknown time frame: {time_frame}")
+    status = status.lower() if status is not None else None
+
+    for task in task_iter:
+        if status is not None and task.status.lower() != status:
+            continue
+        if bounds is not None and not _in_time_frame(task, time_frame, bounds):
+            continue
+        yield task
+
+def merge_tasks(task_iter, update_existing=False):
+    """
+    Stores streamed tasks in the loaded list, without reading the todo file again.
+    With update_existing, a task titled like a stored one updates that task instead.
+    Returns the number of tasks added and updated.
+    """
+    if update_existing:
+        _materialize_tasks()
+    by_title = {task.title: task for task in tasks} if update_existing else {}
+    added = updated = 0
+    for task in task_iter:
+        existing = by_title.get(task.title)
+        if existing is None:
+            store_task(task)
+            if update_existing:
+                by_title[task.title] = task
+            added += 1
+        else:
+            edit_task(existing, status=task.status, priority=task.priority,
+                      due_date=task.due_date, allow_past_dates=True,
+                      description=task.description)
+            updated += 1
+    return added, updated
+
+def _task_at(index):
+    """Returns the task at a 1-based index, like the menu shows it"""
+    task = get_task(index - 1) if isinstance(index, int) else None
+    if task is None:
+        raise ValueError(f"Invalid task index: {index}")
+    return task
+
+def _task_with_id(task_id):
+    """Returns the task with an id, which unlike an index stays the same after deletes"""
+    task = get_task_by_id(task_id) if isinstance(task_id, int) else None
+    if task is None:
+        raise ValueError(f"No task with id {task_id}")
+    return task
+
+# Types of the fields of a task given as JSON, by batch operations and the server
+_FIELD_TYPES = {"title": str, "description": str, "status": str, "priority": int,
+                "due_date": (str, type(None)), "id": int, "index": int}
+_TYPE_NAMES = {str: "a string", int: "a number", (str, type(None)): "a date string or null"}
+
+def _check_fields(record):
+    """Raises ValueError for a record that is not a JSON object or has a field of the wrong type"""
+    if not isinstance(record, dict):
+        raise ValueError(f"Expected a JSON object, not {json.dumps(record)}")
+    for field, value in record.items():
+        expected = _FIELD_TYPES.get(field)
+        # JSON true and false are bools, which Python counts as ints
+        if expected is not None and (not isinstance(value, expected) or isinstance(value, bool)):
+            raise ValueError(f"Field {field!r} must be {_TYPE_NAMES[expected]}")
+    return record
+
+def apply_operation(operation):
+    """
+    Applies one operation given as a dict, without saving. For example:
+    {"op": "add", "title": "Milk", "description": "Buy milk", "priority": 2,
+     "due_date": "2030-01-31", "status": "To Do"}
+    {"op": "update", "index": 3, "status": "Done", "priority": 1, "due_date": null}
+    {"op": "delete", "index": 3}
+    Tasks to update or delete can be given by "id" instead of "index".
+    Returns True when the list was changed.
+    """
+    kind = _check_fields(operation).get("op")
+    try:
+        if kind == "add":
+            create_task(operation["title"], operation.get("description", ""),
+                        operation["priority"], operation.get("due_date"),
+                        operation.get("status", "To Do"))
+        elif kind == "update":
+            task = _task_with_id(operation["id"]) if "id" in operation else \
+                _task_at(operation["index"])
+            edit_task(task, status=operation.get("status"), priority=operation.get("priority"),
+                      due_date=operation.get("due_date", _UNCHANGED))
+        elif kind == "delete":
+            if "id" in operation:
+                remove_task_by_id(_task_with_id(operation["id"]).id)
+            else:
+                _task_at(operation["index"])
+                remove_task(operation["index"] - 1)
+        else:
+            raise ValueError(f"Unknown operation: {kind!r}")
+    except KeyError as e:
+        raise ValueError(f"Missing field {e} for {kind!r}") from e
+    return True
+
+def _heap_levels(args, result):
+    """Counts the levels an item moved in _heap_up() or _heap_down()"""
+    return abs((args[1] + 1).bit_length() - (result + 1).bit_length())
+
+def _tree_steps(args, _):
+    """Counts the Fenwick tree nodes LinkedList.get() goes through, plus the block"""
+    return args[0].block_count().bit_length() + 1
+
+# The instrumented operations, with what each counts besides calls and time
+INSTRUMENTED = {
+    "load_tasks": None,
+    "save_tasks": None,
+    "append_journal": None,
+    "_write_file": ("bytes_written", lambda args, _: len(args[1])),
+    "heap_push": None,
+    "heap_pop": None,
+    "_heap_up": ("nodes", _heap_levels),
+    "_heap_down": ("nodes", _heap_levels),
+    "LinkedList.get": ("nodes", _tree_steps),
+    "list_tasks": None,
+    "print_by_index": None,
+    "print_by_priority": None,
+    "print_by_status": None,
+    "print_by_due_date": None,
+    "print_time_frame": None,
+}
+
+class Stats:
+    """Defines the calls, latencies and counters recorded for each instrumented operation"""
+    def __init__(self):
+        self.latencies = {}
+        self.counters = {}
+
+    def record(self, name, seconds):
+        """Records one call of an operation"""
+        latencies = self.latencies.get(name)
+        if latencies is None:
+            latencies = self.latencies[name] = array("d")
+        latencies.append(seconds)
+
+    def count(self, name, counter, amount):
+        """Adds to a counter of an operation, like the bytes it wrote"""
+        counters = self.counters.setdefault(name, {})
+        counters[counter] = counters.get(counter, 0) + amount
+
+    def summary(self):
+        """Returns calls, total, p50 and p99 seconds and the counters of each operation"""
+        found = {}
+        for name, latencies in sorted(self.latencies.items()):
+            ordered = sorted(latencies)
+            found[name] = {"calls": len(ordered), "total_s": sum(ordered),
+                           "p50_s": _percentile(ordered, 0.5),
+                           "p99_s": _percentile(ordered, 0.99),
+                           **self.counters.get(name, {})}
+        return found
+
+    def to_json(self):
+        """Formats the summary as JSON"""
+        return json.dumps(self.summary(), indent=2) + "\n"
+
+    def to_prometheus(self):
+        """Formats the summary in the Prometheus text format"""
+        summary = self.summary()
+        lines = ["# HELP todo_operation_seconds Time taken by an operation of todo.py",
+                 "# TYPE todo_operation_seconds summary"]
+        for name, found in summary.items():
+            label = f'operation="{name}"'
+            lines.append(f'todo_operation_seconds{{{label},quantile="0.5"}} {found["p50_s"]}')
+            lines.append(f'todo_operation_seconds{{{label},quantile="0.99"}} {found["p99_s"]}')
+            lines.append(f"todo_operation_seconds_sum{{{label}}} {found['total_s']}")
+            lines.append(f"todo_operation_seconds_count{{{label}}} {found['calls']}")
+        for counter in ["nodes", "bytes_written"]:
+            lines.append(f"# TYPE todo_{counter}_total counter")
+            lines.extend(f'todo_{counter}_total{{operation="{name}"}} {found[counter]}'
+                         for name, found in summary.items() if counter in found)
+        return "\n".join(lines) + "\n"
+
+def _percentile(ordered, fraction):
+    """Returns the nearest-rank percentile of sorted values"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+stats = None
+_uninstrumented = {}
+
+def _instrument(name, func, measure):
+    """Wraps func so each call is timed, and counted with measure if given"""
+    record = stats.record
+    count = stats.count
+
+    @functools.wraps(func)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        record(name, time.perf_counter() - start)
+        if measure is not None:
+            count(name, measure[0], measure[1](args, result))
+        return result
+    return timed
+
+def enable_stats(path=None):
+    """
+    Starts recording the instrumented operations, and writes them to path on exit.
+    Nothing is wrapped until this is called, so the operations cost nothing extra before.
+    """
+    global stats
+    if stats is None:
+        stats = Stats()
+        for name, measure in INSTRUMENTED.items():
+            func = _operation(name)
+            _uninstrumented[name] = func
+            _set_operation(name, _instrument(name, func, measure))
+    if path:
+        atexit.register(write_stats, path)
+    return stats
+
+def disable_stats():
+    """Puts the uninstrumented operations back and returns what was recorded"""
+    global stats
+    for name, func in _uninstrumented.items():
+        _set_operation(name, func)
+    _uninstrumented.clear()
+    recorded, stats = stats, None
+    return recorded
+
+def _operation(name):
+    """Returns the function, or Class.method, an instrumented name stands for"""
+    owner, _, attribute = name.rpartition(".")
+    return getattr(globals()[owner], attribute) if owner else globals()[attribute]
+
+def _set_operation(name, func):
+    """Replaces the function, or Class.method, an instrumented name stands for"""
+    owner, _, attribute = name.rpartition(".")
+    if owner:
+        setattr(globals()[owner], attribute, func)
+    else:
+        globals()[attribute] = func
+
+def write_stats(path):
+    """Writes the recorded stats to path, as Prometheus text for .prom files"""
+    if stats is None:
+        return
+    text = stats.to_prometheus() if path.endswith(".prom") else stats.to_json()
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(text)
+
+# `todo.py serve` keeps one copy of the list in memory for every tool that uses it
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8313
+SERVER_PAGE_LIMIT = 1000  # Tasks in a list response unless ?limit= asks for another number
+SERVER_CACHE_SIZE = 256  # GET answers kept until the list changes
+LIST_VIEWS = ["index", "priority", "due"]
+
+class TaskServer:
+    """
+    Defines an HTTP/JSON API over the loaded list, served on one asyncio event loop
+
+    Requests run on the loop one at a time between awaits, so reads never see half a
+    change. A change takes write_lock, and one saver task saves in a thread while
+    holding it: reads go on during a save, while changes wait and are then saved
+    together by the next one. A change is answered once it is saved. Merging a save
+    of another process rebuilds the list, so that one runs on the loop instead.
+    """
+    def __init__(self):
+        self.revision = 0  # Bumped by every change, the ETag of every GET
+        self.write_lock = asyncio.Lock()
+        self.changed = asyncio.Event()
+        self.next_save = None  # Resolved once the changes made so far are saved
+        self.saver = None
+        self.responses = {}  # Target to the payload answering it, for the current ETag
+        self.responses_etag = None
+
+    async def handle(self, reader, writer):
+        """Answers the requests of one connection, keeping it open between them"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    writer.write(_http_response(HTTPStatus.BAD_REQUEST, {"error": "Bad request"},
+                                                {"Connection": "close"}))
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" \
+                    else connection == "keep-alive"
+                status, payload, extra = await self.respond(method, target, headers, body)
+                if not keep_alive:
+                    extra["Connection"] = "close"
+                writer.write(_http_response(status, payload, extra))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # The client went away
+        finally:
+            writer.close()
+
+    async def respond(self, method, target, headers, body):
+        """Returns the status, JSON payload and extra headers answering one request"""
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            if parts == ["tasks"]:
+                if method == "GET":
+                    return self.cached(target, headers, lambda: self.list_tasks(params))
+                if method == "POST":
+                    task = await self.change(lambda: _create_from_json(_json_body(body)))
+                    return HTTPStatus.CREATED, _task_json(task), {"Location": f"/tasks/{task.id}"}
+                return _not_allowed("GET, POST")
+            if len(parts) == 2 and parts[0] == "tasks":
+                return await self.respond_task(method, parts[1], headers, body)
+            if len(parts) == 2 and parts[0] == "time-frames":
+                if parts[1] != "all" and parts[1] not in TIME_FRAMES:
+                    return _not_found(f"No time frame {parts[1]}")
+                if method == "GET":
+                    return self.cached(target, headers,
+                                       lambda: self.time_frame(parts[1], params))
+                return _not_allowed("GET")
+            return _not_found(f"No such resource: {url.path}")
+        except (ValueError, TypeError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}, {}
+        except OSError as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Saving failed: {e}"}, {}
+
+    async def respond_task(self, method, task_id, headers, body):
+        """Answers GET, PATCH and DELETE of /tasks/ID"""
+        number = int(task_id) if task_id.isdigit() else None
+        if method not in ("GET", "PATCH", "DELETE"):
+            if get_task_by_id(number) is None:
+                return _not_found(f"No task with id {task_id}")
+            return _not_allowed("GET, PATCH, DELETE")
+        if method == "GET":
+            task = get_task_by_id(number)
+            if task is not None:
+                return self.cached(f"/tasks/{task.id}", headers, lambda: _task_json(task))
+        elif method == "PATCH":
+            fields = _json_body(body)
+
+            def edit():
+                # Found under the write lock, since a DELETE may come first while waiting for it
+                task = get_task_by_id(number)
+                if task is not None:
+                    edit_task(task, status=fields.get("status"), priority=fields.get("priority"),
+                              due_date=fields.get("due_date", _UNCHANGED))
+                return task
+
+            task = await self.change(edit)
+            if task is not None:
+                return HTTPStatus.OK, _task_json(task), {}
+        elif await self.change(lambda: remove_task_by_id(number)) is not None:
+            return HTTPStatus.NO_CONTENT, None, {}
+        return _not_found(f"No task with id {task_id}")
+
+    def etag(self):
+        """Returns the ETag of every GET: the revision, and the day for the time frames"""
+        return f'"{self.revision}-{date.today().toordinal()}"'
+
+    def cached(self, target, headers, build):
+        """
+        Answers a GET with 304 if the client has the current revision. Otherwise the
+        answer is built once per revision and target and kept for the next client
+        """
+        etag = self.etag()
+        if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+            return HTTPStatus.NOT_MODIFIED, None, {"ETag": etag}
+        if self.responses_etag != etag or len(self.responses) >= SERVER_CACHE_SIZE:
+            self.responses.clear()
+            self.responses_etag = etag
+        payload = self.responses.get(target)
+        if payload is None:
+            payload = self.responses[target] = build()
+        return HTTPStatus.OK, payload, {"ETag": etag}
+
+    @staticmethod
+    def list_tasks(params):
+        """Returns a window of a view, filtered by status or time frame if asked"""
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", SERVER_PAGE_LIMIT))
+        if offset < 0 or limit < 0:
+            raise ValueError("offset and limit must not be negative")
+        view = params.get("view", "index")
+        if "status" in params:
+            numbered = enumerate(tasks_with_status(params["status"]), 1)
+        elif "time_frame" in params:
+            if params["time_frame"] not in TIME_FRAMES:
+                raise ValueError(f"time_frame must be one of {', '.join(TIME_FRAMES)}")
+            numbered = enumerate(tasks_in_time_frame(params["time_frame"]), 1)
+        elif view == "index":
+            numbered = tasks_by_index()
+        elif view == "priority":
+            numbered = tasks_by_priority(offset + limit + 1)
+        elif view == "due":
+            numbered = enumerate(tasks_by_due_date(), 1)
+        else:
+            raise ValueError(f"view must be one of {', '.join(LIST_VIEWS)}")
+        # Index and priority views give each task its place in the list, others their rank
+        window = list(islice(numbered, offset, offset + limit + 1))
+        return {"tasks": [_task_json(task, index) for index, task in window[:limit]],
+                "more": len(window) > limit}
+
+    @staticmethod
+    def time_frame(time_frame, params):
+        """Returns the tasks due in a time frame, or in each time frame for all"""
+        limit = int(params.get("limit", SERVER_PAGE_LIMIT))
+        found = tasks_in_time_frame(time_frame)
+        if time_frame != "all":
+            return [_task_json(task) for task in found[:limit]]
+        return {frame: [_task_json(task) for task in found[frame][:limit]]
+                for frame in TIME_FRAMES}
+
+    async def change(self, func):
+        """Makes a change under the write lock, then waits until the saver has saved it"""
+        if self.saver is None:
+            self.next_save = asyncio.get_running_loop().create_future()
+            self.saver = asyncio.create_task(self.save_changes())
+        async with self.write_lock:
+            result = func()
+            self.revision += 1
+            saved = self.next_save
+        self.changed.set()
+        await saved
+        return result
+
+    async def save_changes(self):
+        """Saves whatever changed since the last save, until cancelled"""
+        while True:
+            await self.changed.wait()
+            # Changes that came in meanwhile already wait at the lock, let them go first
+            await asyncio.sleep(0)
+            async with self.write_lock:
+                self.changed.clear()
+                done = self.next_save
+                self.next_save = asyncio.get_running_loop().create_future()
+                expected_version = _loaded_version + 1
+                try:
+                    if not await asyncio.to_thread(_locked_save, False):
+                        # Merging rebuilds the list, so it runs on the loop, where no GET
+                        # can see the list half rebuilt
+                        _locked_save()
+                except Exception as e:  # pylint: disable=broad-exception-caught
+                    done.set_exception(e)  # The changes stay in memory for the next save
+                    continue
+                if SNAPSHOT_FORMAT == "text" and _loaded_version != expected_version:
+                    # Another process had saved, and its changes were merged into the list
+                    self.revision += 1
+            done.set_result(None)
+
+def _locked_save(merge=True):
+    """Saves the list while holding _store_lock, as the write-behind thread does"""
+    with _store_lock:
+        return save_tasks(merge)
+
+def _json_body(body):
+    """Reads the JSON object of a request body"""
+    try:
+        fields = json.loads(body or b"{}")
+    except ValueError as e:
+        raise ValueError(f"Body is not JSON: {e}") from e
+    if not isinstance(fields, dict):
+        raise ValueError("Body must be a JSON object")
+    # Checked before anything changes, a task with a number as title could not be saved
+    return _check_fields(fields)
+
+def _create_from_json(fields):
+    """Creates and stores a task from the fields of a POST"""
+    if "title" not in fields or "priority" not in fields:
+        raise ValueError("A task needs a title and a priority")
+    return create_task(fields["title"], fields.get("description") or "", fields["priority"],
+                       fields.get("due_date"), fields.get("status") or "To Do")
+
+def _task_json(task, index=None):
+    """Returns a task as the server sends it: its id, its index if known, and its fields"""
+    found = {"id": task.id} if index is None else {"id": task.id, "index": index}
+    found.update(task_to_dict(task))
+    return found
+
+def _not_found(message):
+    """Returns the response to a request for something that does not exist"""
+    return HTTPStatus.NOT_FOUND, {"error": message}, {}
+
+def _not_allowed(allowed):
+    """Returns the response to a method the resource does not have"""
+    return HTTPStatus.METHOD_NOT_ALLOWED, {"error": f"Use {allowed}"}, {"Allow": allowed}
+
+def _http_response(status, payload=None, headers=None):
+    """Encodes an HTTP/1.1 response with a JSON body"""
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Length: {len(body)}"]
+    if payload is not None:
+        lines.append("Content-Type: application/json")
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+def serve(host=SERVER_HOST, port=SERVER_PORT):
+    """Serves the loaded list over HTTP until interrupted or terminated; port 0 picks a free port"""
+    _materialize_tasks()
+
+    async def run():
+        server = await asyncio.start_server(TaskServer().handle, host, port)
+        bound_port = server.sockets[0].getsockname()[1]
+        print(f"Serving {len(tasks)} tasks on http://{host}:{bound_port}", flush=True)
+        stopped = asyncio.Event()
+        for name in ("SIGTERM", "SIGHUP"):
+            try:
+                asyncio.get_running_loop().add_signal_handler(getattr(signal, name), stopped.set)
+            except (AttributeError, NotImplementedError):
+                pass  # Windows has neither the signals nor the handlers
+        async with server:
+            await stopped.wait()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    print("Server stopped")  # Every change was saved before it was answered
+
+def use_list(name, directory=None):
+    """
+    Points the todo file, journal, binary snapshot and database at the list NAME of
+    a workspace directory (WORKSPACE_DIR by default), for the usual commands
+    """
+    global TODO_FILE, JOURNAL_FILE, BINARY_FILE, DATABASE_FILE
+    directory = directory or WORKSPACE_DIR
+    base = os.path.join(directory, _list_name(name))
+    os.makedirs(directory, exist_ok=True)
+    TODO_FILE, JOURNAL_FILE = base + ".txt", base + ".journal"
+    BINARY_FILE, DATABASE_FILE = base + ".bin", base + ".db"
+
+def _list_name(name):
+    """Checks that a list name is a plain file name"""
+    if not name or name.startswith(".") or "/" in name or os.sep in name:
+        raise ValueError(f"Invalid list name {name!r}")
+    return name
+
+def _read_shard(path):
+    """
+    Reads the list at path with the changes in its journal, returns its tasks, its
+    header stamp and the size of the journal, or None if it is no list
+    """
+    journal_path = _shard_journal(path)
+    try:
+        with _file_lock(path, shared=True):
+            loaded, data = _read_text_file(path)
+            journal = _read_journal(journal_path, zlib.crc32(data))
+            journal_size = os.path.getsize(journal_path) if os.path.exists(journal_path) else 0
+        header = _first_line(data)
+    except ValueError:  # Including bytes that are not UTF-8
+        return None
+    if not header.startswith("Task, Description, Priority"):  # The header of every version
+        return None
+    if journal is not None:
+        # The tasks have no rows yet, so replaying does not touch the rows of the todo file
+        by_id = {task.id: task for task in loaded}
+        for entry in journal[0]:
+            _apply_journal_entry(by_id, entry, track_rows=False)
+        loaded = list(by_id.values())
+    return loaded, _header_stamp(header), journal_size
+
+def _shard_journal(path):
+    """Returns the journal of the list at path, named like use_list() names it"""
+    return os.path.splitext(path)[0] + ".journal"
+
+def _read_shard_columns(path):
+    """
+    Runs _read_shard() in a worker process of Workspace.load(). The tasks are sent
+    back as a TaskTable, whose columns pickle much faster than Task objects.
+    """
+    shard = _read_shard(path)
+    return shard and (TaskTable(shard[0]), *shard[1:])
+
+class Shard:
+    """
+    Defines one list of a workspace, with its own task list, priority queue and
+    indexes. Changes mark it dirty, and only dirty shards are saved.
+    """
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.tasks = LinkedList()
+        self.priority_queue = PriorityQueue()
+        self.status_index = StatusIndex()
+        self.due_index = DueDateIndex(self.status_index)
+        self.indexes = (self.status_index, self.due_index)
+        self.journal = _shard_journal(path)
+        self.journal_size = 0
+        self.version = 0
+        self.next_id = 1
+        self.dirty = False
+        self._nodes = None
+
+    def store(self, snapshot, stamp, journal_size=0):
+        """Stores the tasks, the (version, next id) stamp of the file and its journal's size"""
+        loaded = _assign_ids(snapshot)
+        self.version, next_id = stamp
+        self.journal_size = journal_size
+        self.next_id = max(next_id, max((task.id for task in loaded), default=0) + 1)
+        self.tasks.extend(loaded)
+        self.priority_queue.extend(loaded)
+        heapify(self.priority_queue)
+        self.status_index.extend(loaded)
+        self.due_index.extend(loaded)
+
+    def task(self, task_id):
+        """Returns the Task with an id, None if there is none"""
+        node = self._id_map().get(task_id)
+        return node.task if node is not None else None
+
+    def _id_map(self):
+        """Returns the map from task id to node, building it on first use"""
+        if self._nodes is None:
+            self._nodes = {node.task.id: node for node in self.tasks.nodes()}
+        return self._nodes
+
+    def add(self, title, description, priority, due_date=None, status="To Do",
+            allow_past_dates=False):
+        """Creates a Task in this list and returns it"""
+        task = Task(title, description, priority, due_date, allow_past_dates)
+        task.status = sys.intern(status)
+        task.id, self.next_id = self.next_id, self.next_id + 1
+        _link_task(task, self.tasks, self.priority_queue, self._nodes, self.indexes)
+        self.dirty = True
+        return task
+
+    def edit(self, task_id, status=None, priority=None, due_date=_UNCHANGED,
+             allow_past_dates=False):
+        """Changes the Task with an id like edit_task(), returns it or None if there is none"""
+        due_date = _check_edit(priority, due_date, allow_past_dates)
+        task = self.task(task_id)
+        if task is None:
+            return None
+        _change_task(task, self.priority_queue, status, priority, due_date, self.indexes)
+        self.dirty = True
+        return task
+
+    def remove(self, task_id):
+        """Removes the Task with an id, returns it or None if there is none"""
+        node = self._id_map().pop(task_id, None)
+        if node is None:
+            return None
+        task = _unlink_task(self.tasks.remove_node(node), self.priority_queue, self.indexes)
+        self.dirty = True
+        return task
+
+    def saved_elsewhere(self):
+        """Checks if another process saved or journaled the list since it was loaded or saved"""
+        journal_size = os.path.getsize(self.journal) if os.path.exists(self.journal) else 0
+        if journal_size != self.journal_size:
+            return True
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as file:
+            return _header_stamp(file.readline())[0] != self.version
+
+    def save(self):
+        """
+        Writes the list with the next version, which holds the changes of its journal,
+        so the journal goes. Raises ValueError instead of overwriting the changes when
+        another process saved or journaled the list in the meantime.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with _file_lock(self.path):
+            if self.saved_elsewhere():
+                raise ValueError(f"List {self.name} was saved by another process, "
+                                 f"load the workspace again")
+            _write_file(self.path, _encode_text(self.tasks, self.version + 1, self.next_id))
+            if os.path.exists(self.journal):
+                os.remove(self.journal)
+        self.version += 1
+        self.journal_size = 0
+        self.dirty = False
+
+class Workspace:
+    """
+    Defines a directory of lists, one shard per NAME.txt file with a todo header
+
+    Shards are read by a pool of processes, one file each, and the views over every
+    list merge the already ordered results of the shards with k_way_merge().
+    """
+    def __init__(self, directory=None):
+        self.directory = directory or WORKSPACE_DIR
+        self.shards = {}
+
+    def names(self):
+        """Returns the names of the NAME.txt files of the directory, some may not be lists"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(entry.name[:-4] for entry in os.scandir(self.directory)
+                      if entry.name.endswith(".txt") and not entry.name.startswith("."))
+
+    def load(self, processes=None):
+        """
+        Loads every list of the directory. Files are parsed in parallel by up to
+        processes workers (default one per CPU); with one worker or one file they
+        are parsed here, since starting a pool would only add to the time.
+        """
+        names = self.names()
+        paths = [os.path.join(self.directory, name + ".txt") for name in names]
+        processes = min(processes or os.cpu_count() or 1, len(paths))
+        with _gc_paused():
+            if processes > 1:
+                with ProcessPoolExecutor(processes) as pool:
+                    results = list(pool.map(_read_shard_columns, paths))
+            else:
+                results = map(_read_shard, paths)
+            for name, path, result in zip(names, paths, results):
+                if result is None:
+                    print(f"Skipped {path}, it is not a todo list", file=sys.stderr)
+                    continue
+                self.shards[name] = Shard(name, path)
+                self.shards[name].store(*result)
+        return self
+
+    def shard(self, name):
+        """Returns the shard of a list, a new empty one if the list does not exist yet"""
+        shard = self.shards.get(name)
+        if shard is None:
+            path = os.path.join(self.directory, _list_name(name) + ".txt")
+            shard = self.shards[name] = Shard(name, path)
+        return shard
+
+    def move(self, task_id, source, target):
+        """Moves the Task with an id from the list source to the list target, returns it"""
+        if source not in self.shards:
+            raise ValueError(f"No list named {source!r}")
+        shard = self.shard(target)
+        task = self.shards[source].remove(task_id)
+        if task is None:
+            raise ValueError(f"List {source} has no task with id {task_id}")
+        return shard.add(task.title, task.description, task.priority, task.due_date,
+                         task.status, allow_past_dates=True)
+
+    def save(self):
+        """Saves the shards changed since they were loaded or saved, returns their names"""
+        dirty = [shard for shard in self.shards.values() if shard.dirty]
+        # Check them all first, so a conflict does not leave some of the changes saved
+        for shard in dirty:
+            if shard.saved_elsewhere():
+                raise ValueError(f"List {shard.name} was saved by another process, "
+                                 f"load the workspace again")
+        for shard in dirty:
+            shard.save()
+        return [shard.name for shard in dirty]
+
+    def top(self, k):
+        """Returns (list name, task) for the k most important tasks of every list"""
+        shards = list(self.shards.values())
+        merged = k_way_merge([iter_by_priority(shard.priority_queue, k) for shard in shards],
+                             _priority_key)
+        return [(shards[number].name, task) for number, task in islice(merged, k)]
+
+    def time_frame(self, time_frame, today=None):
+        """Returns (list name, task) for the tasks of every list due in a time frame"""
+        shards = list(self.shards.values())
+        merged = k_way_merge([chain.from_iterable(shard.due_index.time_frame(time_frame, today))
+                              for shard in shards], _due_key)
+        return [(shards[number].name, task) for number, task in merged]
+
+def _due_key(task):
+    """Orders tasks by due date"""
+    return task.due_date
+
+def k_way_merge(streams, key):
+    """
+    Merges iterables that are each sorted by key, yielding (stream number, item) in
+    order. A heap holds the next item of each stream, so n items cost O(n log k).
+    Items with equal keys come out in the order of their streams.
+    """
+    heap = []
+    for number, stream in enumerate(streams):
+        stream = iter(stream)
+        for item in stream:
+            heap_push(heap, (key(item), number, item, stream))
+            break
+    while heap:
+        _, number, item, stream = heap[0]
+        yield number, item
+        following = next(stream, _END)
+        if following is _END:
+            heap_pop(heap)
+        else:
+            # Replacing the top and sifting it down is one step instead of a pop and a push
+            heap[0] = (key(following), number, following, stream)
+            _heap_down(heap, 0)
+
+_END = object()  # Marks an exhausted stream in k_way_merge()
+
+@contextmanager
+def _open_stream(path, mode):
+    """Opens a file, or stdin/stdout for '-'"""
+    if path == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+    else:
+        # The csv module handles line endings itself
+        with open(path, mode, encoding="utf-8", newline="") as file:
+            yield file
+
+def _build_parser():
+    """Builds the parser of the non-interactive commands"""
+    parser = argparse.ArgumentParser(
+        prog="todo.py", description="Manage the todo list without the menu",
+        epilog="Chain commands with '+' to save all of their changes once at the end, "
+               "e.g. todo.py add Milk 'Buy milk' 2 + update 1 --status Done")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = commands.add_parser("add", help="add a task")
+    add_parser.add_argument("title")
+    add_parser.add_argument("description")
+    add_parser.add_argument("priority", type=int, help="1 is highest")
+    add_parser.add_argument("--due", help="due date as YYYY-MM-DD")
+    add_parser.add_argument("--status", default="To Do")
+
+    update_parser = commands.add_parser("update", help="update the task at an index")
+    update_parser.add_argument("index", type=int)
+    update_parser.add_argument("--id", action="store_true", help="INDEX is the id of the task")
+    update_parser.add_argument("--status")
+    update_parser.add_argument("--priority", type=int)
+    update_parser.add_argument("--due", help="due date as YYYY-MM-DD, or '' to remove it")
+
+    delete_parser = commands.add_parser("delete", help="delete the tasks at one or more indexes")
+    delete_parser.add_argument("indexes", type=int, nargs="+")
+    delete_parser.add_argument("--id", action="store_true", help="INDEXES are ids of tasks")
+
+    list_parser = commands.add_parser("list", help="print the tasks")
+    list_parser.add_argument("--view", choices=["index", "priority", "due"], default="index")
+    list_parser.add_argument("--status", help="only the tasks with this status")
+    list_parser.add_argument("--time-frame", choices=TIME_FRAMES + ["all"],
+                             help="only the tasks due in this time frame")
+    list_parser.add_argument("--limit", type=int, help="show at most this many tasks")
+    list_parser.add_argument("--offset", type=int, default=0,
+                             help="skip this many tasks first, e.g. --offset 100 --limit 50")
+    list_parser.add_argument("--pager", action="store_true",
+                             help="show the tasks through $PAGER (default less)")
+
+    next_parser = commands.add_parser("next", help="show the most urgent tasks")
+    next_parser.add_argument("-k", type=int, default=20, help="number of tasks (default 20)")
+    next_parser.add_argument("--urgency", action="store_true",
+                             help="rank by priority plus days until the due date")
+
+    search_parser = commands.add_parser("search", help="find tasks by words of their title "
+                                        "or description")
+    search_parser.add_argument("query", help="words to look for, each may be the start of a word")
+    search_parser.add_argument("-k", type=int, help="number of tasks (default all)")
+    search_parser.add_argument("--status", help="only the tasks with this status")
+    search_parser.add_argument("--priority", type=int, help="only the tasks with this priority")
+    search_parser.add_argument("--time-frame", choices=TIME_FRAMES,
+                               help="only the tasks due in this time frame")
+
+    query_parser = commands.add_parser(
+        "query", help="print the tasks meeting every condition, "
+                      "e.g. query --where priority '<=' 2 --where due_date in week")
+    query_parser.add_argument("--where", nargs=3, action="append", default=[],
+                              metavar=("FIELD", "OPERATOR", "VALUE"),
+                              help="condition on " + ", ".join(QUERY_FIELDS) + "; operators "
+                                   + " ".join(_COMPARE) + " in matches; "
+                                   "separate the values of 'in' with commas")
+    query_parser.add_argument("--order-by", choices=list(QUERY_ORDERS))
+    query_parser.add_argument("--descending", action="store_true")
+    query_parser.add_argument("-k", type=int, help="number of tasks (default all)")
+    query_parser.add_argument("--explain", action="store_true",
+                              help="print the plan instead of the tasks")
+
+    import_parser = commands.add_parser("import", help="add tasks from CSV or JSON Lines")
+    import_parser.add_argument("file", nargs="?", default="-", help="file, or '-' for stdin")
+    import_parser.add_argument("--merge", action="store_true",
+                               help="update the stored task with the same title instead of adding")
+
+    export_parser = commands.add_parser("export", help="write the tasks as CSV or JSON Lines")
+    export_parser.add_argument("file", nargs="?", default="-", help="file, or '-' for stdout")
+
+    convert_parser = commands.add_parser(
+        "convert", help="stream tasks from one file to another without loading the list")
+    convert_parser.add_argument("source", help="file, or '-' for stdin")
+    convert_parser.add_argument("target", help="file, or '-' for stdout")
+    convert_parser.add_argument("--from", dest="source_format", choices=FILE_FORMATS,
+                                help="format of the source (default from its extension)")
+
+    for stream_parser in (import_parser, export_parser, convert_parser):
+        stream_parser.add_argument("--format", choices=FILE_FORMATS,
+                                   help="format of the file (default from its extension)")
+        stream_parser.add_argument("--status", help="only the tasks with this status")
+        stream_parser.add_argument("--time-frame", choices=TIME_FRAMES,
+                                   help="only the tasks due in this time frame")
+
+    batch_parser = commands.add_parser(
+        "batch", help="apply add/update/delete operations given as JSON Lines")
+    batch_parser.add_argument("file", nargs="?", default="-", help="file, or '-' for stdin")
+
+    serve_parser = commands.add_parser(
+        "serve", help="serve the list over HTTP/JSON to several tools at once")
+    serve_parser.add_argument("--host", default=SERVER_HOST)
+    serve_parser.add_argument("--port", type=int, default=SERVER_PORT,
+                              help=f"port to listen on (default {SERVER_PORT}, 0 for any)")
+
+    workspace_parser = commands.add_parser(
+        "workspace", help="show the lists of the workspace or tasks from all of them, "
+                          "or move a task to another list")
+    workspace_parser.add_argument("view", choices=["lists", "top", "due", "move"], nargs="?",
+                                  default="lists")
+    workspace_parser.add_argument("-k", type=int, help="number of tasks (default 20 for top, "
+                                                       "all for due)")
+    workspace_parser.add_argument("--time-frame", choices=TIME_FRAMES, default="overdue",
+                                  help="time frame of the due view (default overdue)")
+    workspace_parser.add_argument("--processes", type=int,
+                                  help="processes reading the lists (default one per CPU)")
+    workspace_parser.add_argument("--id", type=int, help="id of the task to move")
+    workspace_parser.add_argument("--from", dest="source", help="list to move the task from")
+    workspace_parser.add_argument("--to", dest="target", help="list to move the task to")
+    return parser
+
+def _run_parsed_command(args):
+    """Runs one parsed command, returns True when it changed the list"""
+    if args.command == "add":
+        create_task(args.title, args.description, args.priority, args.due, args.status)
+    elif args.command == "update":
+        task = _task_with_id(args.index) if args.id else _task_at(args.index)
+        edit_task(task, status=args.status, priority=args.priority,
+                  due_date=_UNCHANGED if args.due is None else args.due)
+    elif args.command == "delete" and args.id:
+        for task_id in set(args.indexes):
+            remove_task_by_id(_task_with_id(task_id).id)
+    elif args.command == "delete":
+        # Delete from the back so the other indexes still point at the same tasks
+        for index in sorted(set(args.indexes), reverse=True):
+            _task_at(index)
+            remove_task(index - 1)
+    elif args.command == "import":
+        with _open_stream(args.file, "r") as file:
+            task_iter = read_tasks(file, args.format or guess_format(args.file))
+            merge_tasks(filter_tasks(task_iter, args.status, args.time_frame), args.merge)
+    elif args.command == "batch":
+        with _open_stream(args.file, "r") as file:
+            for line_number, operation in _json_records(file):
+                try:
+                    apply_operation(operation)
+                except ValueError as e:
+                    raise ValueError(f"Line {line_number}: {e}") from e
+    elif args.command == "serve":
+        serve(args.host, args.port)  # Saves each change itself
+        return False
+    else:
+        _run_report(args)
+        return False
+    return True
+
+def _run_report(args):
+    """Runs one of the commands that only read the list"""
+    if args.command == "export":
+        _materialize_tasks()
+        with _open_stream(args.file, "w") as file:
+            write_tasks(file, filter_tasks(tasks, args.status, args.time_frame),
+                        args.format or guess_format(args.file))
+    elif args.command == "convert":
+        with _open_stream(args.source, "r") as source, _open_stream(args.target, "w") as target:
+            task_iter = read_tasks(source, args.source_format or guess_format(args.source))
+            write_tasks(target, filter_tasks(task_iter, args.status, args.time_frame),
+                        args.format or guess_format(args.target))
+    elif args.command == "search":
+        print_task_list(search_tasks(args.query, args.status, args.priority, args.time_frame,
+                                     args.k), f"Tasks matching '{args.query}'")
+    elif args.command == "query":
+        found = query()
+        for field, operator, value in args.where:
+            found.where(field, operator, _query_value(field, operator, value))
+        if args.order_by:
+            found.order_by(args.order_by, args.descending)
+        found.limit(args.k)
+        if args.explain:
+            print(found.explain())
+        else:
+            print_task_list(found.all(), "Tasks found")
+    elif args.command == "workspace":
+        _run_workspace(args)
+    elif args.command == "next":
+        ranking = "urgency" if args.urgency else "priority"
+        print_task_list(top_tasks(args.k, args.urgency), f"Top {args.k} tasks by {ranking}")
+    else:
+        with rendering(args.limit, args.offset, pager=args.pager):
+            _print_list(args)
+
+def _print_list(args):
+    """Prints the view the list command asked for"""
+    if args.status is not None:
+        print_by_status(args.status)
+    elif args.time_frame is not None:
+        print_time_frame(args.time_frame)
+    elif args.view == "priority":
+        print_by_priority()
+    elif args.view == "due":
+        print_by_due_date()
+    else:
+        print_by_index()
+
+def _run_workspace(args):
+    """Prints the view of every list the workspace command asked for, or moves a task"""
+    if args.view == "move" and None in (args.id, args.source, args.target):
+        raise ValueError("workspace move needs --id, --from and --to")
+    workspace = Workspace().load(args.processes)
+    if args.view == "lists":
+        for name, shard in workspace.shards.items():
+            print(f"{name}: {len(shard.tasks)} tasks")
+    elif args.view == "top":
+        k = 20 if args.k is None else args.k
+        print_task_list(workspace.top(k), f"Top {k} tasks of every list", named=True)
+    elif args.view == "due":
+        rows = workspace.time_frame(args.time_frame)[:args.k]
+        title = "Overdue tasks" if args.time_frame == "overdue" else f"Tasks due {args.time_frame}"
+        print_task_list(rows, f"{title} of every list", named=True)
+    else:
+        task = workspace.move(args.id, args.source, args.target)
+        workspace.save()  # Only the two lists of the move are written
+        print(f"Moved task: {task.title} to {args.target} (id {task.id})")
+
+def run_command(argv):
+    """
+    Runs non-interactive commands, like: todo.py add Milk 'Buy milk' 2 --due 2030-01-31
+    Commands chained with '+' are applied in memory and saved once at the end, and
+    nothing is saved if one of them fails. Returns the exit code.
+    """
+    parser = _build_parser()
+    groups = [[]]
+    for arg in argv:
+        if arg == "+":
+            groups.append([])
+        else:
+            groups[-1].append(arg)
+    commands = [parser.parse_args(group) for group in groups]
+
+    if any(args.command not in ("convert", "workspace") for args in commands):
+        clear_tasks()
+        load_tasks()
+    changed = False
+    try:
+        for args in commands:
+            changed = _run_parsed_command(args) or changed
+    except ValueError as e:
+        print(f"Error: {e}. Nothing was saved.", file=sys.stderr)
+        return 1
+
+    if changed:
+        save_tasks()
+    return 0
+
+def main(argv=None):
+    """
+    Main method. Options before the command: --stats PATH records the hot paths
+    like TODO_STATS, --profile PATH runs the session under cProfile and writes
+    its pstats to PATH, --workspace DIR sets the workspace like TODO_WORKSPACE,
+    and --list NAME works on the list NAME of the workspace.
+    """
+    global WORKSPACE_DIR
+    argv = list(sys.argv[1:] if argv is None else argv)
+    stats_path, profile_path, list_name = STATS_FILE, None, None
+    while len(argv) >= 2 and argv[0] in ("--stats", "--profile", "--workspace", "--list"):
+        if argv[0] == "--stats":
+            stats_path = argv[1]
+        elif argv[0] == "--profile":
+            profile_path = argv[1]
+        elif argv[0] == "--workspace":
+            WORKSPACE_DIR = argv[1]
+        else:
+            list_name = argv[1]
+        del argv[:2]
+    if list_name is not None:
+        try:
+            use_list(list_name)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    if stats_path:
+        enable_stats(stats_path)
+    if profile_path is None:
+        return _run_session(argv)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(_run_session, argv)
+    finally:
+        profiler.dump_stats(profile_path)
+
+def _run_session(argv):
+    """Runs the commands in argv, or the menu when there are none"""
+    if argv:
+        return run_command(argv)
+
+    clear_tasks()
     load_tasks()
+    enable_history()
+    if WRITE_BEHIND:
+        # Termination signals exit through the finally below, which saves pending changes
+        for name in ("SIGTERM", "SIGHUP"):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), _exit_on_signal)
+    # In a terminal, long views stop after every page instead of scrolling past
+    interactive = sys.stdin.isatty() and sys.stdout.isatty()
+    try:
+        with rendering(page_size=MENU_PAGE_SIZE if interactive else None):
+            return _menu()
+    finally:
+        flush()
+
+def _exit_on_signal(signum, _frame):
+    """Exits on a termination signal the same way as on an error"""
+    raise SystemExit(128 + signum)
+
+CHANGE_WORDS = {"add": "Added", "delete": "Deleted", "update": "Updated"}
+HISTORY_REPORT_LIMIT = 10  # Changes listed after an undo, redo or restore
+
+def history_menu(choice):
+    """Undoes, redoes, names a snapshot or restores one, then saves what changed"""
+    if choice == "snapshot":
+        name = input("Enter a name for the snapshot: ")
+        history.snapshot(name)
+        print(f"Saved snapshot '{name}'")
+        return
+    if choice == "restore":
+        names = ", ".join(history.snapshots) or "none yet"
+        try:
+            changes = history.restore(input(f"Enter the snapshot to restore ({names}): "))
+        except ValueError as e:
+            print(e)
+            return
+    else:
+        changes = history.undo() if choice == "undo" else history.redo()
+        if not changes:
+            print(f"Nothing to {choice}")
+            return
+    _record_changes(changes)
+    for operation, task in changes[:HISTORY_REPORT_LIMIT]:
+        print(f"{CHANGE_WORDS[operation]} task: {task.title}")
+    if len(changes) > HISTORY_REPORT_LIMIT:
+        print(f"... and {len(changes) - HISTORY_REPORT_LIMIT} more changes")
+
+def search_menu():
+    """Asks for words to look for and optional filters, then prints the matching tasks"""
+    words = input("Enter words to search for: ")
+    status = input("Only tasks with status (press Enter for any): ") or None
+    priority_input = input("Only tasks with priority (press Enter for any): ")
+    try:
+        priority = int(priority_input) if priority_input else None
+    except ValueError:
+        print("Please enter a valid number")
+        return
+    time_frame = input(f"Only tasks due ({', '.join(TIME_FRAMES)}, press Enter for any): ")
+    if time_frame and time_frame not in TIME_FRAMES:
+        print("Invalid time frame. Please try again.")
+        return
+    print_task_list(search_tasks(words, status, priority, time_frame or None),
+                    f"Tasks matching '{words}'")
 
+def _menu():
+    """Runs the menu until the user exits"""
     while True:
         print("\nTodo List Menu:")
         print("1. Add Task")
         print("2. Update Task")
         print("3. Delete Task")
         print("4. List Tasks")
-        print("5. Exit")
+        print("6. Search Tasks")
+        print("7. Undo")
+        print("8. Redo")
+        print("9. Save Snapshot")
+        print("10. Restore Snapshot")
+        print("5. Exit")  # Listed last, but keeps the number it always had
 
-        choice = input("Enter your choice (1-5): ")
+        choice = input("Enter your choice (1-10): ")
 
         if choice == "1":
             add_task()
@@ -517,11 +4469,16 @@ def main():
         elif choice == "4":
             list_tasks()
         elif choice == "5":
+            flush()
             save_tasks()
             print("ToDo List has been saved. Exiting...")
-            break
+            return 0
+        elif choice == "6":
+            search_menu()
+        elif choice in ("7", "8", "9", "10"):
+            history_menu({"7": "undo", "8": "redo", "9": "snapshot", "10": "restore"}[choice])
         else:
             print("Invalid choice. Please try again.")
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())